@@ -8,11 +8,13 @@ Runner module.
 
 import sys
 import os.path
-from PySide import QtCore, QtGui
+from PySide import QtCore
 Qt = QtCore.Qt
 
 import pkg_resources
 
+__version__ = '0.1'
+
 media_root = os.path.join(pkg_resources.resource_filename('pokedex', '.'),
         '..', '..', 'pokedex-media')
 
@@ -22,9 +24,24 @@ def resource_filename(package, *path):
     else:
         return pkg_resources.resource_filename(package, *path)
 
-from qdex.mainwindow import MainWindow
+cache_root = os.environ.get('QDEX_CACHE_DIR') or os.path.join(
+        os.path.expanduser('~'), '.cache', 'qdex')
+
+def cache_filename(*path):
+    """Return the name of a file in qdex's local cache directory
+
+    The directory is created if it doesn't exist yet.
+    """
+    filename = os.path.join(cache_root, *path)
+    directory = os.path.dirname(filename)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return filename
 
 def main():
+    # Imported here, so that headless tools don't load the whole GUI
+    from PySide import QtGui
+    from qdex.mainwindow import MainWindow
     app = QtGui.QApplication(sys.argv)
     mainWindow = MainWindow()
     mainWindow.show()
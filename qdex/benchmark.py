@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Benchmarks for query models, sort clauses and column rendering
+
+Runs without any widgets, against the pokedex database given on the command
+line (or pokedex's default one). Results are stored as JSON, and can be
+compared against a baseline file to catch performance regressions.
+"""
+
+import sys
+import json
+import argparse
+from timeit import default_timer
+
+from PySide import QtCore
+Qt = QtCore.Qt
+
+from sqlalchemy import event
+from pokedex.db import connect
+
+from qdex.globalstate import Global
+from qdex.metamodel import modelRepresentations
+from qdex.querymodel import TableModel, PokemonModel
+from qdex.column import ModelColumn
+from qdex.columngroup import availableColumns
+
+class QueryCounter(object):
+    """Counts SQL statements executed on an engine"""
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.executed)
+
+    def executed(self, *args):
+        """Listener for SQLAlchemy's before_cursor_execute event"""
+        self.count += 1
+
+class BenchmarkRunner(object):
+    """Runs benchmarks and collects their results
+
+    Each result is a dict with the best and median time in seconds,
+    the number of runs, and the number of SQL queries in the first run.
+    """
+    def __init__(self, g, repeat=3, verbose=False):
+        self.g = g
+        self.repeat = repeat
+        self.verbose = verbose
+        self.queryCounter = QueryCounter(g.session.bind)
+        self.results = {}
+
+    def measure(self, name, function, setup=None, **info):
+        """Run function `repeat` times, with setup() before each run
+
+        Extra keyword arguments are stored in the result.
+        """
+        times = []
+        queries = None
+        for i in range(self.repeat):
+            if setup:
+                setup()
+            queriesBefore = self.queryCounter.count
+            start = default_timer()
+            function()
+            times.append(default_timer() - start)
+            if queries is None:
+                queries = self.queryCounter.count - queriesBefore
+        times.sort()
+        result = dict(info, best=times[0], median=times[len(times) // 2],
+                runs=len(times), queries=queries)
+        self.results[name] = result
+        if self.verbose:
+            sys.stderr.write('%-70s %8.4fs %6s queries\n' % (
+                    name, result['median'], queries))
+        return result
+
+    def loadModels(self):
+        """Return (name, model) pairs for all the standard lists"""
+        models = []
+        for name, representation in modelRepresentations():
+            model = TableModel.load(representation, g=self.g)
+            models.append((unicode(self.g.translator(name)), model))
+        return models
+
+    def run(self):
+        """Run all the benchmarks"""
+        for listName, model in self.loadModels():
+            self.benchSortClauses(listName, model)
+            self.benchPageFetch(listName, model)
+            self.benchRendering(listName, model)
+            self.benchScrollThrough(listName, model)
+        self.benchCollapsing()
+        return self.results
+
+    def dropPages(self, model):
+        """Forget the model's cached pages and entities
+
+        The objects stay in the session, but are queried again.
+        """
+        for pageno in range(len(model.pages)):
+            model.dropPage(pageno)
+
+    def benchSortClauses(self, listName, model):
+        """Time _setQuery with each available column's sort clause"""
+        for column in availableColumns(model):
+            try:
+                clause = column.getSortClause()
+            except NotImplementedError:
+                continue
+            name = 'sort/%s/%s' % (listName, self.g.translator(column.name))
+            self.measure(name,
+                    lambda: model.setSortClauses([clause]),
+                    clause=type(clause).__name__)
+        model.setSortClauses([])
+
+    def benchPageFetch(self, listName, model):
+        """Time fetching the first page through __getitem__"""
+        self.measure('page/%s' % listName, lambda: model[0],
+                setup=lambda: self.dropPages(model))
+
+    def benchRendering(self, listName, model):
+        """Time display data of a page for each available column"""
+        items = [model[i] for i in range(min(model.rowCount(),
+                model._pagesize))]
+        for column in availableColumns(model):
+            def render():
+                for item in items:
+                    column.data(item, Qt.DisplayRole)
+            name = 'render/%s/%s' % (listName, self.g.translator(column.name))
+            self.measure(name, render, column=type(column).__name__)
+
+    def benchScrollThrough(self, listName, model):
+        """Time reading all display data of a model, as a view would"""
+        def scroll():
+            for row in range(model.rowCount()):
+                for column in range(model.columnCount()):
+                    model.data(model.index(row, column), Qt.DisplayRole)
+        self.measure('scroll/%s' % listName, scroll,
+                setup=lambda: self.dropPages(model))
+
+    def benchCollapsing(self):
+        """Time PokemonModel sorting and reading at each collapsing level"""
+        model = PokemonModel(self.g, [
+                {'class': 'PokemonNameColumn', 'name': 'Pokemon'}])
+        clausesForLevel = {
+                2: [],
+                1: [ModelColumn.load({
+                        'class': 'PokemonColumn',
+                        'name': 'Base EXP',
+                        'foreignColumn': {'attr': 'base_experience'},
+                    }, model=model).getSortClause()],
+                0: [ModelColumn.load({
+                        'name': 'Form identifier',
+                        'attr': 'form_identifier',
+                    }, model=model).getSortClause()],
+            }
+        for level, clauses in sorted(clausesForLevel.items()):
+            def sortAndRead():
+                model.setSortClauses(clauses)
+                assert model.collapsing == level
+                for row in range(min(model.rowCount(), model._pagesize)):
+                    model.data(model.index(row, 0), Qt.DisplayRole)
+            self.measure('collapsing/%s' % level, sortAndRead)
+
+def compareResults(results, baseline, tolerance):
+    """Compare results to a baseline
+
+    Return a list of (name, baseline median, new median, baseline queries,
+    new queries) for benchmarks that got more than `tolerance` (a fraction)
+    slower, or that run more queries.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        try:
+            base = baseline[name]
+        except KeyError:
+            continue
+        if (result['median'] > base['median'] * (1 + tolerance) or
+                result['queries'] > base['queries']):
+            regressions.append((name, base['median'], result['median'],
+                    base['queries'], result['queries']))
+    return regressions
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description='Run qdex benchmarks')
+    parser.add_argument('-e', '--engine', metavar='URI',
+            help='SQLAlchemy URI of the pokedex database '
+                '(default: the pokedex library default)')
+    parser.add_argument('-o', '--output', metavar='FILE',
+            help='Write the results to this JSON file')
+    parser.add_argument('-b', '--baseline', metavar='FILE',
+            help='Compare the results to this JSON file')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+            help='Allowed slowdown against the baseline, as a fraction '
+                '(default: 0.25)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+            help='Number of runs of each benchmark (default: 3)')
+    parser.add_argument('-l', '--lang', action='append', dest='langs',
+            help='Language to use; may be given more times (default: en)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+            help='Print results as they come')
+    args = parser.parse_args(argv)
+
+    # The persistent result cache would make repeated runs incomparable
+    g = Global(session=connect(args.engine), langs=args.langs,
+            resultCache=False)
+    runner = BenchmarkRunner(g, repeat=args.repeat, verbose=args.verbose)
+    results = runner.run()
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=4, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        regressions = compareResults(results, baseline, args.tolerance)
+        for name, oldTime, newTime, oldQueries, newQueries in regressions:
+            print '%s: %.4fs -> %.4fs, %s -> %s queries' % (
+                    name, oldTime, newTime, oldQueries, newQueries)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Headless command-line query runner
+
+Loads a query model from its YAML representation, sorts it, and writes the
+resulting table out, without creating any widgets.
+"""
+
+import sys
+import argparse
+
+from qdex import yaml
+from qdex.globalstate import Global
+from qdex.metamodel import modelRepresentations
+from qdex.querymodel import TableModel
+from qdex.export import exporters
+from qdex.queryplan import inspectModel
+
+def loadRepresentations(filename=None):
+    """Return a list of (name, model representation) pairs
+
+    If `filename` is given, it's a YAML file with either a single model
+    (as in the `model` entries of metamodel.yaml), or a whole metamodel tree.
+    Otherwise, the standard lists from metamodel.yaml are used.
+    """
+    if filename is None:
+        return list(modelRepresentations())
+    with open(filename) as fileobj:
+        representation = yaml.load(fileobj)
+    if 'children' in representation or 'model' in representation:
+        return list(modelRepresentations(representation))
+    else:
+        return [(representation.get('table', filename), representation)]
+
+def findRepresentation(g, representations, name):
+    """Find a model representation by (case-insensitive) list name
+
+    If `name` is None, the first representation is returned.
+    """
+    if name is None:
+        return representations[0][1]
+    name = name.lower()
+    for listName, representation in representations:
+        if g.translator(listName).lower() == name:
+            return representation
+        if representation.get('table', '').lower() == name:
+            return representation
+    raise LookupError('No list named %s' % name)
+
+def findColumn(g, model, key):
+    """Find a model's column by index, header text or attribute name"""
+    try:
+        return model.columns[int(key)]
+    except ValueError:
+        pass
+    key = key.lower()
+    for column in model.columns:
+        if g.translator(column.name).lower() == key:
+            return column
+    for column in model.columns:
+        if getattr(column, 'attr', '').lower() == key:
+            return column
+    raise LookupError('No column named %s' % key)
+
+def sortClausesFromArgs(g, model, sortArgs):
+    """Make sort clauses from --sort arguments
+
+    Clauses are given from lowest to highest priority, as they would be
+    clicked in the GUI. A '-' prefix means descending order.
+    """
+    clauses = []
+    for arg in sortArgs:
+        descending = arg.startswith('-')
+        column = findColumn(g, model, arg.lstrip('-'))
+        clauses.append(column.getSortClause(descending=descending))
+    return clauses
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(
+            description='Run a qdex query and print the resulting table')
+    parser.add_argument('list', nargs='?',
+            help='Name of the list to show (default: the first one)')
+    parser.add_argument('-m', '--model-file', metavar='FILE',
+            help='YAML file with the model definition(s) '
+                '(default: the standard lists)')
+    parser.add_argument('-s', '--sort', action='append', default=[],
+            metavar='COLUMN',
+            help='Sort by the given column (index, name or attribute); '
+                'prefix with "-" for descending order (--sort=-NAME). '
+                'The last one given has the highest priority.')
+    parser.add_argument('-f', '--format', default='tsv',
+            choices=sorted(exporters), help='Output format (default: tsv)')
+    parser.add_argument('-l', '--lang', action='append', dest='langs',
+            help='Language to use; may be given more times (default: en)')
+    parser.add_argument('--lists', action='store_true',
+            help='Print the names of available lists and exit')
+    parser.add_argument('--explain', action='store_true',
+            help="Print the sort query's joins, SQL and query plan, "
+                'with timings, instead of the table')
+    args = parser.parse_args(argv)
+
+    g = Global(langs=args.langs)
+    representations = loadRepresentations(args.model_file)
+    if args.lists:
+        for name, representation in representations:
+            print g.translator(name).encode('utf-8')
+        return
+
+    try:
+        representation = findRepresentation(g, representations, args.list)
+        model = TableModel.load(representation, g=g)
+        if args.sort:
+            model.setSortClauses(sortClausesFromArgs(g, model, args.sort))
+    except LookupError as e:
+        parser.error(str(e))
+    if args.explain:
+        print inspectModel(model).format().encode('utf-8')
+        return
+    exporters[args.format](sys.stdout).export(model)
+
+if __name__ == '__main__':
+    main()
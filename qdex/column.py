@@ -8,20 +8,31 @@ A query models for pokémon
 
 import copy
 
-from PySide import QtGui, QtCore
+from PySide import QtCore
 Qt = QtCore.Qt
 
 from sqlalchemy.sql.expression import and_
+from sqlalchemy.ext.associationproxy import AssociationProxy
+from sqlalchemy.orm.properties import RelationshipProperty
 
 from pokedex.db import tables
 from pokedex.util import media
 
-from qdex.delegate import PokemonNameDelegate
 from qdex.loadableclass import LoadableMetaclass
 from qdex import media_root
 from qdex.sortclause import (SimpleSortClause, GameStringSortClause,
         LocalStringSortClause, ForeignKeySortClause, AssociationListSortClause,
-        PokemonNameSortClause)
+        PokemonNameSortClause, ArraySortClause, SubclassSortClause)
+from qdex.precomputed import (numpy, idArray, valueCase, nanRanks,
+        FormPokemonIndex)
+from qdex.statmatrix import StatMatrix
+from qdex.typechart import TypeChart
+from qdex.learnset import LearnsetIndex, AbilityIndex
+from qdex.evolution import EvolutionGraph, methodText
+from qdex.experience import ExperienceTable
+from qdex.encounters import EncounterSummary
+from qdex.nametable import NameTable
+from qdex.movemeta import MoveMetaTable
 
 from qdex.pokedexhelpers import getTranslationClass
 
@@ -29,6 +40,10 @@ class ModelColumn(object):
     """A column in a query model
     """
     __metaclass__ = LoadableMetaclass
+    # False if the column needs a library that's not installed
+    available = True
+    # The proxy column this is a foreign column of, if any
+    parentColumn = None
 
     def __init__(self, name, model, identifier=None, mappedClass=None, baseName=None):
         self.name = name or ''
@@ -53,7 +68,7 @@ class ModelColumn(object):
 
     def delegate(self, view):
         """Return a delegate for this column, using the given view"""
-        return self.model.defaultDelegateClass(view)
+        return self.model.defaultDelegate(view)
 
     def collapsedData(self, forms, role):
         """Return a summary of data from all `forms`. Used for pokémon columns.
@@ -84,6 +99,27 @@ class ModelColumn(object):
         """
         raise NotImplementedError
 
+    def loadPaths(self):
+        """Return relationship paths that need to be loaded for this column
+
+        These are dotted relationship names, relative to the mapped class,
+        suitable for eagerload_all.
+        """
+        return []
+
+    def loadedItems(self):
+        """Return the loaded items this column may be asked about
+
+        For the foreign column of a proxy, these are the objects the proxy
+        resolves the model's loaded items to.
+        """
+        if self.parentColumn is not None:
+            return self.parentColumn.resolvedItems()
+        elif self.model.mappedClass is self.mappedClass:
+            return self.model.loadedItems()
+        else:
+            return []
+
     def getSubcolumns(self, parent):
         return ()
 
@@ -115,8 +151,94 @@ class SimpleModelColumn(ModelColumn):
     def orderColumns(self, builder):
         return [getattr(builder.mappedClass, self.attr)]
 
+    def loadPaths(self):
+        attribute = getattr(self.mappedClass, self.attr)
+        if isinstance(attribute, AssociationProxy):
+            # e.g. translated strings, which proxy a relationship
+            return [attribute.target_collection]
+        elif isinstance(getattr(attribute, 'property', None),
+                RelationshipProperty):
+            return [self.attr]
+        else:
+            return []
+
 ModelColumn.defaultClassForLoad = SimpleModelColumn
 
+class MeasurementColumn(SimpleModelColumn):
+    """A column for a measurement, converted to some units
+
+    The raw value is multiplied by the first of `factors`. If there are
+    more factors, the whole part is split off, and the remainder is
+    multiplied by the next factor (e.g. feet, then inches). The parts are
+    formatted with `template`; `units` can be given instead, as a list of
+    templates for the individual parts.
+
+    Sorting uses the raw value. Formatted strings are cached per unit system
+    (template and factors), and are computed for all loaded items at once.
+    """
+    # (template, factors) -> {raw value: formatted string}
+    formatCaches = {}
+
+    def __init__(self, template=None, factors=(1, ), units=None, **kwargs):
+        SimpleModelColumn.__init__(self, **kwargs)
+        if template is None:
+            template = u''.join(units)
+        self.template = template
+        self.factors = tuple(factors)
+        self.units = units
+
+    @property
+    def formatCache(self):
+        key = self.template, self.factors
+        try:
+            return self.formatCaches[key]
+        except KeyError:
+            return self.formatCaches.setdefault(key, {})
+
+    def format(self, value):
+        """Convert and format a raw value"""
+        value = value * self.factors[0]
+        parts = []
+        for factor in self.factors[1:]:
+            whole = int(value)
+            parts.append(whole)
+            value = (value - whole) * factor
+        parts.append(value)
+        return self.template % tuple(parts)
+
+    def formatBatch(self, values):
+        """Format raw values that aren't in the cache yet"""
+        cache = self.formatCache
+        for value in set(values):
+            if value is not None and value not in cache:
+                cache[value] = self.format(value)
+
+    def data(self, item, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and item is not None:
+            value = getattr(item, self.attr)
+            if value is None:
+                return None
+            cache = self.formatCache
+            try:
+                return cache[value]
+            except KeyError:
+                # Convert the whole page (and any other loaded items)
+                values = [value]
+                values.extend(getattr(loaded, self.attr)
+                        for loaded in self.loadedItems())
+                self.formatBatch(values)
+                return cache[value]
+
+    def save(self):
+        representation = super(MeasurementColumn, self).save()
+        if self.units is None:
+            representation['template'] = self.template
+        else:
+            representation['units'] = self.units
+        if self.factors != (1, ):
+            representation['factors'] = list(self.factors)
+        return representation
+
 class GameStringColumn(SimpleModelColumn):
     """A column to display data translated to the game language
     """
@@ -174,6 +296,9 @@ class LocalStringColumn(ModelColumn):
     def orderColumns(self, builder):
         return [getattr(builder.mappedClass, self.mapAttr)]
 
+    def loadPaths(self):
+        return [getattr(self.mappedClass, self.mapAttr).target_collection]
+
 class ForeignKeyColumn(SimpleModelColumn):
     """A proxy column that gives information about a foreign key column.
 
@@ -199,10 +324,16 @@ class ForeignKeyColumn(SimpleModelColumn):
                 raise ValueError("Column %s not found" % idAttr)
         self.foreignColumn = ModelColumn.load(foreignColumn,
                 mappedClass=foreignMappedClass, model=self.model)
+        self.foreignColumn.parentColumn = self
 
     def data(self, item, role=Qt.DisplayRole):
         return self.foreignColumn.data(getattr(item, self.attr), role)
 
+    def resolvedItems(self):
+        """Return the referenced objects of the loaded items"""
+        items = (getattr(item, self.attr) for item in self.loadedItems())
+        return [item for item in items if item is not None]
+
     def collapsedData(self, items, role=Qt.DisplayRole):
         subitems = [getattr(item, self.attr) for item in items]
         return self.foreignColumn.collapsedData(subitems, role)
@@ -225,6 +356,10 @@ class ForeignKeyColumn(SimpleModelColumn):
             )
         return self.foreignColumn.orderColumns(subbuilder)
 
+    def loadPaths(self):
+        return [self.attr] + ['%s.%s' % (self.attr, path)
+                for path in self.foreignColumn.loadPaths()]
+
     def getSubcolumns(self, parent):
         yield self, self.foreignColumn
         for column in self.foreignColumn.getSubcolumns(self):
@@ -241,6 +376,7 @@ class ForeignKeyColumn(SimpleModelColumn):
         # We need to replace our foreignColumn
         new = copy.copy(self)
         new.foreignColumn = replacement
+        replacement.parentColumn = new
         _ = self.model.g.translator
         if self.baseName:
             new.name = _(self.baseName) + '.' + _(replacement.name)
@@ -248,6 +384,25 @@ class ForeignKeyColumn(SimpleModelColumn):
             new.name = replacement.name
         return new
 
+class SubclassColumn(ForeignKeyColumn):
+    """A proxy column for a one-to-one "subclass" relationship
+
+    E.g. Item.berry: the subclass table (berries) refers to the main one.
+    Items without the subclass row get no data. For sorting, the subclass
+    is outer-joined by the QueryBuilder; for display, it's loaded eagerly,
+    in the same query as the main rows.
+    """
+    def __init__(self, attr, **kwargs):
+        mappedClass = kwargs.get('mappedClass') or kwargs['model'].mappedClass
+        relationship = getattr(mappedClass, attr).property
+        kwargs.setdefault('foreignMappedClass', relationship.mapper.class_)
+        ForeignKeyColumn.__init__(self, attr=attr, **kwargs)
+        ((localColumn, remoteColumn), ) = relationship.local_remote_pairs
+        self.remoteColumnName = remoteColumn.name
+
+    def getSortClause(self, descending=True, **kwargs):
+        return SubclassSortClause(self, descending, **kwargs)
+
 class PokemonColumn(ForeignKeyColumn):
     """A proxy column that gives information about a pokémon from its form.
     """
@@ -315,6 +470,11 @@ class AssociationListColumn(ForeignKeyColumn):
         assert all((self.primaryColumnName, self.secondaryColumnName))
         self.foreignColumn = ModelColumn.load(foreignColumn,
                 mappedClass=foreignMappedClass, model=self.model)
+        self.foreignColumn.parentColumn = self
+
+    def resolvedItems(self):
+        return [subitem for item in self.loadedItems()
+                for subitem in getattr(item, self.attr)]
 
     def data(self, item, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
@@ -388,6 +548,7 @@ class PokemonNameColumn(SimpleModelColumn):
             else:
                 return form.pokemon.name
         elif role == Qt.DecorationRole:
+            from PySide import QtGui
             if self.model._hack_small_icons:
                 # XXX: A hack to make the delegate think the icon is smaller
                 # than it really is
@@ -415,6 +576,7 @@ class PokemonNameColumn(SimpleModelColumn):
 
     def delegate(self, view):
         """Return a delegate for this column, using the given view"""
+        from qdex.delegate import PokemonNameDelegate
         return PokemonNameDelegate(view)
 
     def getSortClause(self, descending=False):
@@ -434,3 +596,858 @@ class PokemonNameColumn(SimpleModelColumn):
                 formname_builder.mappedClass.form_name,
                 builder.mappedClass.form_identifier,
             ]
+
+class ArrayColumn(ModelColumn):
+    """Base for columns backed by precomputed arrays (see qdex.precomputed)
+
+    Subclasses implement sortKeys(mappedClass, ids). When sorting in SQL
+    is needed, the sort keys of all rows are inlined in CASE expressions.
+    """
+    classNameForLoad = None
+    available = numpy is not None
+    # Collapsing level of the sort clause
+    sortCollapsing = 0
+
+    def precomputed(self, dataClass, *args):
+        """Return the shared instance of a precomputed data class"""
+        return self.model.g.precomputed(dataClass, *args)
+
+    def names(self, mappedClass, ids):
+        """Return names of objects of a mapped class, by ID
+
+        The names come from the precomputed NameTable, with the same
+        language fallback as Global.name.
+        """
+        languages = [language.identifier
+                for language in self.model.g.languages]
+        return self.precomputed(NameTable, mappedClass).displayNames(
+                languages, ids)
+
+    @property
+    def arrayKey(self):
+        """Columns with the same arrayKey sort the same way"""
+        representation = self.save()
+        return sorted((key, repr(value))
+                for key, value in representation.items()
+                if key not in ('name', 'baseName'))
+
+    def getSortClause(self, descending=True):
+        return ArraySortClause(self, descending,
+                collapsing=self.sortCollapsing)
+
+    def sortKeys(self, mappedClass, ids):
+        """Return sort keys for an array of row IDs (see SortClause.sortKeys)
+        """
+        raise NotImplementedError
+
+    def orderColumns(self, builder):
+        idColumn = self.mappedClass.id
+        ids = idArray(self.model.g.session.query(idColumn).order_by(idColumn))
+        return [valueCase(builder.mappedClass.id, ids, keys)
+                for keys in self.sortKeys(self.mappedClass, ids)]
+
+class PokemonArrayColumn(ArrayColumn):
+    """Base for array-backed columns with per-Pokémon data
+
+    Works for both Pokémon and Pokémon forms.
+    """
+    classNameForLoad = None
+    # The data is the same for all forms of a Pokémon
+    sortCollapsing = 1
+
+    def pokemonId(self, item):
+        """Return the ID of the item's Pokémon"""
+        if self.mappedClass is tables.Pokemon:
+            return item.id
+        else:
+            return item.pokemon_id
+
+    def pokemonIds(self, mappedClass, ids):
+        """Return the IDs of Pokémon for an array of row IDs"""
+        if mappedClass is tables.Pokemon:
+            return ids
+        else:
+            formIndex = self.precomputed(FormPokemonIndex)
+            return formIndex.pokemonIdsForForms(ids)
+
+    def orderColumns(self, builder):
+        # Map Pokémon IDs rather than form IDs; there are fewer of them
+        if self.mappedClass is tables.Pokemon:
+            pokemonIdColumn = builder.mappedClass.id
+        else:
+            pokemonIdColumn = builder.mappedClass.pokemon_id
+        ids = idArray(self.model.g.session.query(tables.Pokemon.id)
+                .order_by(tables.Pokemon.id))
+        return [valueCase(pokemonIdColumn, ids, keys)
+                for keys in self.sortKeys(tables.Pokemon, ids)]
+
+class StatMatrixColumn(PokemonArrayColumn):
+    """Base for Pokémon columns backed by the StatMatrix
+
+    `stat` is a stat identifier, 'total' for the base stat total, or a list
+    of stat identifiers.
+    """
+    classNameForLoad = None
+
+    def __init__(self, stat, **kwargs):
+        PokemonArrayColumn.__init__(self, **kwargs)
+        self.stat = stat
+
+    @property
+    def matrix(self):
+        return self.precomputed(StatMatrix)
+
+    @property
+    def arrayKey(self):
+        return 'base stat', self.stat
+
+    def save(self):
+        representation = super(StatMatrixColumn, self).save()
+        representation['stat'] = self.stat
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        values = self.matrix.statValues(self.stat,
+                self.pokemonIds(mappedClass, ids))
+        if values.ndim == 2:
+            return [values[:, i] for i in range(values.shape[1])]
+        else:
+            return [values]
+
+class PokemonBaseStatColumn(StatMatrixColumn):
+    """Base stat(s) of a Pokémon, or their total
+
+    With a list of stats, they're all shown, separated by slashes, and
+    sorted in the given order.
+    """
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            values = self.matrix.statValues(self.stat, [self.pokemonId(item)])
+            if values.ndim == 2:
+                return u'/'.join(unicode(value) for value in values[0])
+            else:
+                return int(values[0])
+
+class PokemonStatPercentileColumn(StatMatrixColumn):
+    """Percentile of a Pokémon's base stat among the Pokémon shown
+
+    The population is the model's unfiltered rows at the current collapsing
+    level; percentiles for all of them are computed at once.
+    """
+    def __init__(self, **kwargs):
+        StatMatrixColumn.__init__(self, **kwargs)
+        self._percentiles = {}
+
+    def percentiles(self):
+        """Return a dict of percentiles by Pokémon ID, for the current rows
+        """
+        key = self.model.rowsKey()
+        try:
+            return self._percentiles[key]
+        except KeyError:
+            pokemonIds = numpy.unique(self.pokemonIds(self.model.mappedClass,
+                    self.model.rowIds()))
+            values = self.matrix.percentiles(self.stat, pokemonIds,
+                    pokemonIds)
+            result = self._percentiles[key] = dict(zip(pokemonIds.tolist(),
+                    values.tolist()))
+            return result
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            try:
+                return u'%.1f' % self.percentiles()[self.pokemonId(item)]
+            except KeyError:
+                return None
+
+class PokemonTypeChartColumn(PokemonArrayColumn):
+    """Base for Pokémon columns backed by the TypeChart
+
+    `generation` is a generation ID; by default, the latest chart is used.
+    """
+    classNameForLoad = None
+
+    def __init__(self, generation=None, **kwargs):
+        PokemonArrayColumn.__init__(self, **kwargs)
+        self.generation = generation
+
+    @property
+    def chart(self):
+        return self.precomputed(TypeChart, self.generation)
+
+    def typeName(self, position):
+        """Return the name of the type at the given chart position"""
+        g = self.model.g
+        typeId = int(self.chart.typeIds[position])
+        return g.name(g.session.query(tables.Type).get(typeId))
+
+    def save(self):
+        representation = super(PokemonTypeChartColumn, self).save()
+        if self.generation is not None:
+            representation['generation'] = self.generation
+        return representation
+
+class PokemonTypeEfficacyColumn(PokemonTypeChartColumn):
+    """Damage multiplier of an attacking type (by identifier) on a Pokémon
+    """
+    def __init__(self, type, **kwargs):
+        PokemonTypeChartColumn.__init__(self, **kwargs)
+        self.type = type
+
+    def headerData(self, role, model):
+        if role == Qt.DisplayRole:
+            try:
+                position = self.chart.typeIndex(self.type)
+            except ValueError:
+                return model.g.translator(self.name)
+            return model.g.translator(u'vs. {0}').format(
+                    self.typeName(position))
+
+    def factors(self, pokemonIds):
+        """Return the multipliers for an array of Pokémon IDs (or NaN)"""
+        try:
+            position = self.chart.typeIndex(self.type)
+        except ValueError:
+            # The type doesn't exist in this generation
+            return numpy.zeros(len(pokemonIds)) * numpy.nan
+        return self.chart.defensiveFactors(pokemonIds)[:, position]
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            factor = self.factors([self.pokemonId(item)])[0]
+            if not numpy.isnan(factor):
+                return u'×%g' % factor
+
+    def save(self):
+        representation = super(PokemonTypeEfficacyColumn, self).save()
+        representation['type'] = self.type
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [nanRanks(self.factors(self.pokemonIds(mappedClass, ids)))]
+
+class PokemonTypeMatchupColumn(PokemonTypeChartColumn):
+    """Attacking types with a given effect on a Pokémon
+
+    `matchup` is 'weak' (super effective), 'resist' (not very effective) or
+    'immune' (no effect). Sorts by the number of such types.
+    """
+    def __init__(self, matchup, **kwargs):
+        PokemonTypeChartColumn.__init__(self, **kwargs)
+        self.matchup = matchup
+
+    def matches(self, pokemonIds):
+        """Return a Pokémon × attacking type boolean array of matches"""
+        factors = self.chart.defensiveFactors(pokemonIds)
+        if self.matchup == 'weak':
+            return factors > 1
+        elif self.matchup == 'resist':
+            return (factors > 0) & (factors < 1)
+        elif self.matchup == 'immune':
+            return factors == 0
+        else:
+            raise ValueError('Bad matchup: %s' % self.matchup)
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            positions = self.matches([self.pokemonId(item)])[0].nonzero()[0]
+            return u', '.join(self.typeName(position)
+                    for position in positions)
+
+    def save(self):
+        representation = super(PokemonTypeMatchupColumn, self).save()
+        representation['matchup'] = self.matchup
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        matches = self.matches(self.pokemonIds(mappedClass, ids))
+        return [matches.sum(axis=1)]
+
+class PokemonTypeScoreColumn(PokemonTypeChartColumn):
+    """Offensive or defensive type score of a Pokémon
+
+    `direction` is 'offense' or 'defense'; see TypeChart.pokemonScores.
+    """
+    def __init__(self, direction, **kwargs):
+        PokemonTypeChartColumn.__init__(self, **kwargs)
+        self.direction = direction
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            scores = self.chart.pokemonScores(self.direction,
+                    [self.pokemonId(item)])
+            return u'%.2f' % scores[0]
+
+    def save(self):
+        representation = super(PokemonTypeScoreColumn, self).save()
+        representation['direction'] = self.direction
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.chart.pokemonScores(self.direction,
+                self.pokemonIds(mappedClass, ids))]
+
+class TypeScoreColumn(ArrayColumn):
+    """Offensive or defensive score of a type
+
+    `direction` is 'offense' or 'defense'; see TypeChart.typeScores.
+    `generation` is a generation ID; by default, the latest chart is used.
+    """
+    def __init__(self, direction, generation=None, **kwargs):
+        ArrayColumn.__init__(self, **kwargs)
+        self.direction = direction
+        self.generation = generation
+
+    @property
+    def chart(self):
+        return self.precomputed(TypeChart, self.generation)
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            score = self.chart.typeScores(self.direction, [item.id])[0]
+            if not numpy.isnan(score):
+                return u'%.2f' % score
+
+    def save(self):
+        representation = super(TypeScoreColumn, self).save()
+        representation['direction'] = self.direction
+        if self.generation is not None:
+            representation['generation'] = self.generation
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [nanRanks(self.chart.typeScores(self.direction, ids))]
+
+class LearnsetColumn(PokemonArrayColumn):
+    """Base for columns backed by the LearnsetIndex
+
+    `versionGroup` and `method` are identifiers of a version group and a
+    move learn method; by default, all of them count.
+    """
+    classNameForLoad = None
+
+    def __init__(self, versionGroup=None, method=None, **kwargs):
+        PokemonArrayColumn.__init__(self, **kwargs)
+        self.versionGroup = versionGroup
+        self.method = method
+
+    @property
+    def index(self):
+        return self.precomputed(LearnsetIndex)
+
+    def save(self):
+        representation = super(LearnsetColumn, self).save()
+        if self.versionGroup is not None:
+            representation['versionGroup'] = self.versionGroup
+        if self.method is not None:
+            representation['method'] = self.method
+        return representation
+
+class PokemonCanLearnColumn(LearnsetColumn):
+    """Whether a Pokémon can learn a move (given by identifier)
+
+    Shows the methods by which the move can be learned.
+    """
+    def __init__(self, move, **kwargs):
+        LearnsetColumn.__init__(self, **kwargs)
+        self.move = move
+
+    @property
+    def moveObject(self):
+        """The move, or None if it's not in the database"""
+        try:
+            return self._moveObject
+        except AttributeError:
+            query = self.model.g.session.query(tables.Move)
+            self._moveObject = query.filter_by(identifier=self.move).first()
+            return self._moveObject
+
+    @property
+    def moveId(self):
+        if self.moveObject is not None:
+            return self.moveObject.id
+
+    def headerData(self, role, model):
+        if role == Qt.DisplayRole:
+            if self.moveObject is None:
+                return model.g.translator(self.name)
+            return model.g.translator(u'Can learn {0}').format(
+                    model.g.name(self.moveObject))
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            g = self.model.g
+            if self.method is None:
+                methodIds = self.index.learnMethods(self.pokemonId(item),
+                        self.moveId, self.versionGroup)
+                return u', '.join(g.name(g.session.query(
+                        tables.PokemonMoveMethod).get(methodId))
+                        for methodId in methodIds)
+            elif self.index.canLearn([self.pokemonId(item)], self.moveId,
+                    self.versionGroup, self.method)[0]:
+                return u'✓'
+
+    def save(self):
+        representation = super(PokemonCanLearnColumn, self).save()
+        representation['move'] = self.move
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.index.canLearn(self.pokemonIds(mappedClass, ids),
+                self.moveId, self.versionGroup, self.method)]
+
+class PokemonMoveCountColumn(LearnsetColumn):
+    """Number of moves a Pokémon can learn"""
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            return int(self.index.moveCounts([self.pokemonId(item)],
+                    self.versionGroup, self.method)[0])
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.index.moveCounts(self.pokemonIds(mappedClass, ids),
+                self.versionGroup, self.method)]
+
+class MoveLearnerCountColumn(ArrayColumn):
+    """Number of Pokémon (counting alternate forms) that can learn a move
+
+    `versionGroup` and `method` are as in LearnsetColumn.
+    """
+    def __init__(self, versionGroup=None, method=None, **kwargs):
+        ArrayColumn.__init__(self, **kwargs)
+        self.versionGroup = versionGroup
+        self.method = method
+
+    @property
+    def index(self):
+        return self.precomputed(LearnsetIndex)
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            return int(self.index.learnerCounts([item.id], self.versionGroup,
+                    self.method)[0])
+
+    def save(self):
+        representation = super(MoveLearnerCountColumn, self).save()
+        if self.versionGroup is not None:
+            representation['versionGroup'] = self.versionGroup
+        if self.method is not None:
+            representation['method'] = self.method
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.index.learnerCounts(ids, self.versionGroup,
+                self.method)]
+
+class AbilityPokemonColumn(ArrayColumn):
+    """Pokémon that have an ability
+
+    `hidden` can be True or False to only count hidden or normal abilities.
+    Shows the names of the species; sorts by the number of Pokémon.
+    """
+    def __init__(self, hidden=None, **kwargs):
+        ArrayColumn.__init__(self, **kwargs)
+        self.hidden = hidden
+        self._texts = {}
+
+    @property
+    def index(self):
+        return self.precomputed(AbilityIndex)
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            key = self.model.languageSignature(), item.id
+            try:
+                return self._texts[key]
+            except KeyError:
+                g = self.model.g
+                names = self.precomputed(NameTable, tables.PokemonSpecies)
+                text = self._texts[key] = u', '.join(names.displayNames(
+                        [language.identifier for language in g.languages],
+                        self.index.ownerSpecies(item.id, self.hidden)))
+                return text
+
+    def save(self):
+        representation = super(AbilityPokemonColumn, self).save()
+        if self.hidden is not None:
+            representation['hidden'] = self.hidden
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.index.ownerCounts(ids, self.hidden)]
+
+class AbilityPokemonCountColumn(AbilityPokemonColumn):
+    """Number of Pokémon (counting alternate forms) with an ability"""
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            return int(self.index.ownerCounts([item.id], self.hidden)[0])
+
+class EvolutionColumn(PokemonArrayColumn):
+    """Base for Pokémon columns backed by the EvolutionGraph"""
+    classNameForLoad = None
+
+    @property
+    def graph(self):
+        return self.precomputed(EvolutionGraph)
+
+    def speciesPosition(self, item):
+        """Return the position of the item's species in the graph"""
+        return self.graph.speciesPositions([self.pokemonId(item)])[0]
+
+    def speciesPositions(self, mappedClass, ids):
+        """Return the species positions for an array of row IDs"""
+        return self.graph.speciesPositions(self.pokemonIds(mappedClass, ids))
+
+class PokemonEvolutionMethodColumn(EvolutionColumn):
+    """How a Pokémon evolves from its pre-evolution
+
+    Sorts by the evolution trigger, then by the minimum level.
+    """
+    def __init__(self, **kwargs):
+        EvolutionColumn.__init__(self, **kwargs)
+        self._texts = {}
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            position = self.speciesPosition(item)
+            key = self.model.languageSignature(), position
+            try:
+                return self._texts[key]
+            except KeyError:
+                g = self.model.g
+                text = self._texts[key] = u'; '.join(methodText(g, method)
+                        for method in self.graph.methods[position])
+                return text
+
+    def sortKeys(self, mappedClass, ids):
+        positions = self.speciesPositions(mappedClass, ids)
+        return [self.graph.triggerIds[positions],
+                self.graph.minimumLevels[positions]]
+
+class PokemonEvolutionStageColumn(EvolutionColumn):
+    """Evolution stage of a Pokémon, e.g. "2 of 3", or "Baby"
+
+    Sorts by the stage, then by the number of stages.
+    """
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            stages, stageCounts = self.graph.stages(
+                    [self.speciesPosition(item)])
+            translator = self.model.g.translator
+            if stages[0] == 0:
+                return translator(u'Baby')
+            return translator(u'{0} of {1}').format(stages[0],
+                    stageCounts[0])
+
+    def sortKeys(self, mappedClass, ids):
+        return list(self.graph.stages(self.speciesPositions(mappedClass,
+                ids)))
+
+class PokemonPostEvolutionColumn(EvolutionColumn):
+    """Species a Pokémon evolves into
+
+    Sorts by the number of them.
+    """
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            graph = self.graph
+            return u', '.join(self.names(tables.PokemonSpecies,
+                    graph.speciesIds[graph.children(
+                        self.speciesPosition(item))]))
+
+    def sortKeys(self, mappedClass, ids):
+        positions = self.speciesPositions(mappedClass, ids)
+        graph = self.graph
+        return [graph.childStart[positions + 1] - graph.childStart[positions]]
+
+class ExperienceColumn(PokemonArrayColumn):
+    """Base for Pokémon columns backed by the ExperienceTable
+
+    The level is given as `target-level` (as in columns.yaml); by default,
+    it's defaultLevel.
+    """
+    classNameForLoad = None
+    defaultLevel = 50
+
+    def __init__(self, **kwargs):
+        level = kwargs.pop('target-level', None)
+        PokemonArrayColumn.__init__(self, **kwargs)
+        self.level = level
+
+    @property
+    def table(self):
+        return self.precomputed(ExperienceTable)
+
+    @property
+    def effectiveLevel(self):
+        if self.level is None:
+            return self.defaultLevel
+        else:
+            return self.level
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            return int(self.values([self.pokemonId(item)])[0])
+
+    def save(self):
+        representation = super(ExperienceColumn, self).save()
+        if self.level is not None:
+            representation['target-level'] = self.level
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.values(self.pokemonIds(mappedClass, ids))]
+
+class PokemonEXPNeededColumn(ExperienceColumn):
+    """Total EXP a Pokémon needs to reach a level"""
+    def headerData(self, role, model):
+        if role == Qt.DisplayRole and self.level is None:
+            return model.g.translator(u'EXP to level {0}').format(
+                    self.effectiveLevel)
+        return super(PokemonEXPNeededColumn, self).headerData(role, model)
+
+    def values(self, pokemonIds):
+        return self.table.experienceNeeded(pokemonIds, self.effectiveLevel)
+
+class PokemonEXPGivenColumn(ExperienceColumn):
+    """EXP given for defeating a Pokémon at a level"""
+    def values(self, pokemonIds):
+        return self.table.experienceGiven(pokemonIds, self.effectiveLevel)
+
+class EncounterColumn(PokemonArrayColumn):
+    """Base for Pokémon columns backed by the EncounterSummary
+
+    `version` is a version identifier; for some columns it's optional.
+    """
+    classNameForLoad = None
+
+    def __init__(self, version=None, **kwargs):
+        PokemonArrayColumn.__init__(self, **kwargs)
+        self.version = version
+
+    @property
+    def summary(self):
+        return self.precomputed(EncounterSummary)
+
+    @property
+    def versionPosition(self):
+        if self.version is not None:
+            return self.summary.versionPosition(self.version)
+
+    def pokemonPosition(self, item):
+        return self.summary.pokemonPositions([self.pokemonId(item)])[0]
+
+    def save(self):
+        representation = super(EncounterColumn, self).save()
+        if self.version is not None:
+            representation['version'] = self.version
+        return representation
+
+class PokemonLocationVersionsColumn(EncounterColumn):
+    """Versions in which a Pokémon can be found in the wild
+
+    Sorts by the number of them.
+    """
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            summary = self.summary
+            found = summary.locationCounts[self.pokemonPosition(item)] > 0
+            return u', '.join(self.names(tables.Version,
+                    summary.versionIds[found]))
+
+    def sortKeys(self, mappedClass, ids):
+        positions = self.summary.pokemonPositions(self.pokemonIds(mappedClass,
+                ids))
+        return [(self.summary.locationCounts[positions] > 0).sum(axis=1)]
+
+class PokemonLocationsColumn(EncounterColumn):
+    """Locations where a Pokémon can be found in a version
+
+    Most common locations are listed first. Sorts by the number of
+    locations, then by the total encounter rarity.
+    """
+    def headerData(self, role, model):
+        if role == Qt.DisplayRole:
+            versionPosition = self.versionPosition
+            if versionPosition is None:
+                return model.g.translator(self.name)
+            return self.names(tables.Version,
+                    [self.summary.versionIds[versionPosition]])[0]
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            versionPosition = self.versionPosition
+            if versionPosition is not None:
+                locations = self.summary.locations.get(
+                        (self.pokemonPosition(item), versionPosition), [])
+                return u', '.join(self.names(tables.Location,
+                        [locationId for locationId, rarity in locations]))
+
+    def sortKeys(self, mappedClass, ids):
+        summary = self.summary
+        versionPosition = self.versionPosition
+        positions = summary.pokemonPositions(self.pokemonIds(mappedClass,
+                ids))
+        if versionPosition is None:
+            return [numpy.zeros(len(positions), dtype=numpy.int64)]
+        return [summary.locationCounts[positions, versionPosition],
+                summary.rarities[positions, versionPosition]]
+
+class PokemonHeldItemsColumn(EncounterColumn):
+    """Items a wild Pokémon can hold, with their rarities
+
+    Without a version, the highest rarity in any version is shown. Sorts by
+    the number of items (in any version).
+    """
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            rarities = self.summary.heldItemRarities(
+                    self.pokemonPosition(item), self.versionPosition)
+            names = self.names(tables.Item,
+                    [itemId for itemId, rarity in rarities])
+            return u', '.join(u'%s (%s%%)' % (name, rarity)
+                    for name, (itemId, rarity) in zip(names, rarities))
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.summary.heldItemCounts(self.pokemonIds(mappedClass,
+                ids))]
+
+class ForeignNameColumn(ArrayColumn):
+    """Name of an item in a given language (by identifier)"""
+    def __init__(self, language, **kwargs):
+        ArrayColumn.__init__(self, **kwargs)
+        self.language = language
+
+    @property
+    def table(self):
+        return self.precomputed(NameTable, self.mappedClass)
+
+    def headerData(self, role, model):
+        if role == Qt.DisplayRole:
+            g = model.g
+            language = g.session.query(tables.Language).filter_by(
+                    identifier=self.language).first()
+            if language is None:
+                return g.translator(self.name)
+            return g.name(language)
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            return self.table.namesIn(self.language, [item.id])[0]
+
+    def save(self):
+        representation = super(ForeignNameColumn, self).save()
+        representation['language'] = self.language
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.table.ranks(self.language, ids)]
+
+class MoveMetaTableColumn(ArrayColumn):
+    """Base for move columns backed by the MoveMetaTable"""
+    classNameForLoad = None
+
+    @property
+    def table(self):
+        return self.precomputed(MoveMetaTable)
+
+class MoveMetaColumn(MoveMetaTableColumn):
+    """A move_meta value of a move (`attr` is the column name)"""
+    def __init__(self, attr, **kwargs):
+        MoveMetaTableColumn.__init__(self, **kwargs)
+        self.attr = attr
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            values, nulls = self.table.metaValues(self.attr, [item.id])
+            if not nulls[0]:
+                return int(values[0])
+
+    def save(self):
+        representation = super(MoveMetaColumn, self).save()
+        representation['attr'] = self.attr
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.table.metaRanks(self.attr, ids)]
+
+class MoveMetaMinMaxColumn(MoveMetaTableColumn):
+    """A range of move_meta values, from min_* and max_* columns
+
+    `attr_base` is the common part of the column names, e.g. 'hits'.
+    """
+    def __init__(self, attr_base, **kwargs):
+        MoveMetaTableColumn.__init__(self, **kwargs)
+        self.attr_base = attr_base
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            table = self.table
+            minimum, minNulls = table.metaValues('min_' + self.attr_base,
+                    [item.id])
+            maximum, maxNulls = table.metaValues('max_' + self.attr_base,
+                    [item.id])
+            if minNulls[0] or maxNulls[0]:
+                return None
+            elif minimum[0] == maximum[0]:
+                return int(minimum[0])
+            else:
+                return u'%s–%s' % (minimum[0], maximum[0])
+
+    def save(self):
+        representation = super(MoveMetaMinMaxColumn, self).save()
+        representation['attr_base'] = self.attr_base
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.table.metaRanks('min_' + self.attr_base, ids),
+                self.table.metaRanks('max_' + self.attr_base, ids)]
+
+class MoveFlagsColumn(MoveMetaTableColumn):
+    """Flags of a move; sorts by the number of flags, then by the flags"""
+    def __init__(self, **kwargs):
+        MoveMetaTableColumn.__init__(self, **kwargs)
+        self._flagNames = {}
+
+    def flagName(self, position):
+        """Return the name of the flag at the given bit position"""
+        g = self.model.g
+        key = self.model.languageSignature(), position
+        try:
+            return self._flagNames[key]
+        except KeyError:
+            flag = g.session.query(self.table.flagClass).get(
+                    int(self.table.flagIds[position]))
+            name = self._flagNames[key] = g.name(flag)
+            return name
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            table = self.table
+            mask = int(table.flagsOf([item.id])[0])
+            return u', '.join(self.flagName(position)
+                    for position in range(len(table.flagIdentifiers))
+                    if mask & (1 << position))
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.table.flagCounts(ids),
+                self.table.flagsOf(ids).astype(numpy.int64)]
+
+class MoveStatChangeColumn(MoveMetaTableColumn):
+    """Change of a stat (by identifier) caused by a move, e.g. "+2" """
+    def __init__(self, stat, **kwargs):
+        MoveMetaTableColumn.__init__(self, **kwargs)
+        self.stat = stat
+
+    def data(self, item, role=Qt.DisplayRole):
+        if item is not None and role == Qt.DisplayRole:
+            change = int(self.table.statChangesOf(self.stat, [item.id])[0])
+            if change:
+                return u'%+d' % change
+
+    def save(self):
+        representation = super(MoveStatChangeColumn, self).save()
+        representation['stat'] = self.stat
+        return representation
+
+    def sortKeys(self, mappedClass, ids):
+        return [self.table.statChangesOf(self.stat, ids)]
@@ -141,6 +141,165 @@ class ColumnGroup(BaseColumnGroup):
             except KeyError:
                 return DisabledColumn
 
+def column(className, name, **kwargs):
+    """Return a column representation, as used in columns.yaml"""
+    kwargs['class'] = className
+    kwargs['name'] = name
+    return kwargs
+
+class PokemonTypeColumnGroup(ColumnGroup):
+    """Type effectivity columns for Pokémon
+
+    Weaknesses, resistances and immunities; type scores; and the damage
+    taken from each of the standard types.
+    """
+    standardTypes = ('normal', 'fighting', 'flying', 'poison', 'ground',
+            'rock', 'bug', 'ghost', 'steel', 'fire', 'water', 'grass',
+            'electric', 'psychic', 'ice', 'dragon', 'dark', 'fairy')
+
+    def __init__(self, name=None):
+        columns = [
+                column('PokemonTypeMatchupColumn', u'Weaknesses',
+                    matchup='weak'),
+                column('PokemonTypeMatchupColumn', u'Resistances',
+                    matchup='resist'),
+                column('PokemonTypeMatchupColumn', u'Immunities',
+                    matchup='immune'),
+                '---',
+                column('PokemonTypeScoreColumn', u'Defensive Score',
+                    direction='defense'),
+                column('PokemonTypeScoreColumn', u'Offensive Score',
+                    direction='offense'),
+                '---',
+                column('ColumnGroup', u'Damage Taken', columns=[
+                        column('PokemonTypeEfficacyColumn',
+                            identifier.title(), type=identifier)
+                        for identifier in self.standardTypes
+                    ]),
+            ]
+        ColumnGroup.__init__(self, columns, name)
+
+# Move learn methods that get their own columns, with column names
+learnMethods = (
+        ('level-up', u'Level up'),
+        ('machine', u'Machine'),
+        ('egg', u'Egg'),
+        ('tutor', u'Tutor'),
+    )
+
+class PokemonLearnableMovesColumnGroup(ColumnGroup):
+    """Learnable move columns for Pokémon
+
+    Move counts, overall and by learn method; and whether each of the moves
+    that have been HMs can be learned.
+    """
+    hmMoves = ('cut', 'fly', 'surf', 'strength', 'flash', 'rock-smash',
+            'waterfall', 'whirlpool', 'dive', 'rock-climb', 'defog')
+
+    def __init__(self, name=None):
+        columns = [
+                column('PokemonMoveCountColumn', u'Number of Moves'),
+                column('ColumnGroup', u'Number of Moves by Method', columns=[
+                        column('PokemonMoveCountColumn', methodName,
+                            method=method)
+                        for method, methodName in learnMethods
+                    ]),
+                '---',
+                column('ColumnGroup', u'Can Learn HM Move', columns=[
+                        column('PokemonCanLearnColumn',
+                            identifier.replace('-', ' ').title(),
+                            move=identifier)
+                        for identifier in self.hmMoves
+                    ]),
+            ]
+        ColumnGroup.__init__(self, columns, name)
+
+class MovePokemonColumnGroup(ColumnGroup):
+    """Columns for the Pokémon that can learn a move"""
+    def __init__(self, name=None):
+        columns = [
+                column('MoveLearnerCountColumn', u'Number of Pokémon'),
+                '---',
+            ] + [
+                column('MoveLearnerCountColumn',
+                    u'Number of Pokémon: %s' % methodName, method=method)
+                for method, methodName in learnMethods
+            ]
+        ColumnGroup.__init__(self, columns, name)
+
+class AbilityPokemonColumnGroup(ColumnGroup):
+    """Columns for the Pokémon that have an ability"""
+    def __init__(self, name=None):
+        columns = [
+                column('AbilityPokemonColumn', u'Pokémon'),
+                column('AbilityPokemonColumn', u'Pokémon (Normal Ability)',
+                    hidden=False),
+                column('AbilityPokemonColumn', u'Pokémon (Hidden Ability)',
+                    hidden=True),
+                '---',
+                column('AbilityPokemonCountColumn', u'Number of Pokémon'),
+                column('AbilityPokemonCountColumn',
+                    u'Number of Pokémon (Hidden Ability)', hidden=True),
+            ]
+        ColumnGroup.__init__(self, columns, name)
+
+class PokemonLocationColumnGroup(ColumnGroup):
+    """Locations of Pokémon, with a column for each main series version
+    """
+    versions = ('red', 'blue', 'yellow', 'gold', 'silver', 'crystal',
+            'ruby', 'sapphire', 'emerald', 'firered', 'leafgreen', 'diamond',
+            'pearl', 'platinum', 'heartgold', 'soulsilver', 'black', 'white',
+            'black-2', 'white-2', 'x', 'y')
+
+    def __init__(self, name=None):
+        columns = [
+                column('PokemonLocationsColumn',
+                    identifier.replace('-', ' ').title(), version=identifier)
+                for identifier in self.versions
+            ]
+        ColumnGroup.__init__(self, columns, name)
+
+class ForeignNameColumnGroup(ColumnGroup):
+    """Names in each of the languages the games were released in"""
+    languages = (
+            ('ja', u'Japanese'),
+            ('roomaji', u'Rōmaji'),
+            ('ko', u'Korean'),
+            ('zh', u'Chinese'),
+            ('fr', u'French'),
+            ('de', u'German'),
+            ('es', u'Spanish'),
+            ('it', u'Italian'),
+            ('en', u'English'),
+            ('cs', u'Czech'),
+        )
+
+    def __init__(self, name=None):
+        columns = [column('ForeignNameColumn', languageName,
+                    language=identifier)
+                for identifier, languageName in self.languages]
+        ColumnGroup.__init__(self, columns, name)
+
+class MoveStatChangeColumnGroup(ColumnGroup):
+    """Stat changes caused by moves, a column for each stat"""
+    stats = (
+            ('attack', u'Attack'),
+            ('defense', u'Defense'),
+            ('special-attack', u'Special Attack'),
+            ('special-defense', u'Special Defense'),
+            ('speed', u'Speed'),
+            ('accuracy', u'Accuracy'),
+            ('evasion', u'Evasion'),
+        )
+
+    def __init__(self, name=None):
+        columns = [column('MoveMetaColumn', u'Stat Change Chance',
+                    attr='stat_chance'),
+                '---',
+            ] + [column('MoveStatChangeColumn', statName, stat=identifier)
+                for identifier, statName in self.stats]
+        ColumnGroup.__init__(self, columns, name)
+
 def columnFactory(columnClass):
     """Return a wrapper class for a column class"""
     try:
@@ -160,6 +319,11 @@ def columnFactory(columnClass):
                 self.name = name
                 self.kwargs = kwargs
 
+            @property
+            def enabled(self):
+                """Columns that need unavailable libraries are greyed out"""
+                return self.columnClass.available
+
             def getColumn(self, model, mappedClass=None):
                 """Get a new column from this factory"""
                 if mappedClass:
@@ -196,4 +360,22 @@ fileobj = open(resource_filename('qdex', 'columns.yaml'))
 for tableName, group in yaml.load(fileobj).items():
     defaultColumnGroups[tableName] = ColumnGroup(**group)
 
+def availableColumns(model):
+    """Yield new columns for all the model's columns.yaml entries
 
+    Entries that can't be instantiated without extra arguments are skipped.
+    """
+    group = defaultColumnGroups.get(model.tableName)
+    if not group:
+        return
+    stack = [group]
+    while stack:
+        group = stack.pop()
+        if getattr(group, 'columns', None):
+            stack.extend(reversed(group.columns))
+        elif group.columnClass and group.enabled:
+            try:
+                yield group.getColumn(model=model)
+            except Exception:
+                # Some columns need arguments we can't supply here
+                pass
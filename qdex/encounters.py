@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Encounter summary
+
+Encounters are spread over several big tables (encounters, slots, location
+areas). The summary aggregates them once, in bulk, to one entry per
+(Pokémon, version): the locations (with rarity totals) and the held items
+(with rarities). The location columns then only look entries up.
+
+Needs NumPy.
+"""
+
+from sqlalchemy import func
+
+from pokedex.db import tables
+
+from qdex.precomputed import numpy, positionsIn, idArray
+
+class EncounterSummary(object):
+    """Encounters and held items of all Pokémon, aggregated per version
+
+    Arrays have a row for each Pokémon (in `pokemonIds` order) and a column
+    for each version (in `versionIds` order): `rarities` holds the sum of
+    encounter rarities over all locations, `locationCounts` the number of
+    locations. `locations` and `heldItems` map (Pokémon position, version
+    position) to lists of (location or item ID, rarity), most common
+    first.
+    """
+    def __init__(self, session):
+        self.pokemonIds = idArray(session.query(tables.Pokemon.id)
+                .order_by(tables.Pokemon.id))
+        versions = (session.query(tables.Version)
+                .order_by(tables.Version.id).all())
+        self.versionIds = numpy.array([version.id for version in versions],
+                dtype=numpy.int64)
+        self.versionIdentifiers = dict((version.identifier, version.id)
+                for version in versions)
+
+        shape = len(self.pokemonIds), len(self.versionIds)
+        self.rarities = numpy.zeros(shape, dtype=numpy.int64)
+        self.locationCounts = numpy.zeros(shape, dtype=numpy.int64)
+        self.locations = {}
+        encounter = tables.Encounter
+        area = tables.LocationArea
+        slot = tables.EncounterSlot
+        rarity = func.sum(slot.rarity)
+        query = (session.query(encounter.pokemon_id, encounter.version_id,
+                    area.location_id, rarity)
+                .join((area, encounter.location_area_id == area.id))
+                .join((slot, encounter.encounter_slot_id == slot.id))
+                .group_by(encounter.pokemon_id, encounter.version_id,
+                    area.location_id)
+                .order_by(rarity.desc(), area.location_id))
+        for key, locationId, rarity in self._positioned(query):
+            self.locations.setdefault(key, []).append((locationId, rarity))
+            self.rarities[key] += rarity
+            self.locationCounts[key] += 1
+
+        self.heldItems = {}
+        item = tables.PokemonItem
+        query = (session.query(item.pokemon_id, item.version_id,
+                    item.item_id, item.rarity)
+                .order_by(item.rarity.desc(), item.item_id))
+        itemSets = {}
+        for key, itemId, rarity in self._positioned(query):
+            self.heldItems.setdefault(key, []).append((itemId, rarity))
+            itemSets.setdefault(key[0], set()).add(itemId)
+        self.itemCounts = numpy.zeros(len(self.pokemonIds),
+                dtype=numpy.int64)
+        for pokemonPosition, itemIds in itemSets.items():
+            self.itemCounts[pokemonPosition] = len(itemIds)
+
+    def _positioned(self, query):
+        """Yield ((Pokémon pos., version pos.), id, rarity) for query rows
+
+        The query gives (Pokémon ID, version ID, id, rarity) rows.
+        """
+        rows = query.all()
+        if not rows:
+            return
+        ids = numpy.array([row[:2] for row in rows], dtype=numpy.int64)
+        pokemonPositions = positionsIn(self.pokemonIds, ids[:, 0]).tolist()
+        versionPositions = positionsIn(self.versionIds, ids[:, 1]).tolist()
+        for row, pokemonPosition, versionPosition in zip(rows,
+                pokemonPositions, versionPositions):
+            yield (pokemonPosition, versionPosition), row[2], row[3] or 0
+
+    def versionPosition(self, identifier):
+        """Return the position of a version (by identifier), or None"""
+        try:
+            versionId = self.versionIdentifiers[identifier]
+        except KeyError:
+            return None
+        return int(positionsIn(self.versionIds, [versionId])[0])
+
+    def pokemonPositions(self, pokemonIds):
+        """Return the row positions of an array of Pokémon IDs"""
+        return positionsIn(self.pokemonIds, pokemonIds)
+
+    def heldItemRarities(self, pokemonPosition, versionPosition=None):
+        """Return (item ID, rarity) pairs for a Pokémon, most common first
+
+        Without a version, the highest rarity in any version is used.
+        """
+        if versionPosition is not None:
+            return self.heldItems.get((pokemonPosition, versionPosition), [])
+        best = {}
+        for versionPosition in range(len(self.versionIds)):
+            for itemId, rarity in self.heldItems.get(
+                    (pokemonPosition, versionPosition), []):
+                best[itemId] = max(rarity, best.get(itemId, 0))
+        return sorted(best.items(), key=lambda item: (-item[1], item[0]))
+
+    def heldItemCounts(self, pokemonIds):
+        """Return the number of different items each Pokémon can hold"""
+        return self.itemCounts[self.pokemonPositions(pokemonIds)]
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Evolution graph index
+
+All evolution chains are loaded once into adjacency arrays over species:
+the pre-evolution of each species, and its evolutions in compressed form
+(evolutions of the i-th species are childPositions[childStart[i]:
+childStart[i + 1]]). Stage depth, chain root, leaves and evolution methods
+are precomputed, so the evolution columns don't need to walk the
+evolves_from relationships row by row.
+
+Needs NumPy.
+"""
+
+from pokedex.db import tables
+
+from qdex.precomputed import numpy, positionsIn
+
+# Attributes of PokemonEvolution that describe the method: (attribute,
+# mapped class of the referenced object or None, message template)
+methodAttributes = (
+        ('minimum_level', None, u'level {0}'),
+        ('trigger_item_id', tables.Item, u'{0}'),
+        ('held_item_id', tables.Item, u'holding {0}'),
+        ('known_move_id', tables.Move, u'knowing {0}'),
+        ('location_id', tables.Location, u'at {0}'),
+        ('time_of_day', None, u'during the {0}'),
+        ('minimum_happiness', None, u'happiness {0}'),
+        ('minimum_beauty', None, u'beauty {0}'),
+        ('party_species_id', tables.PokemonSpecies, u'with {0} in the party'),
+        ('trade_species_id', tables.PokemonSpecies, u'for {0}'),
+    )
+
+# Values of relative_physical_stats: the sign of Attack - Defense
+relativeStatTexts = {
+        1: u'Attack > Defense',
+        0: u'Attack = Defense',
+        -1: u'Attack < Defense',
+    }
+
+class EvolutionGraph(object):
+    """Evolution chains of all species, as arrays
+
+    Arrays are indexed by species position (species are in `speciesIds`
+    order). `parents` holds the position of the pre-evolution, or -1;
+    `depths` the number of evolutions from the chain's root, `roots` the
+    position of the root. `leaves` is True for species that don't evolve.
+    """
+    def __init__(self, session):
+        species = tables.PokemonSpecies
+        rows = session.query(species.id, species.evolves_from_species_id,
+                species.is_baby).order_by(species.id).all()
+        self.speciesIds = numpy.array([row[0] for row in rows],
+                dtype=numpy.int64)
+        parentIds = numpy.array([row[1] or -1 for row in rows],
+                dtype=numpy.int64)
+        self.babies = numpy.array([bool(row[2]) for row in rows],
+                dtype=bool)
+        count = len(self.speciesIds)
+
+        self.parents = numpy.where(parentIds >= 0,
+                positionsIn(self.speciesIds, parentIds), -1)
+
+        # Walk up all chains at once; chains are only a few stages long
+        self.depths = numpy.zeros(count, dtype=numpy.int64)
+        self.roots = numpy.arange(count)
+        current = self.parents.copy()
+        while (current >= 0).any():
+            mask = current >= 0
+            self.depths[mask] += 1
+            self.roots[mask] = current[mask]
+            current[mask] = self.parents[current[mask]]
+
+        chainDepths = numpy.zeros(count, dtype=numpy.int64)
+        numpy.maximum.at(chainDepths, self.roots, self.depths)
+        self.chainDepths = chainDepths[self.roots]
+
+        hasParent = self.parents >= 0
+        childCounts = numpy.bincount(self.parents[hasParent], minlength=count)
+        self.leaves = childCounts == 0
+        self.childStart = numpy.concatenate([[0], numpy.cumsum(childCounts)])
+        children = numpy.arange(count)[hasParent]
+        self.childPositions = children[numpy.argsort(
+                self.parents[hasParent], kind='mergesort')]
+
+        self.methods = [[] for i in range(count)]
+        for evolution in session.query(tables.PokemonEvolution).order_by(
+                tables.PokemonEvolution.id):
+            position = positionsIn(self.speciesIds,
+                    [evolution.evolved_species_id])[0]
+            self.methods[position].append(self._methodData(evolution))
+        self.triggerIds = numpy.array([methods[0]['trigger'] if methods
+                else -1 for methods in self.methods], dtype=numpy.int64)
+        self.minimumLevels = numpy.array([
+                methods[0].get('minimum_level', -1) if methods else -1
+                for methods in self.methods], dtype=numpy.int64)
+
+        pokemon = numpy.array(session.query(tables.Pokemon.id,
+                tables.Pokemon.species_id).order_by(tables.Pokemon.id).all(),
+                dtype=numpy.int64).reshape(-1, 2)
+        self.pokemonIds = pokemon[:, 0]
+        self.pokemonSpecies = positionsIn(self.speciesIds, pokemon[:, 1])
+
+    def _methodData(self, evolution):
+        """Return a dict of the non-null method attributes of an evolution
+        """
+        data = dict(trigger=evolution.evolution_trigger_id)
+        for attribute, mappedClass, template in methodAttributes:
+            value = getattr(evolution, attribute, None)
+            if value is not None:
+                data[attribute] = value
+        # Older pokedex versions have a gender enum instead of gender_id
+        gender = getattr(evolution, 'gender_id', None) or getattr(evolution,
+                'gender', None)
+        if gender is not None:
+            data['gender'] = gender
+        relativeStats = getattr(evolution, 'relative_physical_stats', None)
+        if relativeStats is not None:
+            data['relative_physical_stats'] = relativeStats
+        return data
+
+    def speciesPositions(self, pokemonIds):
+        """Return species positions for an array of Pokémon IDs"""
+        return self.pokemonSpecies[positionsIn(self.pokemonIds, pokemonIds)]
+
+    def children(self, position):
+        """Return positions of the evolutions of a species"""
+        return self.childPositions[
+                self.childStart[position]:self.childStart[position + 1]]
+
+    def stages(self, positions):
+        """Return (stage, number of stages) arrays for species positions
+
+        Stages are counted from 1; baby species (which were added to chains
+        later) are stage 0, and aren't counted in the number of stages.
+        """
+        babyChains = self.babies[self.roots[positions]].astype(numpy.int64)
+        return (self.depths[positions] + 1 - babyChains,
+                self.chainDepths[positions] + 1 - babyChains)
+
+def methodText(g, method):
+    """Return a description of an evolution method (from EvolutionGraph)"""
+    session = g.session
+    parts = [g.name(session.query(tables.EvolutionTrigger).get(
+            method['trigger']))]
+    for attribute, mappedClass, template in methodAttributes:
+        try:
+            value = method[attribute]
+        except KeyError:
+            continue
+        if mappedClass is not None:
+            value = g.name(session.query(mappedClass).get(value))
+        parts.append(g.translator(template).format(value))
+    if 'gender' in method:
+        gender = method['gender']
+        if gender in (1, 'female'):
+            parts.append(g.translator(u'female only'))
+        elif gender in (2, 'male'):
+            parts.append(g.translator(u'male only'))
+    if 'relative_physical_stats' in method:
+        parts.append(g.translator(
+                relativeStatTexts[method['relative_physical_stats']]))
+    return u', '.join(parts)
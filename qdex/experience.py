@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Experience curves, as a growth rate × level lookup table
+
+Loaded once from the experience table, together with the growth rate and
+base experience of each Pokémon, so the EXP columns only index arrays.
+
+Needs NumPy.
+"""
+
+from pokedex.db import tables
+
+from qdex.precomputed import numpy, positionsIn
+
+maxLevel = 100
+
+class ExperienceTable(object):
+    """Experience curves of all growth rates, and Pokémon experience data
+
+    `experience[rate, level]` is the total experience needed for a level
+    (rates are in `growthRateIds` order; levels go from 0 to maxLevel, and
+    level 0 is unused). `pokemonRates` and `baseExperience` have an entry
+    for each Pokémon, in `pokemonIds` order.
+    """
+    def __init__(self, session):
+        experience = tables.Experience
+        rows = numpy.array(session.query(experience.growth_rate_id,
+                experience.level, experience.experience).all(),
+                dtype=numpy.int64).reshape(-1, 3)
+        self.growthRateIds = numpy.unique(rows[:, 0])
+        self.experience = numpy.zeros((len(self.growthRateIds), maxLevel + 1),
+                dtype=numpy.int64)
+        self.experience[positionsIn(self.growthRateIds, rows[:, 0]),
+                rows[:, 1]] = rows[:, 2]
+
+        pokemon, species = tables.Pokemon, tables.PokemonSpecies
+        query = (session.query(pokemon.id, species.growth_rate_id,
+                    pokemon.base_experience)
+                .join((species, pokemon.species_id == species.id))
+                .order_by(pokemon.id))
+        rows = numpy.array([(id, rate, base or 0) for id, rate, base in query],
+                dtype=numpy.int64).reshape(-1, 3)
+        self.pokemonIds = rows[:, 0]
+        self.pokemonRates = positionsIn(self.growthRateIds, rows[:, 1])
+        self.baseExperience = rows[:, 2]
+
+    def experienceNeeded(self, pokemonIds, level):
+        """Return the total EXP the given Pokémon need to reach a level"""
+        positions = positionsIn(self.pokemonIds, pokemonIds)
+        return self.experience[self.pokemonRates[positions], level]
+
+    def experienceGiven(self, pokemonIds, level):
+        """Return the EXP given for defeating the Pokémon at a level
+
+        This is the basic formula, base EXP × level / 7, without any
+        bonuses.
+        """
+        positions = positionsIn(self.pokemonIds, pokemonIds)
+        return self.baseExperience[positions] * level // 7
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Exporting query models to files
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import struct
+import argparse
+
+from PySide import QtCore
+Qt = QtCore.Qt
+
+from qdex.globalstate import Global
+from qdex.metamodel import modelRepresentations
+from qdex.querymodel import TableModel
+
+def displayValue(value):
+    """Convert a value from a model's data() to something we can write out"""
+    if value is None or isinstance(value, (int, long, float, bool)):
+        return value
+    else:
+        return unicode(value)
+
+def iterPages(model):
+    """Yield the display data of a query model, one page of rows at a time
+
+    Each page is a list of rows; each row is a list of values, one per column.
+    Rows are read the way the model displays them, so the current columns,
+    sort clauses and collapsing apply.
+    Pages that weren't cached in the model before are dropped from it again
+    after they're read, and cells don't go through the result cache, so
+    memory use stays bounded.
+    """
+    rowCount = model.rowCount()
+    columnCount = model.columnCount()
+    pagesize = model._pagesize
+    for start in range(0, rowCount, pagesize):
+        pageno = start // pagesize
+        wasCached = model.pages[pageno] is not None
+        rows = []
+        for row in range(start, min(start + pagesize, rowCount)):
+            rows.append([
+                    displayValue(model.uncachedData(model.index(row, column)))
+                    for column in range(columnCount)
+                ])
+        if not wasCached:
+            model.dropPage(pageno)
+        yield rows
+
+def columnNames(model):
+    """Return the header texts of a model's columns"""
+    return [displayValue(model.headerData(column, Qt.Horizontal,
+                Qt.DisplayRole))
+            for column in range(model.columnCount())]
+
+class Exporter(object):
+    """Writes a query model to a binary file object
+
+    Subclasses implement begin(names), writePage(rows) and end().
+    """
+    extension = None
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def export(self, model, progress=None):
+        """Export the model
+
+        `progress`, if given, is called as progress(rowsDone, rowCount) after
+        each page. If it returns False, the export is stopped.
+        Returns the number of rows written.
+        """
+        total = model.rowCount()
+        done = 0
+        self.begin(columnNames(model))
+        for rows in iterPages(model):
+            self.writePage(rows)
+            done += len(rows)
+            if progress and progress(done, total) is False:
+                break
+        self.end()
+        return done
+
+    def begin(self, names):
+        """Write out the file header"""
+        pass
+
+    def writePage(self, rows):
+        """Write out a page of rows"""
+        raise NotImplementedError
+
+    def end(self):
+        """Finish the file"""
+        pass
+
+class CSVExporter(Exporter):
+    """Export to comma-separated values, UTF-8 encoded"""
+    extension = 'csv'
+
+    def begin(self, names):
+        self.writer = csv.writer(self.fileobj)
+        self.writer.writerow([self.encode(name) for name in names])
+
+    def writePage(self, rows):
+        for row in rows:
+            self.writer.writerow([self.encode(value) for value in row])
+
+    def encode(self, value):
+        """Encode a value for the Python 2 csv module"""
+        if value is None:
+            return ''
+        else:
+            return unicode(value).encode('utf-8')
+
+class TabSeparatedExporter(CSVExporter):
+    """Export to tab-separated values, UTF-8 encoded"""
+    extension = 'tsv'
+
+    def begin(self, names):
+        self.writer = csv.writer(self.fileobj, dialect='excel-tab')
+        self.writer.writerow([self.encode(name) for name in names])
+
+class JSONLinesExporter(Exporter):
+    """Export to JSON Lines: one JSON object per row, keyed by column names
+    """
+    extension = 'jsonl'
+
+    def begin(self, names):
+        self.names = names
+
+    def writePage(self, rows):
+        for row in rows:
+            line = json.dumps(dict(zip(self.names, row)), ensure_ascii=False)
+            if isinstance(line, unicode):
+                line = line.encode('utf-8')
+            self.fileobj.write(line + '\n')
+
+class ColumnarExporter(Exporter):
+    """Export to a simple columnar binary format
+
+    The layout is modeled after Parquet:
+    - the magic string 'QDEXCOL1'
+    - row groups, one per model page; each holds one chunk per column
+    - a UTF-8 JSON footer with the column names, and each row group's row
+        count and chunk offsets
+    - the footer length (little-endian uint32) and the magic string again
+
+    Each column chunk starts with a type byte: 'i' for chunks where all
+    values are integers (or null), 's' otherwise. It is followed by
+    a null bitmap (one byte per 8 rows), and then the values:
+    int64s for 'i' chunks, or uint32 byte lengths followed by the
+    concatenated UTF-8 data for 's' chunks.
+    Null values are stored as 0 or the empty string.
+    """
+    extension = 'qcol'
+    magic = 'QDEXCOL1'
+
+    def begin(self, names):
+        self.names = names
+        self.rowGroups = []
+        self.offset = 0
+        self.write(self.magic)
+
+    def write(self, data):
+        """Write data, keeping track of the file offset"""
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def writePage(self, rows):
+        offsets = []
+        for column in range(len(self.names)):
+            offsets.append(self.offset)
+            self.writeChunk([row[column] for row in rows])
+        self.rowGroups.append(dict(rows=len(rows), offsets=offsets))
+
+    def writeChunk(self, values):
+        """Write out a column chunk"""
+        bitmap = bytearray((len(values) + 7) // 8)
+        for i, value in enumerate(values):
+            if value is None:
+                bitmap[i // 8] |= 1 << (i % 8)
+        isInteger = all(value is None or (isinstance(value, (int, long))
+                    and not isinstance(value, bool))
+                for value in values)
+        if isInteger:
+            self.write('i')
+            self.write(str(bitmap))
+            self.write(struct.pack('<%sq' % len(values),
+                    *[value or 0 for value in values]))
+        else:
+            encoded = [u'' if value is None else unicode(value)
+                    for value in values]
+            encoded = [value.encode('utf-8') for value in encoded]
+            self.write('s')
+            self.write(str(bitmap))
+            self.write(struct.pack('<%sI' % len(encoded),
+                    *[len(value) for value in encoded]))
+            self.write(''.join(encoded))
+
+    def end(self):
+        footer = json.dumps(dict(
+                columns=self.names,
+                rowGroups=self.rowGroups,
+            ), ensure_ascii=False)
+        if isinstance(footer, unicode):
+            footer = footer.encode('utf-8')
+        self.write(footer)
+        self.write(struct.pack('<I', len(footer)))
+        self.write(self.magic)
+
+exporters = dict((cls.extension, cls)
+        for cls in (CSVExporter, TabSeparatedExporter, JSONLinesExporter,
+            ColumnarExporter))
+
+def exportModel(model, filename, format=None, progress=None):
+    """Export a query model to the given file
+
+    `format` is one of the keys of `exporters`; by default it's guessed from
+    the file extension.
+    """
+    if format is None:
+        format = filename.rpartition('.')[2].lower()
+    try:
+        exporterClass = exporters[format]
+    except KeyError:
+        raise ValueError('Unknown export format: %s' % format)
+    with open(filename, 'wb') as fileobj:
+        return exporterClass(fileobj).export(model, progress)
+
+def main(argv=None):
+    """Command-line entry point: export all the standard lists to a directory
+    """
+    parser = argparse.ArgumentParser(
+            description='Export the standard qdex lists to files')
+    parser.add_argument('directory', help='Directory to write the files to')
+    parser.add_argument('-f', '--format', default='csv',
+            choices=sorted(exporters), help='Output format (default: csv)')
+    parser.add_argument('-l', '--lang', action='append', dest='langs',
+            help='Language to use; may be given more times (default: en)')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        os.makedirs(args.directory)
+    g = Global(langs=args.langs)
+    for name, representation in modelRepresentations():
+        model = TableModel.load(representation, g=g)
+        slug = re.sub(r'[^a-z0-9]+', '-',
+                g.translator(name).lower().encode('ascii', 'ignore')).strip('-')
+        filename = os.path.join(args.directory,
+                '%s.%s' % (slug, args.format))
+        def progress(done, total):
+            sys.stderr.write('\r%s: %s/%s' % (filename, done, total))
+        rows = exportModel(model, filename, args.format, progress)
+        sys.stderr.write('\r%s: %s rows\n' % (filename, rows))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Frame-time harness for ResultView
+
+Drives a ResultView through scripted scrolling, expanding/collapsing and
+column-resizing scenarios, rendering it into a pixmap after each step.
+For each scenario, reports frame paint time percentiles, the number of
+model data() calls and the number of SQL queries.
+
+The view is laid out as if shown, but never appears on screen. Qt 4 still
+needs a display to start, so on headless machines run this under Xvfb
+(e.g. with xvfb-run).
+"""
+
+import sys
+import json
+import argparse
+from timeit import default_timer
+
+from PySide import QtCore, QtGui
+Qt = QtCore.Qt
+
+from pokedex.db import connect
+
+from qdex.globalstate import Global
+from qdex.metamodel import modelRepresentations
+from qdex.querymodel import TableModel
+from qdex.queryview import ResultView
+from qdex.benchmark import QueryCounter
+
+class TimedResultView(ResultView):
+    """A ResultView that records how long each paint takes"""
+    def __init__(self, *args):
+        ResultView.__init__(self, *args)
+        self.frameTimes = []
+
+    def paintEvent(self, event):
+        start = default_timer()
+        ResultView.paintEvent(self, event)
+        self.frameTimes.append(default_timer() - start)
+
+class DataCallCounter(object):
+    """Counts data() calls on a model class, while used as a context manager
+    """
+    def __init__(self, modelClass):
+        self.modelClass = modelClass
+        self.count = 0
+
+    def __enter__(self):
+        counter = self
+        self.originalData = originalData = self.modelClass.__dict__.get('data')
+        inheritedData = self.modelClass.data
+        def data(self, *args, **kwargs):
+            counter.count += 1
+            return inheritedData(self, *args, **kwargs)
+        self.modelClass.data = data
+        return self
+
+    def __exit__(self, *args):
+        if self.originalData is None:
+            del self.modelClass.data
+        else:
+            self.modelClass.data = self.originalData
+
+def percentile(values, fraction):
+    """Return the given percentile (as a fraction) of a list of values"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+class FrameHarness(object):
+    """Runs view scenarios and collects frame statistics"""
+    def __init__(self, g, steps=100, width=800, height=600):
+        self.g = g
+        self.steps = steps
+        self.queryCounter = QueryCounter(g.session.bind)
+        self.view = TimedResultView()
+        # Lay the view out as if it were shown, without mapping a window
+        self.view.setAttribute(Qt.WA_DontShowOnScreen)
+        self.view.resize(width, height)
+        self.view.show()
+        self.pixmap = QtGui.QPixmap(self.view.viewport().size())
+        self.results = {}
+
+    def frame(self):
+        """Paint the view synchronously, into an off-screen pixmap"""
+        self.view.viewport().render(self.pixmap)
+
+    def runScenario(self, name, model, steps):
+        """Run the `steps` (callables) as frames, record the statistics"""
+        view = self.view
+        view.setModel(model)
+        self.frame()
+        QtGui.QApplication.processEvents()
+        del view.frameTimes[:]
+        queriesBefore = self.queryCounter.count
+        with DataCallCounter(type(model)) as dataCalls:
+            for step in steps:
+                step()
+                self.frame()
+        frameTimes = view.frameTimes
+        result = dict(
+                frames=len(frameTimes),
+                p50=percentile(frameTimes, 0.5),
+                p95=percentile(frameTimes, 0.95),
+                p99=percentile(frameTimes, 0.99),
+                max=max(frameTimes) if frameTimes else None,
+                dataCalls=dataCalls.count,
+                queries=self.queryCounter.count - queriesBefore,
+            )
+        self.results[name] = result
+        return result
+
+    def scrollSteps(self):
+        """Steps scrolling down the whole list, then jumping back up"""
+        scrollBar = self.view.verticalScrollBar()
+        maximum = scrollBar.maximum()
+        steps = []
+        for i in range(1, self.steps + 1):
+            value = maximum * i // self.steps
+            steps.append(lambda value=value: scrollBar.setValue(value))
+        steps.append(lambda: scrollBar.setValue(0))
+        return steps
+
+    def expandCollapseSteps(self, model):
+        """Steps expanding, then collapsing, the first visible rows"""
+        steps = []
+        rows = range(min(model.rowCount(), self.steps // 2))
+        for row in rows:
+            index = model.index(row, 0)
+            steps.append(lambda index=index: self.view.expand(index))
+        for row in rows:
+            index = model.index(row, 0)
+            steps.append(lambda index=index: self.view.collapse(index))
+        return steps
+
+    def resizeSteps(self, model):
+        """Steps widening each column, then narrowing it back"""
+        header = self.view.header()
+        steps = []
+        for column in range(model.columnCount()):
+            width = header.sectionSize(column)
+            for delta in range(0, 100, 10) + range(100, -10, -10):
+                steps.append(lambda column=column, size=width + delta:
+                        header.resizeSection(column, size))
+        return steps
+
+    def run(self):
+        """Run all scenarios on all the standard lists"""
+        for name, representation in modelRepresentations():
+            listName = unicode(self.g.translator(name))
+            model = TableModel.load(representation, g=self.g)
+            # Lay the view out, so the scroll range is known
+            self.view.setModel(model)
+            QtGui.QApplication.processEvents()
+            self.runScenario('scroll/%s' % listName, model,
+                    self.scrollSteps())
+            if model.hasChildren(model.index(0, 0)):
+                self.runScenario('expand-collapse/%s' % listName, model,
+                        self.expandCollapseSteps(model))
+            self.runScenario('resize/%s' % listName, model,
+                    self.resizeSteps(model))
+        return self.results
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(
+            description='Measure ResultView frame times')
+    parser.add_argument('-e', '--engine', metavar='URI',
+            help='SQLAlchemy URI of the pokedex database '
+                '(default: the pokedex library default)')
+    parser.add_argument('-o', '--output', metavar='FILE',
+            help='Write the results to this JSON file')
+    parser.add_argument('-n', '--steps', type=int, default=100,
+            help='Number of scroll steps (default: 100)')
+    parser.add_argument('-l', '--lang', action='append', dest='langs',
+            help='Language to use; may be given more times (default: en)')
+    args = parser.parse_args(argv)
+
+    app = QtGui.QApplication(sys.argv[:1])
+    # The persistent result cache would make repeated runs incomparable
+    g = Global(session=connect(args.engine), langs=args.langs,
+            resultCache=False)
+    results = FrameHarness(g, steps=args.steps).run()
+    for name, result in sorted(results.items()):
+        print ('%-40s %4s frames  p50 %7.2fms  p95 %7.2fms  p99 %7.2fms  '
+                '%7s data()  %5s queries') % (name, result['frames'],
+                    result['p50'] * 1000, result['p95'] * 1000,
+                    result['p99'] * 1000, result['dataCalls'],
+                    result['queries'])
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=4, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
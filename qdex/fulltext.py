@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Full-text search over flavor text and effect prose
+"""
+
+import re
+import sqlite3
+
+from sqlalchemy.sql.expression import and_, or_
+from pokedex.db import tables
+
+from qdex import cache_filename
+from qdex.pokedexhelpers import getTranslationClass, databaseFingerprint
+from qdex.precomputed import idFilterClause
+
+class FullTextSource(object):
+    """A kind of searchable text, e.g. Pokémon flavor text
+
+    `identifier`: key the source's documents are stored under
+    `tableName`: name of the table of the models this source can filter
+    `queryFactory`: function that takes a session and language ID, and returns
+        a query yielding (entity ID, text) tuples. The entity ID is matched
+        against the `filterColumn` of the model.
+    `filterColumn`: function taking the model's mapped class and returning the
+        DB column the entity IDs are compared to.
+    """
+    def __init__(self, identifier, tableName, queryFactory, filterColumn):
+        self.identifier = identifier
+        self.tableName = tableName
+        self.queryFactory = queryFactory
+        self.filterColumn = filterColumn
+
+def _flavorTextSource(identifier, tableName, flavorClassName, idAttr,
+        filterColumn):
+    """Make a FullTextSource for a flavor text table, if pokedex has it"""
+    flavorClass = getattr(tables, flavorClassName, None)
+    if flavorClass is None:
+        return None
+    def queryFactory(session, languageId):
+        query = session.query(getattr(flavorClass, idAttr),
+                flavorClass.flavor_text)
+        return query.filter(flavorClass.language_id == languageId)
+    return FullTextSource(identifier, tableName, queryFactory, filterColumn)
+
+def _proseSource(identifier, tableName, mappedClass, attr, joinFactory=None):
+    """Make a FullTextSource for a translated prose column
+
+    If joinFactory is given, it is a function taking the translation class
+    and returning the join condition between tableName's class and it;
+    by default, the prose is assumed to belong to the table directly.
+    """
+    translationClass = getTranslationClass(mappedClass, attr)
+    tableClass = getattr(tables, tableName)
+    if joinFactory is None:
+        joinFactory = lambda translationClass: (
+                translationClass.foreign_id == tableClass.id)
+    def queryFactory(session, languageId):
+        query = session.query(tableClass.id, getattr(translationClass, attr))
+        query = query.join((translationClass, and_(
+                joinFactory(translationClass),
+                translationClass.local_language_id == languageId,
+            )))
+        return query
+    return FullTextSource(identifier, tableName, queryFactory,
+            lambda mappedClass: mappedClass.id)
+
+def defaultSources():
+    """Return the FullTextSources qdex knows about"""
+    sources = [
+            _flavorTextSource('pokemon-flavor', 'PokemonForm',
+                    'PokemonSpeciesFlavorText', 'species_id',
+                    lambda mappedClass: tables.Pokemon.species_id),
+            _flavorTextSource('move-flavor', 'Move', 'MoveFlavorText',
+                    'move_id', lambda mappedClass: mappedClass.id),
+            _flavorTextSource('ability-flavor', 'Ability',
+                    'AbilityFlavorText', 'ability_id',
+                    lambda mappedClass: mappedClass.id),
+            _flavorTextSource('item-flavor', 'Item', 'ItemFlavorText',
+                    'item_id', lambda mappedClass: mappedClass.id),
+        ]
+    for attr in 'short_effect', 'effect':
+        sources.append(_proseSource('move-' + attr, 'Move', tables.MoveEffect,
+                attr, lambda translationClass: (
+                        translationClass.foreign_id == tables.Move.effect_id)))
+        for tableName in 'Ability', 'Item':
+            sources.append(_proseSource(
+                    '%s-%s' % (tableName.lower(), attr), tableName,
+                    getattr(tables, tableName), attr))
+    return [source for source in sources if source is not None]
+
+class FullTextIndex(object):
+    """A persistent, incrementally built full-text index
+
+    The index lives in a SQLite database in qdex's cache directory, and uses
+    SQLite's FTS5 module (or FTS4/FTS3 on older SQLite builds).
+    Documents for a (source, language) pair are indexed the first time that
+    pair is searched. The index is thrown away when the pokedex database
+    changes.
+    """
+    def __init__(self, session, filename=None, sources=None):
+        self.session = session
+        if filename is None:
+            filename = cache_filename('fulltext.sqlite')
+        if sources is None:
+            sources = defaultSources()
+        self.sources = dict((s.identifier, s) for s in sources)
+        self.connection = sqlite3.connect(filename)
+        self._createTables()
+
+    def _createTables(self):
+        """Create the index tables, or clear them if they're stale"""
+        conn = self.connection
+        conn.execute('''CREATE TABLE IF NOT EXISTS meta
+                (key TEXT PRIMARY KEY, value TEXT)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS documents
+                (id INTEGER PRIMARY KEY, source TEXT, language_id INTEGER,
+                entity_id INTEGER)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS indexed
+                (source TEXT, language_id INTEGER,
+                PRIMARY KEY (source, language_id))''')
+        if not self._tableExists('texts'):
+            for module in 'fts5', 'fts4', 'fts3':
+                try:
+                    conn.execute('CREATE VIRTUAL TABLE texts USING %s(text)'
+                            % module)
+                except sqlite3.OperationalError:
+                    continue
+                else:
+                    break
+            else:
+                raise RuntimeError('SQLite full-text search is not available')
+        row = self.connection.execute(
+                "SELECT sql FROM sqlite_master WHERE name='texts'").fetchone()
+        self.module = re.search(r'USING\s+(\w+)', row[0]).group(1).lower()
+        fingerprint = databaseFingerprint(self.session)
+        row = conn.execute("SELECT value FROM meta WHERE key='fingerprint'"
+                ).fetchone()
+        if row is None or row[0] != fingerprint:
+            conn.execute('DELETE FROM texts')
+            conn.execute('DELETE FROM documents')
+            conn.execute('DELETE FROM indexed')
+            conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                    ('fingerprint', fingerprint))
+        conn.commit()
+
+    def _tableExists(self, name):
+        """Return true if the given table exists in the index DB"""
+        return self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name=?", (name, )
+            ).fetchone() is not None
+
+    def sourcesFor(self, tableName):
+        """Return the sources that can filter models of the given table"""
+        return [source for identifier, source in sorted(self.sources.items())
+                if source.tableName == tableName]
+
+    def ensureIndexed(self, sources, languages):
+        """Make sure documents for the given sources & languages are indexed
+        """
+        conn = self.connection
+        for source in sources:
+            for language in languages:
+                row = conn.execute('''SELECT 1 FROM indexed
+                        WHERE source=? AND language_id=?''',
+                        (source.identifier, language.id)).fetchone()
+                if row is None:
+                    self._index(source, language)
+
+    def _index(self, source, language):
+        """Index all documents for the given source and language"""
+        conn = self.connection
+        cursor = conn.cursor()
+        query = source.queryFactory(self.session, language.id)
+        for entityId, text in query:
+            if not text:
+                continue
+            cursor.execute('''INSERT INTO documents
+                    (source, language_id, entity_id) VALUES (?, ?, ?)''',
+                    (source.identifier, language.id, entityId))
+            cursor.execute('INSERT INTO texts (rowid, text) VALUES (?, ?)',
+                    (cursor.lastrowid, text))
+        cursor.execute('INSERT INTO indexed VALUES (?, ?)',
+                (source.identifier, language.id))
+        conn.commit()
+
+    def matchString(self, words):
+        """Return a MATCH expression for prefixes of all the words, or None
+
+        FTS5 quotes each word and puts the prefix star after the string.
+        FTS3/4 need bare `word*` prefix tokens. Words are split at non-word
+        characters (as the tokenizer does) and lowercased, so they can't be
+        read as operators.
+        """
+        if self.module == 'fts5':
+            return ' '.join('"%s"*' % word.replace('"', '""')
+                    for word in words)
+        words = [part.lower() for word in words
+                for part in re.split(r'\W+', word, flags=re.UNICODE) if part]
+        if not words:
+            return None
+        return ' '.join('%s*' % word for word in words)
+
+    def search(self, text, sources, languages):
+        """Return the set of entity IDs whose documents match `text`
+
+        All words of `text` must match (as prefixes).
+        """
+        words = text.split()
+        if not words:
+            return None
+        sources = list(sources)
+        languages = list(languages)
+        self.ensureIndexed(sources, languages)
+        match = self.matchString(words)
+        if match is None:
+            return set()
+        sql = '''SELECT DISTINCT documents.entity_id
+                FROM texts JOIN documents ON documents.id = texts.rowid
+                WHERE texts MATCH ?
+                AND documents.source IN (%s)
+                AND documents.language_id IN (%s)''' % (
+                    ', '.join('?' * len(sources)),
+                    ', '.join('?' * len(languages)),
+                )
+        args = ([match] + [source.identifier for source in sources] +
+                [language.id for language in languages])
+        return set(row[0] for row in self.connection.execute(sql, args))
+
+class FullTextFilter(object):
+    """A query model filter that only lets through full-text search matches
+    """
+    def __init__(self, index, text, tableName, languages, sources=None):
+        self.index = index
+        self.text = text
+        if sources is None:
+            sources = index.sourcesFor(tableName)
+        self.sources = sources
+        self.languages = languages
+        self._matches = {}
+
+    def matches(self, source):
+        """Return the matching entity IDs of a source (None: no filtering)
+
+        The search runs once per source; the filter is applied again on
+        every resort.
+        """
+        try:
+            return self._matches[source.identifier]
+        except KeyError:
+            ids = self._matches[source.identifier] = self.index.search(
+                    self.text, [source], self.languages)
+            return ids
+
+    def filter(self, builder):
+        """Filter the query in the given QueryBuilder"""
+        if not self.sources:
+            return
+        conditions = []
+        for source in self.sources:
+            ids = self.matches(source)
+            if ids is None:
+                return
+            column = source.filterColumn(builder.mappedClass)
+            conditions.append(idFilterClause(column, ids))
+        builder.query = builder.query.filter(or_(*conditions))
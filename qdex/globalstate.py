@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Global state: the DB session, languages and translator
+
+This doesn't need Qt widgets, so it can be used without a main window.
+"""
+
+from forrin.translator import BaseTranslator
+from pokedex.db import connect, tables, util
+
+from qdex.fulltext import FullTextIndex
+from qdex.resultcache import ResultCache
+from qdex.snapshot import Snapshot
+from qdex.sessionpool import SessionPool
+from qdex.sqlitetuning import applyPragmas
+from qdex.pokedexhelpers import localRelationshipNames
+
+echo = False
+#echo = True
+
+class Translator(BaseTranslator):
+    """Our very own translator"""
+    package = 'qdex'
+
+class Global(object):
+    """Global options for everything relating to the entire app"""
+    def __init__(self,
+            session=None,
+            langs=None,
+            mainwindow=None,
+            resultCache=True,
+            snapshot=True,
+            resultCacheFile=None,
+        ):
+        self.session = session or connect(engine_args=dict(echo=echo))
+        applyPragmas(self.session.bind)
+        self.mainwindow = mainwindow
+        self.resultCacheEnabled = resultCache
+        self.resultCacheFile = resultCacheFile
+        self.snapshotEnabled = snapshot
+        self.langs = langs or [u'en']
+
+    @property
+    def langs(self):
+        """UI language identifiers, by priority (highest first)"""
+        return self._langs
+
+    @langs.setter
+    def langs(self, langs):
+        """UI language identifiers, by priority (highest first)"""
+        self._langs = langs
+        self.languages = [util.get(self.session, tables.Language, lang)
+                for lang in langs]
+        self.translator = Translator(langs)
+        if self.mainwindow:
+            self.mainwindow.retranslate.emit()
+
+    @property
+    def fullTextIndex(self):
+        """The full-text search index, created on first use"""
+        try:
+            return self._fullTextIndex
+        except AttributeError:
+            self._fullTextIndex = FullTextIndex(self.session)
+            return self._fullTextIndex
+
+    @property
+    def resultCache(self):
+        """The persistent result cache, or None if it's disabled"""
+        if not self.resultCacheEnabled:
+            return None
+        try:
+            return self._resultCache
+        except AttributeError:
+            self._resultCache = ResultCache(self.session,
+                    self.resultCacheFile)
+            return self._resultCache
+
+    @property
+    def snapshot(self):
+        """The columnar snapshot, or None if it's disabled or unavailable"""
+        if not self.snapshotEnabled:
+            return None
+        try:
+            return self._snapshot
+        except AttributeError:
+            self._snapshot = Snapshot.open(self.session)
+            return self._snapshot
+
+    @property
+    def sessionPool(self):
+        """Pool of read-only sessions for background workers"""
+        try:
+            return self._sessionPool
+        except AttributeError:
+            self._sessionPool = SessionPool(self.session)
+            return self._sessionPool
+
+    def precomputed(self, dataClass, *args):
+        """Return the shared instance of a precomputed data class
+
+        These are classes like StatMatrix, which load some of the database
+        into arrays; they're created on first use, with the session and any
+        extra arguments (e.g. a generation). There's one instance per set of
+        arguments.
+        """
+        try:
+            precomputed = self._precomputed
+        except AttributeError:
+            precomputed = self._precomputed = {}
+        key = (dataClass, ) + args
+        try:
+            return precomputed[key]
+        except KeyError:
+            instance = precomputed[key] = dataClass(self.session, *args)
+            return instance
+
+    def flushCaches(self):
+        """Save any pending data of the persistent caches"""
+        if self.resultCacheEnabled and hasattr(self, '_resultCache'):
+            self._resultCache.flush()
+
+    def expireTranslations(self):
+        """Expire strings loaded in the game language
+
+        Objects stay in the session; only their game-language relationships
+        are reloaded when next accessed. No SQL is issued here.
+        """
+        for obj in list(self.session.identity_map.values()):
+            names = localRelationshipNames(type(obj))
+            if names:
+                self.session.expire(obj, names)
+
+    def name(self, dbObject):
+        """Get an object's name"""
+        for language in self.languages:
+            try:
+                return dbObject.name_map[language]
+            except KeyError:
+                pass
+        return dbObject.identifier
+
+    def tr(self, stringMap, fallbackLanguage=None):
+        """Get an appropriate string from string_map.
+
+        Falls back to fallback_language, or the game language by default,
+        but uglifies the string if it does.
+        """
+        for language in self.languages:
+            try:
+                return stringMap[language]
+            except KeyError:
+                pass
+        if fallbackLanguage == None:
+            fallbackLanguage = util.get(self.session, tables.Language,
+                    id=self.session.default_language_id)
+        try:
+            return '[%s: %s]' % (
+                    fallbackLanguage.identifier,
+                    stringMap[fallbackLanguage],
+                )
+        except KeyError:
+            _ = self.translator
+            return _('[translation not available]')
+
+    def registerRetranslate(self, slot):
+        """Connect slot to the mainwindow's retranslate signal"""
+        if self.mainwindow:
+            self.mainwindow.retranslate.connect(slot)
+
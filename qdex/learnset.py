@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Bitset index of learnable moves, and the Pokémon × ability index
+
+pokemon_moves is by far the biggest table in the pokedex database, but
+whether a Pokémon can learn a move by some method in some version group is
+just one bit. LearnsetIndex keeps a bitset over Pokémon × move for each
+(version group, learn method) pair, built in one bulk query and persisted
+in qdex's cache directory. "Can X learn Y", counts and filters are then
+answered with bit operations on whole arrays.
+
+Needs NumPy.
+"""
+
+import os
+
+from sqlalchemy.sql.expression import select
+
+from pokedex.db import tables
+
+from qdex import cache_filename
+from qdex.pokedexhelpers import databaseFingerprint
+from qdex.precomputed import numpy, positionsIn, idArray, idFilterClause
+
+# Number of set bits in each byte value
+if numpy is not None:
+    popcounts = numpy.array([bin(i).count('1') for i in range(256)],
+            dtype=numpy.int32)
+
+class LearnsetIndex(object):
+    """Learnable moves as packed bitsets
+
+    `bits[k]` is the bitset for the k-th (version group ID, method ID)
+    pair in `keys`: a row for each Pokémon (in `pokemonIds` order) with a
+    bit for each move (in `moveIds` order, packed eight to a byte).
+    """
+    version = 1
+
+    def __init__(self, session, filename=None):
+        if filename is None:
+            filename = cache_filename('learnsets.npz')
+        fingerprint = '%s;%s' % (databaseFingerprint(session), self.version)
+        if not self._load(filename, fingerprint):
+            self._build(session)
+            self._save(filename, fingerprint)
+        self.methodIds = dict((method.identifier, method.id) for method in
+                session.query(tables.PokemonMoveMethod))
+        self.versionGroupIds = dict((group.identifier, group.id) for group in
+                session.query(tables.VersionGroup))
+        self._unions = {}
+
+    def _load(self, filename, fingerprint):
+        """Load the index from disk; return false if it's missing or stale
+        """
+        try:
+            data = numpy.load(filename)
+            if data['fingerprint'].item() != fingerprint:
+                return False
+            self.pokemonIds = data['pokemonIds']
+            self.moveIds = data['moveIds']
+            self.keys = data['keys']
+            self.bits = data['bits']
+        except (IOError, ValueError, KeyError):
+            return False
+        return True
+
+    def _save(self, filename, fingerprint):
+        """Save the index to disk
+
+        Warmup worker processes may build the index at the same time, so
+        each writes its own temporary file before renaming it into place.
+        """
+        temporary = '%s.%s.tmp.npz' % (filename, os.getpid())
+        numpy.savez(temporary, fingerprint=numpy.array(fingerprint),
+                pokemonIds=self.pokemonIds, moveIds=self.moveIds,
+                keys=self.keys, bits=self.bits)
+        os.rename(temporary, filename)
+
+    def _build(self, session):
+        """Build the index from pokemon_moves, in one query"""
+        self.pokemonIds = idArray(session.query(tables.Pokemon.id)
+                .order_by(tables.Pokemon.id))
+        self.moveIds = idArray(session.query(tables.Move.id)
+                .order_by(tables.Move.id))
+        table = tables.PokemonMove.__table__
+        query = select([table.c.version_group_id,
+                table.c.pokemon_move_method_id, table.c.pokemon_id,
+                table.c.move_id]).distinct()
+        rows = numpy.array(session.execute(query).fetchall(),
+                dtype=numpy.int64).reshape(-1, 4)
+        # Number the (version group, method) pairs
+        methodCount = rows[:, 1].max() + 1 if len(rows) else 1
+        keys, keyIndices = numpy.unique(rows[:, 0] * methodCount + rows[:, 1],
+                return_inverse=True)
+        self.keys = numpy.zeros((len(keys), 2), dtype=numpy.int64)
+        self.keys[keyIndices] = rows[:, :2]
+        # Set the bits in the packed array directly; packbits puts the first
+        # move of each byte in its most significant bit
+        movePositions = positionsIn(self.moveIds, rows[:, 3])
+        self.bits = numpy.zeros((len(keys), len(self.pokemonIds),
+                (len(self.moveIds) + 7) // 8), dtype=numpy.uint8)
+        numpy.bitwise_or.at(self.bits, (keyIndices,
+                    positionsIn(self.pokemonIds, rows[:, 2]),
+                    movePositions // 8),
+                numpy.left_shift(1, 7 - movePositions % 8).astype(
+                    numpy.uint8))
+
+    def union(self, versionGroup=None, method=None):
+        """Return the bitset of moves learnable in any of the given ways
+
+        `versionGroup` and `method` are identifiers; None means any.
+        """
+        key = versionGroup, method
+        try:
+            return self._unions[key]
+        except KeyError:
+            mask = numpy.ones(len(self.keys), dtype=bool)
+            if versionGroup is not None:
+                groupId = self.versionGroupIds.get(versionGroup, -1)
+                mask &= self.keys[:, 0] == groupId
+            if method is not None:
+                mask &= self.keys[:, 1] == self.methodIds.get(method, -1)
+            if mask.any():
+                bits = numpy.bitwise_or.reduce(self.bits[mask], axis=0)
+            else:
+                bits = numpy.zeros(self.bits.shape[1:], dtype=numpy.uint8)
+            self._unions[key] = bits
+            return bits
+
+    def _moveBit(self, bits, moveId):
+        """Return the bit column for a move, as a bool array over Pokémon"""
+        if moveId is None:
+            return numpy.zeros(len(bits), dtype=bool)
+        position = positionsIn(self.moveIds, [moveId])[0]
+        if position >= len(self.moveIds) or self.moveIds[position] != moveId:
+            return numpy.zeros(len(bits), dtype=bool)
+        byte, bit = divmod(position, 8)
+        return (bits[:, byte] >> (7 - bit)) & 1 == 1
+
+    def canLearn(self, pokemonIds, moveId, versionGroup=None, method=None):
+        """Return a bool array: whether each Pokémon can learn the move"""
+        learners = self._moveBit(self.union(versionGroup, method), moveId)
+        return learners[positionsIn(self.pokemonIds, pokemonIds)]
+
+    def learnMethods(self, pokemonId, moveId, versionGroup=None):
+        """Return IDs of the methods by which a Pokémon can learn a move"""
+        return sorted(methodId for identifier, methodId in
+                self.methodIds.items()
+                if self.canLearn([pokemonId], moveId, versionGroup,
+                    identifier)[0])
+
+    def learners(self, moveId, versionGroup=None, method=None):
+        """Return the IDs of Pokémon that can learn a move"""
+        learners = self._moveBit(self.union(versionGroup, method), moveId)
+        return self.pokemonIds[learners]
+
+    def moveCounts(self, pokemonIds, versionGroup=None, method=None):
+        """Return the number of moves each Pokémon can learn"""
+        bits = self.union(versionGroup, method)
+        counts = popcounts[bits].sum(axis=1)
+        return counts[positionsIn(self.pokemonIds, pokemonIds)]
+
+    def learnerCounts(self, moveIds, versionGroup=None, method=None):
+        """Return the number of Pokémon that can learn each move"""
+        bits = numpy.unpackbits(self.union(versionGroup, method), axis=1)
+        counts = bits[:, :len(self.moveIds)].sum(axis=0)
+        return counts[positionsIn(self.moveIds, moveIds)]
+
+class LearnsetFilter(object):
+    """Filter for Pokémon (form) models: only Pokémon that can learn a move
+
+    `moveId` is a move ID; `versionGroup` and `method` are identifiers, or
+    None for any.
+    """
+    def __init__(self, index, moveId, versionGroup=None, method=None):
+        self.index = index
+        self.moveId = moveId
+        self.versionGroup = versionGroup
+        self.method = method
+
+    def filter(self, builder):
+        ids = self.index.learners(self.moveId, self.versionGroup, self.method)
+        if builder.mappedClass is tables.Pokemon:
+            column = builder.mappedClass.id
+        else:
+            column = builder.mappedClass.pokemon_id
+        builder.query = builder.query.filter(idFilterClause(column, ids))
+
+class AbilityIndex(object):
+    """Pokémon × ability table, as a bool array
+
+    `hidden` is True where the ability is a hidden ability of the Pokémon;
+    `has` is True where the Pokémon has the ability in any slot.
+    Rows are in `pokemonIds` order, columns in `abilityIds` order.
+    `speciesIds` holds the species of each Pokémon.
+    """
+    def __init__(self, session):
+        pokemon = numpy.array(session.query(tables.Pokemon.id,
+                tables.Pokemon.species_id).order_by(tables.Pokemon.id).all(),
+                dtype=numpy.int64).reshape(-1, 2)
+        self.pokemonIds = pokemon[:, 0]
+        self.speciesIds = pokemon[:, 1]
+        self.abilityIds = idArray(session.query(tables.Ability.id)
+                .order_by(tables.Ability.id))
+        pokemonAbility = tables.PokemonAbility
+        # Older pokedex versions call hidden abilities "dream" abilities
+        hiddenColumn = getattr(pokemonAbility, 'is_hidden', None)
+        if hiddenColumn is None:
+            hiddenColumn = pokemonAbility.is_dream
+        rows = numpy.array(session.query(pokemonAbility.pokemon_id,
+                pokemonAbility.ability_id, hiddenColumn).all(),
+                dtype=numpy.int64).reshape(-1, 3)
+        shape = len(self.pokemonIds), len(self.abilityIds)
+        self.has = numpy.zeros(shape, dtype=bool)
+        self.hidden = numpy.zeros(shape, dtype=bool)
+        positions = (positionsIn(self.pokemonIds, rows[:, 0]),
+                positionsIn(self.abilityIds, rows[:, 1]))
+        self.has[positions] = True
+        self.hidden[positions] = rows[:, 2] != 0
+
+    def owners(self, abilityId, hidden=None):
+        """Return a bool array over Pokémon: who has the ability
+
+        `hidden` can be True or False to only count hidden or normal
+        abilities; None counts both.
+        """
+        position = positionsIn(self.abilityIds, [abilityId])[0]
+        has = self.has[:, position]
+        if hidden is None:
+            return has
+        elif hidden:
+            return has & self.hidden[:, position]
+        else:
+            return has & ~self.hidden[:, position]
+
+    def ownerSpecies(self, abilityId, hidden=None):
+        """Return the IDs of species with the ability, in ID order"""
+        return numpy.unique(self.speciesIds[self.owners(abilityId, hidden)])
+
+    def ownerCounts(self, abilityIds, hidden=None):
+        """Return the number of Pokémon with each ability"""
+        if hidden is None:
+            matrix = self.has
+        elif hidden:
+            matrix = self.has & self.hidden
+        else:
+            matrix = self.has & ~self.hidden
+        return matrix.sum(axis=0)[positionsIn(self.abilityIds, abilityIds)]
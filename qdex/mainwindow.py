@@ -11,83 +11,15 @@ import os
 from PySide import QtCore, QtGui
 Qt = QtCore.Qt
 
-from forrin.translator import BaseTranslator
-from pokedex.db import connect, tables, util
+from pokedex.db import tables
 
 from qdex.queryview import QueryView
 from qdex.metamodel import MetaModel, MetaModelView
+from qdex.export import exportModel
+from qdex.globalstate import Global
+from qdex.warmup import Warmup
 from qdex import resource_filename
 
-echo = False
-#echo = True
-
-class Translator(BaseTranslator):
-    """Our very own translator"""
-    package = 'qdex'
-
-class Global(object):
-    """Global options for everything relating to the entire app"""
-    def __init__(self,
-            session=None,
-            langs=None,
-            mainwindow=None,
-        ):
-        self.session = session or connect(engine_args=dict(echo=echo))
-        self.mainwindow = mainwindow
-        self.langs = langs or [u'en']
-
-    @property
-    def langs(self):
-        """UI language identifiers, by priority (highest first)"""
-        return self._langs
-
-    @langs.setter
-    def langs(self, langs):
-        """UI language identifiers, by priority (highest first)"""
-        self._langs = langs
-        self.languages = [util.get(self.session, tables.Language, lang)
-                for lang in langs]
-        self.translator = Translator(langs)
-        if self.mainwindow:
-            self.mainwindow.retranslate.emit()
-
-    def name(self, dbObject):
-        """Get an object's name"""
-        for language in self.languages:
-            try:
-                return dbObject.name_map[language]
-            except KeyError:
-                pass
-        return dbObject.identifier
-
-    def tr(self, stringMap, fallbackLanguage=None):
-        """Get an appropriate string from string_map.
-
-        Falls back to fallback_language, or the game language by default,
-        but uglifies the string if it does.
-        """
-        for language in self.languages:
-            try:
-                return stringMap[language]
-            except KeyError:
-                pass
-        if fallbackLanguage == None:
-            fallbackLanguage = util.get(self.session, tables.Language,
-                    id=self.session.default_language_id)
-        try:
-            return '[%s: %s]' % (
-                    fallbackLanguage.identifier,
-                    stringMap[fallbackLanguage],
-                )
-        except KeyError:
-            _ = self.translator
-            return _('[translation not available]')
-
-    def registerRetranslate(self, slot):
-        """Connect slot to the mainwindow's retranslate signal"""
-        if self.mainwindow:
-            self.mainwindow.retranslate.connect(slot)
-
 class MainWindow(QtGui.QMainWindow):
     """The main pokédex window"""
     retranslate = QtCore.Signal()
@@ -96,6 +28,7 @@ class MainWindow(QtGui.QMainWindow):
         super(MainWindow, self).__init__()
         self.g = Global(mainwindow=self, **globalArgs)
         self.g.registerRetranslate(self.retranslateUi)
+        QtGui.QApplication.instance().aboutToQuit.connect(self.g.flushCaches)
         icon = resource_filename('pokedex-media', 'items/poke-ball.png')
         self.setWindowIcon(QtGui.QIcon(icon))
 
@@ -131,6 +64,15 @@ class MainWindow(QtGui.QMainWindow):
 
         self.retranslateUi()
 
+        # Prepare the other lists in the background once the window is shown
+        QtCore.QTimer.singleShot(0, self.startWarmup)
+
+    def startWarmup(self):
+        """Start preloading the standard lists, if it can help"""
+        if Warmup.worthwhile(self.g):
+            self.warmup = Warmup(self.g)
+            self.warmup.start()
+
     def retranslateUi(self):
         """Called when the UI or game language changes
         """
@@ -144,6 +86,9 @@ class MainWindow(QtGui.QMainWindow):
         fileMenu = self.menuBar().addMenu(_(u"&Pokédex"))
         icon = QtGui.QIcon(resource_filename('qdex', 'icons/star.png'))
         self.addMenuItem(fileMenu, _(u'&About…'), self.about, icon=icon)
+        icon = QtGui.QIcon(resource_filename('qdex', 'icons/table-export.png'))
+        self.addMenuItem(fileMenu, _(u'&Export List…'), self.exportList,
+                icon=icon)
         fileMenu.addSeparator()
         icon = QtGui.QIcon(resource_filename('qdex', 'icons/cross-button.png'))
         self.addMenuItem(fileMenu, _('&Exit'), QtGui.QApplication.exit,
@@ -169,9 +114,8 @@ class MainWindow(QtGui.QMainWindow):
         for language in query:
             def _scope(language):
                 def _retranslate():
-                    self.g.session.expunge_all()
                     self.g.session.default_language_id = language.id
-                    self.g.langs = self.g.langs
+                    self.g.expireTranslations()
                     self.retranslate.emit()
                 name = self.g.name(language)
                 icon = os.path.join('flags', language.iso3166 + '.png')
@@ -206,6 +150,38 @@ class MainWindow(QtGui.QMainWindow):
                     )
             _scope(lang)
 
+    def exportList(self):
+        """Export the currently shown list to a file"""
+        _ = self.g.translator
+        model = self.mainlistview.result_view.model()
+        if not model:
+            return
+        filename, selectedFilter = QtGui.QFileDialog.getSaveFileName(self,
+                _(u'Export List'), '', ';;'.join([
+                        _(u'CSV files (*.csv)'),
+                        _(u'JSON Lines files (*.jsonl)'),
+                        _(u'qdex columnar files (*.qcol)'),
+                    ]))
+        if not filename:
+            return
+        progressDialog = QtGui.QProgressDialog(_(u'Exporting…'),
+                _(u'Cancel'), 0, model.rowCount(), self)
+        progressDialog.setWindowModality(Qt.WindowModal)
+        def progress(done, total):
+            progressDialog.setValue(done)
+            QtGui.QApplication.processEvents()
+            return not progressDialog.wasCanceled()
+        QtGui.QApplication.setOverrideCursor(QtGui.QCursor(Qt.WaitCursor))
+        try:
+            exportModel(model, filename, progress=progress)
+        except ValueError:
+            QtGui.QMessageBox.warning(self, _(u'Export List'),
+                    _(u'Unknown file type. Use a .csv, .jsonl or .qcol '
+                        u'extension.'))
+        finally:
+            QtGui.QApplication.restoreOverrideCursor()
+            progressDialog.close()
+
     def about(self):
         """Create and show the About box
         """
@@ -8,7 +8,7 @@ Metamodel: Contains other models
 
 import os.path
 
-from PySide import QtCore, QtGui
+from PySide import QtCore
 Qt = QtCore.Qt
 
 from qdex.querymodel import TableModel
@@ -16,11 +16,35 @@ from qdex.loadableclass import LoadableMetaclass
 from qdex import yaml
 from qdex import resource_filename
 
+def loadDefaultMetamodel():
+    """Load the representation of the default lists from metamodel.yaml"""
+    defaultfile = open(resource_filename('qdex', 'metamodel.yaml'))
+    try:
+        return yaml.load(defaultfile)
+    finally:
+        defaultfile.close()
+
+def modelRepresentations(representation=None):
+    """Yield (name, model representation) for all models in a metamodel
+
+    Works on the dict representation, so no widgets or icons are created.
+    By default, the lists from metamodel.yaml are used.
+    """
+    if representation is None:
+        representation = loadDefaultMetamodel()
+    model = representation.get('model')
+    if model:
+        yield representation['name'], model
+    for child in representation.get('children', ()):
+        for item in modelRepresentations(child):
+            yield item
+
 def MetaModelView(parent=None):
     """A view for the meta model
 
     (just a factory function for now)
     """
+    from PySide import QtGui
     view = QtGui.QTreeView(parent)
     view.setHeaderHidden(True)
     view.setRootIsDecorated(False)
@@ -31,11 +55,12 @@ class MetamodelItem(object):
     """
     __metaclass__ = LoadableMetaclass
 
-    model = None
+    _model = None
 
     def __init__(self, name, icon=None, children=(), g=None, model=None):
         self.parent = None
         self.icon = icon
+        from PySide import QtGui
         if isinstance(icon, basestring):
             self._icon = QtGui.QIcon(icon)
         elif isinstance(icon, list):
@@ -46,11 +71,18 @@ class MetamodelItem(object):
         self.name = name
         self.g = g
         self.children = [MetamodelItem.load(child, g=g) for child in children]
-        if model:
-            self.model = TableModel.load(model, g=g)
+        # The model is created when first needed
+        self.modelRepresentation = model
         for child in self.children:
             child.parent = self
 
+    @property
+    def model(self):
+        """The item's query model, or None"""
+        if self._model is None and self.modelRepresentation:
+            self._model = TableModel.load(self.modelRepresentation, g=self.g)
+        return self._model
+
     def data(self, model, role):
         """Return the data to display for this item
 
@@ -69,7 +101,8 @@ class MetamodelItem(object):
                 name=self.name,
                 icon=self.icon,
                 children=[child.save() for child in self.children],
-                model=None if self.model is None else self.model.save(),
+                model=(self.modelRepresentation if self._model is None
+                    else self._model.save()),
             )
 MetamodelItem.defaultClassForLoad = MetamodelItem
 
@@ -81,8 +114,7 @@ class MetaModel(QtCore.QAbstractItemModel):
         self.g = g
         self.g.registerRetranslate(self.retranslated)
         if model is None:
-            defaultfile = open(resource_filename('qdex', 'metamodel.yaml'))
-            model = yaml.load(defaultfile)
+            model = loadDefaultMetamodel()
         self.root = MetamodelItem.load(model, g=g)
         # XXX: Only have one category of lists now; show a flat list
         self.root = self.root.children[0]
@@ -137,6 +169,7 @@ class MetaModel(QtCore.QAbstractItemModel):
     def setModelOnView(self, index, view):
         """Set an index's model (if any) on a view
         """
+        from PySide import QtGui
         self.g.mainwindow.setCursor(QtGui.QCursor(Qt.WaitCursor))
         try:
             model = index.data(Qt.UserRole).model
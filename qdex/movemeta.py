@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Move meta data and flags, as packed per-move arrays
+
+The integer columns of move_meta are loaded into one array each, stat
+changes into a move × stat array, and the move flags (a many-to-many
+table) into one integer bitmask per move. Flag combinations are then
+matched with bitwise operations.
+
+Needs NumPy.
+"""
+
+from sqlalchemy.sql.expression import select
+
+from pokedex.db import tables
+
+from qdex.precomputed import numpy, positionsIn, idArray, idFilterClause
+
+def ranks(values, nulls):
+    """Turn values into int ranks, preserving order; nulls become -1"""
+    result = numpy.empty(len(values), dtype=numpy.int64)
+    result[nulls] = -1
+    unique, inverse = numpy.unique(values[~nulls], return_inverse=True)
+    result[~nulls] = inverse
+    return result
+
+class MoveMetaTable(object):
+    """Meta data, stat changes and flags of all moves
+
+    Arrays have an entry for each move, in `moveIds` order. `values` and
+    `nulls` map move_meta column names to arrays; `statChanges` has a column
+    for each stat (in `statIdentifiers` order); `flagMasks` has bit i set
+    if the move has the i-th flag of `flagIdentifiers`.
+    """
+    def __init__(self, session):
+        self.moveIds = idArray(session.query(tables.Move.id)
+                .order_by(tables.Move.id))
+        count = len(self.moveIds)
+
+        table = tables.MoveMeta.__table__
+        columns = [column for column in table.c if column.name != 'move_id']
+        query = select([table.c.move_id] + columns)
+        rows = session.execute(query).fetchall()
+        positions = positionsIn(self.moveIds,
+                numpy.array([row[0] for row in rows], dtype=numpy.int64))
+        self.values = {}
+        self.nulls = {}
+        for index, column in enumerate(columns):
+            values = numpy.zeros(count, dtype=numpy.int64)
+            nulls = numpy.ones(count, dtype=bool)
+            columnValues = [row[index + 1] for row in rows]
+            present = numpy.array([value is not None
+                    for value in columnValues], dtype=bool)
+            values[positions[present]] = [value
+                    for value in columnValues if value is not None]
+            nulls[positions[present]] = False
+            self.values[column.name] = values
+            self.nulls[column.name] = nulls
+
+        stats = session.query(tables.Stat).order_by(tables.Stat.id).all()
+        self.statIdentifiers = [stat.identifier for stat in stats]
+        statIds = numpy.array([stat.id for stat in stats], dtype=numpy.int64)
+        self.statChanges = numpy.zeros((count, len(stats)), dtype=numpy.int8)
+        statChange = tables.MoveMetaStatChange
+        rows = numpy.array(session.query(statChange.move_id,
+                statChange.stat_id, statChange.change).all(),
+                dtype=numpy.int64).reshape(-1, 3)
+        self.statChanges[positionsIn(self.moveIds, rows[:, 0]),
+                positionsIn(statIds, rows[:, 1])] = rows[:, 2]
+
+        # Newer pokedex versions renamed MoveFlagType to MoveFlag
+        flagClass = self.flagClass = (getattr(tables, 'MoveFlag', None) or
+                tables.MoveFlagType)
+        flags = session.query(flagClass).order_by(flagClass.id).all()
+        self.flagIdentifiers = [flag.identifier for flag in flags]
+        self.flagIds = numpy.array([flag.id for flag in flags],
+                dtype=numpy.int64)
+        flagMap = tables.MoveFlagMap.__table__
+        flagColumn = [column for column in flagMap.c
+                if column.name != 'move_id'][0]
+        rows = numpy.array(session.execute(select([flagMap.c.move_id,
+                flagColumn])).fetchall(), dtype=numpy.int64).reshape(-1, 2)
+        bits = numpy.left_shift(numpy.uint64(1),
+                positionsIn(self.flagIds, rows[:, 1]).astype(numpy.uint64))
+        self.flagMasks = numpy.zeros(count, dtype=numpy.uint64)
+        numpy.bitwise_or.at(self.flagMasks,
+                positionsIn(self.moveIds, rows[:, 0]), bits)
+
+    def movePositions(self, moveIds):
+        """Return the positions of an array of move IDs"""
+        return positionsIn(self.moveIds, moveIds)
+
+    def metaValues(self, attr, moveIds):
+        """Return (values, nulls) arrays of a move_meta column"""
+        positions = self.movePositions(moveIds)
+        try:
+            return self.values[attr][positions], self.nulls[attr][positions]
+        except KeyError:
+            # Not in this version of the database
+            return (numpy.zeros(len(positions), dtype=numpy.int64),
+                    numpy.ones(len(positions), dtype=bool))
+
+    def metaRanks(self, attr, moveIds):
+        """Return sort ranks of a move_meta column; nulls get -1"""
+        return ranks(*self.metaValues(attr, moveIds))
+
+    def statChangesOf(self, stat, moveIds):
+        """Return the changes of a stat (by identifier) the moves cause"""
+        positions = self.movePositions(moveIds)
+        try:
+            column = self.statIdentifiers.index(stat)
+        except ValueError:
+            return numpy.zeros(len(positions), dtype=numpy.int8)
+        return self.statChanges[positions, column]
+
+    def flagMask(self, identifiers):
+        """Return the bitmask of the given flags (by identifier)"""
+        mask = numpy.uint64(0)
+        for identifier in identifiers:
+            position = self.flagIdentifiers.index(identifier)
+            mask |= numpy.left_shift(numpy.uint64(1), numpy.uint64(position))
+        return mask
+
+    def flagsOf(self, moveIds):
+        """Return the flag bitmasks of the given moves"""
+        return self.flagMasks[self.movePositions(moveIds)]
+
+    def hasFlags(self, moveIds, identifiers, anyOf=False):
+        """Return a bool array: whether each move has the flags
+
+        By default, moves need all of the flags; with `anyOf`, one is enough.
+        """
+        mask = self.flagMask(identifiers)
+        masked = self.flagsOf(moveIds) & mask
+        if anyOf:
+            return masked != 0
+        else:
+            return masked == mask
+
+    def flagCounts(self, moveIds):
+        """Return the number of flags each move has"""
+        masks = self.flagsOf(moveIds)
+        counts = numpy.zeros(len(masks), dtype=numpy.int64)
+        for position in range(len(self.flagIdentifiers)):
+            bits = (masks >> numpy.uint64(position)) & numpy.uint64(1)
+            counts += bits.astype(numpy.int64)
+        return counts
+
+class MoveFlagFilter(object):
+    """Filter for move models: only moves with the given flags
+
+    `identifiers` are flag identifiers; by default, moves need all of them,
+    with `anyOf` one is enough.
+    """
+    def __init__(self, table, identifiers, anyOf=False):
+        self.table = table
+        self.identifiers = identifiers
+        self.anyOf = anyOf
+
+    def filter(self, builder):
+        table = self.table
+        matches = table.hasFlags(table.moveIds, self.identifiers, self.anyOf)
+        builder.query = builder.query.filter(idFilterClause(
+                builder.mappedClass.id, table.moveIds[matches]))
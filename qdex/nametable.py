@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Pivoted name table: names of all entities of a table, in all languages
+
+Built with one query over the table's translations, so any number of
+foreign name columns display and sort without per-cell loads or per-language
+joins.
+
+Needs NumPy.
+"""
+
+from pokedex.db import tables
+
+from qdex.precomputed import numpy, positionsIn, idArray
+from qdex.pokedexhelpers import getTranslationClass
+
+class NameTable(object):
+    """Names of all entities of a mapped class, by language
+
+    `names` has a row for each entity (in `ids` order) and a column for
+    each language (in `languageIdentifiers` order); missing names are None.
+    `identifiers` holds the entities' identifiers, in `ids` order.
+    """
+    def __init__(self, session, mappedClass):
+        rows = session.query(mappedClass.id, mappedClass.identifier
+                ).order_by(mappedClass.id).all()
+        self.ids = numpy.array([row[0] for row in rows], dtype=numpy.int64)
+        self.identifiers = [row[1] for row in rows]
+        languages = session.query(tables.Language).order_by(
+                tables.Language.id).all()
+        self.languageIdentifiers = [language.identifier
+                for language in languages]
+        languageIds = numpy.array([language.id for language in languages],
+                dtype=numpy.int64)
+
+        translationClass = getTranslationClass(mappedClass, 'name')
+        rows = session.query(translationClass.foreign_id,
+                translationClass.local_language_id,
+                translationClass.name).all()
+        self.names = numpy.empty((len(self.ids), len(languages)),
+                dtype=object)
+        if rows:
+            keys = numpy.array([row[:2] for row in rows], dtype=numpy.int64)
+            self.names[positionsIn(self.ids, keys[:, 0]),
+                    positionsIn(languageIds, keys[:, 1])] = numpy.array(
+                        [row[2] for row in rows], dtype=object)
+        self._ranks = {}
+
+    def languagePosition(self, identifier):
+        """Return the column of a language (by identifier), or None"""
+        try:
+            return self.languageIdentifiers.index(identifier)
+        except ValueError:
+            return None
+
+    def namesIn(self, identifier, ids):
+        """Return names of the given entities in a language (or Nones)"""
+        position = self.languagePosition(identifier)
+        if position is None:
+            return [None] * len(ids)
+        return self.names[positionsIn(self.ids, ids), position]
+
+    def displayNames(self, identifiers, ids):
+        """Return names of the given entities, like Global.name does
+
+        Each name is taken from the first of the languages (identifiers)
+        that has it; entities without a name get their identifier.
+        """
+        positions = positionsIn(self.ids, ids)
+        result = [None] * len(positions)
+        for identifier in identifiers:
+            position = self.languagePosition(identifier)
+            if position is None:
+                continue
+            names = self.names[positions, position]
+            result = [name if name is not None else new
+                    for name, new in zip(result, names)]
+        return [name if name is not None else self.identifiers[position]
+                for name, position in zip(result, positions)]
+
+    def ranks(self, identifier, ids):
+        """Return sort ranks of names in a language; missing names get -1"""
+        try:
+            allRanks = self._ranks[identifier]
+        except KeyError:
+            position = self.languagePosition(identifier)
+            allRanks = numpy.empty(len(self.ids), dtype=numpy.int64)
+            allRanks.fill(-1)
+            if position is not None:
+                names = self.names[:, position]
+                present = numpy.array([name is not None for name in names],
+                        dtype=bool)
+                values = numpy.array([name for name in names[present]],
+                        dtype=numpy.unicode_)
+                unique, inverse = numpy.unique(values, return_inverse=True)
+                allRanks[present] = inverse
+            self._ranks[identifier] = allRanks
+        return allRanks[positionsIn(self.ids, ids)]
@@ -9,8 +9,15 @@ There should be a better way to do what they are used for... or they should be
 put in pokedex :)
 """
 
+import os
+import json
+
 from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.types import Integer
+from sqlalchemy.orm import class_mapper
+from sqlalchemy.orm.properties import RelationshipProperty
+
+from qdex import cache_filename
 
 def getTranslationClass(mappedClass, attrName):
     """Get the translation class associated with the given translated attibute
@@ -22,5 +29,68 @@ def getTranslationClass(mappedClass, attrName):
     else:
         raise ValueError("Translated column %s not found" % attrName)
 
+def localRelationshipNames(mappedClass, _memo={}):
+    """Get names of relationships that load strings in the game language
+
+    These are the `*_local` relationships pokedex sets up for translated
+    columns.
+    """
+    try:
+        return _memo[mappedClass]
+    except KeyError:
+        names = _memo[mappedClass] = [prop.key
+                for prop in class_mapper(mappedClass).iterate_properties
+                if isinstance(prop, RelationshipProperty)
+                    and prop.key.endswith('_local')]
+        return names
+
 default_language_param = bindparam('_default_language_id', value='dummy',
         type_=Integer, required=True)
+
+def _fileFingerprint(session):
+    """Return the database file's fingerprint (see databaseFingerprint)"""
+    url = session.bind.url
+    if url.drivername.startswith('sqlite') and url.database:
+        filename = os.path.abspath(url.database)
+        stat = os.stat(filename)
+        return '%s:%s:%s' % (filename, stat.st_size, int(stat.st_mtime))
+    else:
+        return str(url)
+
+def _fingerprintAliases():
+    """Return the file name and contents of the fingerprint alias file"""
+    filename = cache_filename('fingerprints.json')
+    try:
+        with open(filename) as aliasFile:
+            return filename, json.load(aliasFile)
+    except (IOError, ValueError):
+        return filename, {}
+
+def databaseFingerprint(session):
+    """Return a string that changes whenever the pokedex database is reloaded
+
+    For SQLite, this is based on the database file's path, size and
+    modification time. For other engines, only the URL is used.
+    Changes made by qdex itself that don't touch the data (like the indexes
+    of sqlitetuning) are recorded with keepFingerprint, so they don't
+    invalidate the caches.
+    """
+    fingerprint = _fileFingerprint(session)
+    filename, aliases = _fingerprintAliases()
+    return aliases.get(fingerprint, fingerprint)
+
+def keepFingerprint(session, fingerprint):
+    """Make the database keep a fingerprint after a change to its file
+
+    Call this after changing the file without changing the data;
+    `fingerprint` is what databaseFingerprint returned before the change.
+    """
+    newFingerprint = _fileFingerprint(session)
+    if newFingerprint == fingerprint:
+        return
+    filename, aliases = _fingerprintAliases()
+    aliases[newFingerprint] = fingerprint
+    temporaryName = '%s.%s.tmp' % (filename, os.getpid())
+    with open(temporaryName, 'w') as aliasFile:
+        json.dump(aliases, aliasFile)
+    os.rename(temporaryName, filename)
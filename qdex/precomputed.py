@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Helpers for precomputed data classes
+
+Precomputed data classes (like StatMatrix) load part of the database into
+NumPy arrays once, and are shared through Global.precomputed(). Columns
+backed by them display, sort and aggregate whole arrays at a time.
+
+NumPy is optional; without it, these columns are unavailable.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sqlalchemy.sql.expression import case, literal_column
+
+from pokedex.db import tables
+
+def positionsIn(sortedIds, ids):
+    """Return the positions of `ids` in the ascending array `sortedIds`
+
+    All of the ids must be present.
+    """
+    return numpy.searchsorted(sortedIds, ids)
+
+def idArray(query):
+    """Return a NumPy array of the single-column results of a query"""
+    return numpy.array([id for (id, ) in query], dtype=numpy.int64)
+
+def valueCase(idColumn, ids, values):
+    """Return a CASE expression mapping ids to values, for sorting in SQL
+
+    Values are inlined rather than bound, to stay below SQLite's limit on
+    the number of bound parameters. Ids with the same value share one
+    WHEN ... IN (...), so the statement grows by a few bytes per id (the
+    Pokémon columns map Pokémon, not form, ids: about 1000 of them), far
+    below SQLite's default 1 MB statement limit. Non-finite values (NaN)
+    have no SQL literal; they map to NULL.
+    """
+    values = numpy.asarray(values, dtype=float)
+    ids = numpy.asarray(ids, dtype=numpy.int64)
+    finite = numpy.isfinite(values)
+    unique, inverse = numpy.unique(values[finite], return_inverse=True)
+    finiteIds = ids[finite]
+    whens = []
+    for index, value in enumerate(unique):
+        if value == int(value):
+            literal = str(int(value))
+        else:
+            literal = repr(float(value))
+        whens.append((idFilterClause(idColumn, finiteIds[inverse == index]),
+                literal_column(literal)))
+    if not whens:
+        return literal_column('NULL')
+    return case(whens, else_=None)
+
+def nanRanks(values):
+    """Turn float values into int sort ranks; NaN becomes -1
+
+    -1 is what other sort keys use for nulls, and it's also what valueCase
+    gets, so SQL and in-memory sorting put missing values in the same place.
+    """
+    values = numpy.asarray(values, dtype=float)
+    ranks = numpy.empty(len(values), dtype=numpy.int64)
+    missing = numpy.isnan(values)
+    ranks[missing] = -1
+    unique, inverse = numpy.unique(values[~missing], return_inverse=True)
+    ranks[~missing] = inverse
+    return ranks
+
+def idFilterClause(idColumn, ids):
+    """Return an IN clause matching the given ids, for filtering in SQL
+
+    Like in valueCase, the ids are inlined rather than bound.
+    """
+    return idColumn.in_([literal_column(str(int(id))) for id in ids] or
+            [literal_column('-1')])
+
+class FormPokemonIndex(object):
+    """Maps Pokémon form IDs to Pokémon IDs"""
+    def __init__(self, session):
+        query = session.query(tables.PokemonForm.id,
+                tables.PokemonForm.pokemon_id).order_by(tables.PokemonForm.id)
+        forms = numpy.array(query.all(), dtype=numpy.int64).reshape(-1, 2)
+        self.formIds = forms[:, 0]
+        self.pokemonIds = forms[:, 1]
+
+    def pokemonIdsForForms(self, formIds):
+        """Return the Pokémon ids of the given forms"""
+        return self.pokemonIds[positionsIn(self.formIds, formIds)]
@@ -6,21 +6,28 @@
 Query models
 """
 
-from PySide import QtCore, QtGui
+from PySide import QtCore
 Qt = QtCore.Qt
 
 from sqlalchemy.sql.expression import and_, or_
-from sqlalchemy.orm import contains_eager, lazyload, eagerload
+from sqlalchemy.orm import contains_eager, lazyload, eagerload, eagerload_all
 from pokedex.db import tables
 import traceback
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from qdex.column import ModelColumn
 from qdex.loadableclass import LoadableMetaclass
 from qdex.sortclause import DefaultPokemonSortClause
 from qdex.pokedexhelpers import default_language_param
-from qdex.delegate import PokemonDelegate
 from qdex.sortmodel import SortModel
 from qdex.querybuilder import QueryBuilder
+from qdex.resultcache import signature, cacheable
+from qdex.snapshot import tableName, sortOrder
 
 class ModelMetaclass(LoadableMetaclass, type(QtCore.QAbstractItemModel)):
     """Merged metaclass"""
@@ -39,7 +46,7 @@ class BaseQueryModel(QtCore.QAbstractItemModel):
         super(BaseQueryModel, self).__init__()
         self.g = g
         self.mappedClass = mappedClass
-        self.g.registerRetranslate(self.allDataChanged)
+        self.g.registerRetranslate(self.retranslate)
         self.baseQuery = query
         self.columns = []
         for column in columns:
@@ -57,6 +64,9 @@ class BaseQueryModel(QtCore.QAbstractItemModel):
         self.sortClauses.rowsRemoved.connect(self.sortChanged)
         self.sortClauses.dataChanged.connect(self.sortChanged)
         self.filters = []
+        self._entities = {}
+        self._sortKeys = {}
+        self._rowIds = {}
         self._setQuery()
 
     @property
@@ -64,19 +74,220 @@ class BaseQueryModel(QtCore.QAbstractItemModel):
         return (self.defaultSortClause, ) + tuple(self.sortClauses)
 
     def _setQuery(self):
-        """Called every time the query changes"""
+        """Called every time the query changes
+
+        Only the row order is determined here: an array of primary keys,
+        taken from the result cache or the snapshot, or fetched in one narrow
+        query. Items are loaded as needed, by _fetchPage.
+        The SQL ORDER BY is only built if the order can't be found otherwise.
+        """
+        cache = self.g.resultCache
+        if cache:
+            self._signature = self.querySignature()
+        else:
+            self._signature = None
+        self._ordering = None
+        if self._signature is not None:
+            self._ordering = cache.getOrdering(self._signature)
+        if self._ordering is None:
+            self._ordering = self._memoryOrdering()
+        if self._ordering is None:
+            query = self.sortedBuilder().query.with_entities(
+                    self.mappedClass.id)
+            self._ordering = array('l', (id for (id, ) in query))
+        if self._signature is not None:
+            cache.setOrdering(self._signature, self._ordering)
+        self._rows = len(self._ordering)
+        self._languageSignature = self.languageSignature()
+        self._cellPages = {}
+        self.pages = [None] * (self._rows // self._pagesize + 1)
+
+    def _memoryOrdering(self):
+        """Compute the row ordering in memory, if possible
+
+        Sort keys come from the columnar snapshot, or from precomputed
+        arrays for clauses that don't need it (see SortClause.sortKeys).
+        Without a snapshot, simple clauses (like the default ones) fetch
+        their keys in one narrow query (SortClause.queryKeys).
+        Keys are computed (and cached) for all rows; filters only select
+        from the sorted rows, so changing them doesn't re-sort.
+        Returns None if NumPy isn't available, or some sort clause can't be
+        sorted in memory.
+        """
+        if numpy is None:
+            return None
+        snapshot = self.g.snapshot
+        if snapshot is None and any(clause.needsSnapshot
+                for clause in self.allSortClauses):
+            return None
+        try:
+            ids = self.rowIds()
+            keys = []
+            for clause in reversed(self.allSortClauses):
+                for key in self._clauseSortKeys(snapshot, clause, ids):
+                    if clause.descending:
+                        key = -key
+                    keys.append(key)
+        except NotImplementedError:
+            return None
+        ordered = ids[sortOrder(keys, len(ids))]
+        if self.filters:
+            ordered = ordered[numpy.in1d(ordered, self.filteredIds())]
+        return array('l', ordered.tolist())
+
+    def filteredIds(self):
+        """Return an array of the ids of the rows that pass the filters
+
+        The ids are fetched in one narrow, unordered query.
+        """
+        builder = self.baseBuilder()
+        for filter in self.filters:
+            filter.filter(builder)
+        idColumn = self.mappedClass.id
+        query = builder.query.with_entities(idColumn).order_by(None)
+        return numpy.array([id for (id, ) in query], dtype=numpy.int64)
+
+    def _clauseSortKeys(self, snapshot, clause, ids):
+        """Return a sort clause's (ascending) rank arrays for the given rows
+
+        The arrays are cached per clause, so changing the clauses' priority
+        or direction only needs an in-memory merge of cached arrays.
+        """
+        key = [self.rowsKey(), type(clause).__name__,
+                clause.column.save() if clause.column else None]
+        if clause.languageDependent:
+            key.append(self.languageSignature())
+        key = signature(key)
+        try:
+            return self._sortKeys[key]
+        except KeyError:
+            keys = self._sortKeys[key] = clause.sortKeys(snapshot, self,
+                    self.mappedClass, ids)
+            return keys
+
+    def rowIds(self):
+        """Return an ascending array of the ids of all rows, ignoring filters
+
+        The ids come from the snapshot if there is one, otherwise from a
+        (cached) narrow query.
+        """
+        snapshot = self.g.snapshot
+        if snapshot is not None:
+            return self.snapshotRowIds(snapshot)
+        builder = self.baseBuilder()
+        key = self.rowsKey()
+        try:
+            return self._rowIds[key]
+        except KeyError:
+            idColumn = self.mappedClass.id
+            query = builder.query.with_entities(idColumn).order_by(idColumn)
+            ids = self._rowIds[key] = numpy.array([id for (id, ) in query],
+                    dtype=numpy.int64)
+            return ids
+
+    def snapshotRowIds(self, snapshot):
+        """Return an ascending array of the ids of all rows, from a snapshot
+        """
+        return snapshot.ids(tableName(self.mappedClass))
+
+    def sortedBuilder(self):
+        """Return a QueryBuilder with the filters and sort clauses applied
+        """
         builder = self.baseBuilder()
+        for filter in self.filters:
+            filter.filter(builder)
         for clause in reversed(self.allSortClauses):
             clause.sort(builder)
-        self._query = builder.query
-        self._rows = int(self._query.count())
-        self.pages = [None] * (self._rows // self._pagesize + 1)
+        return builder
+
+    def rowsKey(self):
+        """Return a value identifying the rows rowIds() returns"""
+        return None
+
+    def querySignature(self):
+        """Return a string identifying the rows and order of the query
+
+        This is the key of the model's results in the persistent result
+        cache. Returns None if the results can't be cached (when filtered).
+        """
+        if self.filters:
+            return None
+        clauses = [(type(clause).__name__, clause.descending,
+                    clause.column.save() if clause.column else None)
+                for clause in self.allSortClauses]
+        if any(clause.languageDependent for clause in self.allSortClauses):
+            languages = self.languageSignature()
+        else:
+            languages = None
+        return signature([type(self).__name__, self.mappedClass.__name__,
+                clauses, languages])
+
+    def languageSignature(self):
+        """Return a string identifying the UI and game languages"""
+        return signature([self.g.langs, self.g.session.default_language_id])
+
+    def _columnSignature(self, column):
+        """Return a string identifying a column, for the result cache"""
+        try:
+            return self._columnSignatures[column]
+        except AttributeError:
+            self._columnSignatures = {}
+        except KeyError:
+            pass
+        result = self._columnSignatures[column] = signature(column.save())
+        return result
+
+    def _cachedDisplayData(self, index, compute):
+        """Return display data for a top-level index via the result cache
+
+        `compute` is called to get the data if it's not cached yet.
+        """
+        if self._signature is None:
+            return compute()
+        pageno, offset = divmod(index.row(), self._pagesize)
+        key = (self._signature,
+                self._columnSignature(self.columns[index.column()]),
+                self._languageSignature, pageno)
+        try:
+            cells = self._cellPages[key]
+        except KeyError:
+            cells = self._cellPages[key] = self.g.resultCache.cellPage(*key)
+        offset = str(offset)
+        try:
+            return cells[offset]
+        except KeyError:
+            result = compute()
+            if cacheable(result):
+                cells[offset] = result
+            return result
+
+    def setFilters(self, filters):
+        """Set the filters that restrict the rows of this model
+
+        Each filter has a filter(builder) method that modifies the query of the
+        given QueryBuilder.
+        """
+        from PySide import QtGui
+        QtGui.QApplication.setOverrideCursor(QtGui.QCursor(Qt.WaitCursor))
+        try:
+            self.beginResetModel()
+            self.filters = list(filters)
+            self._setQuery()
+            self.endResetModel()
+        finally:
+            QtGui.QApplication.restoreOverrideCursor()
 
     def baseBuilder(self):
         """Return a QueryBuilder corresponding to the base query
         """
         return QueryBuilder(self.baseQuery, self.mappedClass)
 
+    def defaultDelegate(self, view):
+        """Return the delegate for columns that don't have their own"""
+        # QtGui is imported here, so headless tools can use models
+        from PySide import QtGui
+        return QtGui.QStyledItemDelegate(view)
+
     def dump(self):
         """Dump a simple representation of the data to stdout
         """
@@ -94,19 +305,100 @@ class BaseQueryModel(QtCore.QAbstractItemModel):
             )
         self.headerDataChanged.emit(Qt.Horizontal, 0, self.columnCount() - 1)
 
+    def retranslate(self):
+        """Called when the UI or game language changes
+
+        The row count and cached pages are kept; translated strings of the
+        cached rows are reloaded in one query per page. The rows are only
+        re-sorted if a sort clause depends on the language.
+        """
+        paths = set()
+        for column in self.columns:
+            paths.update(column.loadPaths())
+        self._loadPaths(sorted(paths))
+        if any(clause.languageDependent for clause in self.allSortClauses):
+            self.layoutAboutToBeChanged.emit()
+            self._setQuery()
+            self.layoutChanged.emit()
+        else:
+            self._languageSignature = self.languageSignature()
+        self.dataChanged.emit(
+                self.index(0, 0),
+                self.index(self.rowCount() - 1, self.columnCount() - 1),
+            )
+        self.headerDataChanged.emit(Qt.Horizontal, 0, self.columnCount() - 1)
+
     def __getitem__(self, i):
         pageno, offset = divmod(i, self._pagesize)
         page = self.pages[pageno]
         if not page:
-            start = pageno * self._pagesize
-            end = (pageno + 1) * self._pagesize
-            page = self.pages[pageno] = self._query[start:end]
+            page = self.pages[pageno] = self._fetchPage(pageno)
         return page[offset]
 
+    def _fetchPage(self, pageno):
+        """Return a page of items, in the current order
+
+        Items are taken from the entity cache, which is kept across re-sorts;
+        the ones not there yet are loaded by primary key.
+        """
+        start = pageno * self._pagesize
+        ids = self._ordering[start:start + self._pagesize]
+        entities = self._entities
+        self._loadEntities([id for id in ids if id not in entities],
+                self.loadOptions())
+        return [entities[id] for id in ids]
+
+    def loadOptions(self):
+        """Return query options that eagerly load what the columns need"""
+        paths = set()
+        for column in self.columns:
+            paths.update(column.loadPaths())
+        return [eagerload_all(path) for path in sorted(paths)]
+
+    def _loadEntities(self, ids, options=()):
+        """Load items with the given ids into the entity cache
+
+        The sorting joins aren't needed, so the base query is used, with the
+        given query options.
+        """
+        query = self.baseQuery.options(*options)
+        # Stay below SQLite's limit on the number of bound parameters
+        for chunkStart in range(0, len(ids), 500):
+            chunk = list(ids[chunkStart:chunkStart + 500])
+            for item in query.filter(self.mappedClass.id.in_(chunk)):
+                self._entities[item.id] = item
+
+    def loadedItems(self):
+        """Return the items that are loaded (in the entity cache) now"""
+        return self._entities.values()
+
+    def dropPage(self, pageno):
+        """Forget a page of items, including their entity cache entries"""
+        page = self.pages[pageno]
+        if page:
+            for item in page:
+                self._entities.pop(item.id, None)
+        self.pages[pageno] = None
+
     def columnCount(self, parent=QtCore.QModelIndex()):
         return len(self.columns)
 
     def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self._cachedDisplayData(index,
+                    lambda: self._itemData(index, role))
+        return self._itemData(index, role)
+
+    def uncachedData(self, index, role=Qt.DisplayRole):
+        """Return data like data(), without using the result cache
+
+        For reading the whole model once (e.g. exporting), where caching
+        every cell would only take up memory.
+        """
+        return self._itemData(index, role)
+
+    def _itemData(self, index, role):
+        """Get data for the index from the item itself"""
         item = self.itemForIndex(index)
         if item:
             return self.columns[index.column()].data(item, role)
@@ -158,17 +450,35 @@ class BaseQueryModel(QtCore.QAbstractItemModel):
         Qt's normal column-inserting API doesn't work: it doesn't specify
         the column to be inserted.
         """
+        self._loadColumnData(column)
         self.beginInsertColumns(QtCore.QModelIndex(), position, position)
         self.columns.insert(position, column)
         self.endInsertColumns()
 
     def replaceQueryColumn(self, position, new_column):
-        old_column = self.columns[position]
+        self._loadColumnData(new_column)
         self.columns[position] = new_column
         self.dataChanged.emit(self.index(0, position),
-                self.index(self.rowCount, position))
+                self.index(self.rowCount() - 1, position))
         self.headerDataChanged.emit(Qt.Horizontal, position, position)
 
+    def _loadColumnData(self, column):
+        """Load the data a new column needs into the already-cached pages
+        """
+        self._loadPaths(column.loadPaths())
+
+    def _loadPaths(self, paths):
+        """Load the given relationship paths into the already-cached items
+
+        Re-loads the items in the entity cache, eagerly loading the
+        relationships; this fills in the unloaded attributes of the objects
+        we already have, so columns don't lazy-load cell by cell.
+        """
+        if not paths:
+            return
+        options = [eagerload_all(path) for path in paths]
+        self._loadEntities(sorted(self._entities), options)
+
     def sort(self, columnIndex, order=Qt.AscendingOrder):
         newClauses = [self.defaultSortClause]
         if columnIndex == -1:
@@ -179,6 +489,25 @@ class BaseQueryModel(QtCore.QAbstractItemModel):
             sortClause = column.getSortClause(descending=descending)
             self.sortClauses.append(sortClause)
 
+    def setSortClauses(self, clauses):
+        """Replace the user's sort clauses and re-sort right away
+
+        Unlike modifying sortClauses directly, this doesn't wait for the
+        event loop, so it can be used without a QApplication.
+        The sort model's signals are blocked meanwhile, so this is meant for
+        models that aren't shown in a view.
+        """
+        self.sortClauses.blockSignals(True)
+        try:
+            self.sortClauses.clear()
+            for clause in clauses:
+                self.sortClauses.append(clause)
+        finally:
+            self.sortClauses.blockSignals(False)
+        self.layoutAboutToBeChanged.emit()
+        self._setQuery()
+        self.layoutChanged.emit()
+
     def sortChanged(self):
         # Sorting's an expensive operation; if there are more resorts in a
         # single event loop iteration, only actually sort once
@@ -187,6 +516,7 @@ class BaseQueryModel(QtCore.QAbstractItemModel):
             if not self._sortChanged:
                 return
             self._sortChanged = False
+            from PySide import QtGui
             QtGui.QApplication.setOverrideCursor(QtGui.QCursor(Qt.WaitCursor))
             try:
                 self.layoutAboutToBeChanged.emit()
@@ -198,8 +528,6 @@ class BaseQueryModel(QtCore.QAbstractItemModel):
 
 class TableModel(BaseQueryModel):
     """Model that displays a DB table"""
-    defaultDelegateClass = QtGui.QStyledItemDelegate
-
     def __init__(self, g, table, columns):
         if isinstance(table, basestring):
             tableName = table
@@ -236,8 +564,6 @@ class PokemonModel(BaseQueryModel):
     - otherwise, don't collapse anything at all. (0)
     Picture/form name can always be collapsed.
     """
-    defaultDelegateClass = PokemonDelegate
-
     def __init__(self, g, columns):
         mappedClass = tables.PokemonForm
         query = g.session.query(mappedClass)
@@ -252,17 +578,42 @@ class PokemonModel(BaseQueryModel):
         self.tableName = 'PokemonForm'
         self._hack_small_icons = False
 
+    @property
+    def collapsing(self):
+        """How much the forms are collapsed (see the class docstring)"""
+        return min(c.collapsing for c in self.allSortClauses)
+
     def baseBuilder(self):
         builder = super(PokemonModel, self).baseBuilder()
         builder.setIncluded(tables.PokemonSpecies.pokemon, tables.Pokemon)
         builder.setIncluded(tables.Pokemon.forms, tables.PokemonForm)
-        self.collapsing = min(c.collapsing for c in self.allSortClauses)
         if self.collapsing >= 2:
             builder.query = builder.query.filter(tables.Pokemon.is_default == True)
         if self.collapsing >= 1:
             builder.query = builder.query.filter(tables.PokemonForm.is_default == True)
         return builder
 
+    def defaultDelegate(self, view):
+        from qdex.delegate import PokemonDelegate
+        return PokemonDelegate(view)
+
+    def snapshotRowIds(self, snapshot):
+        ids = snapshot.ids(tableName(tables.PokemonForm))
+        if self.collapsing >= 1:
+            isDefault, nulls = snapshot.lookup(tableName(tables.PokemonForm),
+                    'is_default', ids)
+            ids = ids[(isDefault != 0) & ~nulls]
+        if self.collapsing >= 2:
+            pokemonIds, nulls = snapshot.lookup(tableName(tables.PokemonForm),
+                    'pokemon_id', ids)
+            isDefault, nulls = snapshot.lookup(tableName(tables.Pokemon),
+                    'is_default', pokemonIds)
+            ids = ids[(isDefault != 0) & ~nulls]
+        return ids
+
+    def rowsKey(self):
+        return self.collapsing
+
     def forms_for(self, form):
         if self.collapsing == 2:
             return form.species.forms
@@ -301,6 +652,12 @@ class PokemonModel(BaseQueryModel):
             return False
 
     def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.internalId() == -1:
+            return self._cachedDisplayData(index,
+                    lambda: self._itemData(index, role))
+        return self._itemData(index, role)
+
+    def _itemData(self, index, role):
         # See discussion in PokemonDelegate.indexToShow
         column = self.columns[index.column()]
         if index.internalId() == -1:
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Query plan inspector
+
+Shows how a query model's current sort clauses turn into SQL: the joins
+QueryBuilder added, the generated SQL, the database's query plan, and the
+time each step took. Useful for finding pathological orderings.
+"""
+
+from timeit import default_timer
+
+from qdex.snapshot import tableName
+from qdex.sqlitetuning import isSQLite, compileQuery, queryPlan, fullScans
+
+class QueryPlanReport(object):
+    """Result of inspecting a model's query: a list of steps
+
+    Each step is a (title, seconds, text) tuple; seconds may be None.
+    """
+    def __init__(self):
+        self.steps = []
+
+    def addStep(self, title, seconds, text):
+        """Add a step to the report"""
+        self.steps.append((title, seconds, text))
+
+    @property
+    def totalTime(self):
+        """Total time of the timed steps, in seconds"""
+        return sum(seconds for title, seconds, text in self.steps if seconds)
+
+    def format(self):
+        """Return the report as plain text"""
+        parts = []
+        for title, seconds, text in self.steps:
+            if seconds is None:
+                parts.append(u'== %s ==' % title)
+            else:
+                parts.append(u'== %s (%.2f ms) ==' % (title, seconds * 1000))
+            parts.append(text)
+            parts.append(u'')
+        parts.append(u'Total: %.2f ms' % (self.totalTime * 1000))
+        return u'\n'.join(parts)
+
+def relationKeyName(key):
+    """Return a readable name for a QueryBuilder relation key"""
+    if isinstance(key, tuple):
+        # (column, index) keys, as used by AssociationListColumn
+        column, index = key
+        try:
+            value = column.orderValues[index]
+            return u'%s [%s=%s]' % (column.attr, column.orderAttr, value)
+        except AttributeError:
+            return u'%s [%s]' % (getattr(column, 'attr', column), index)
+    return unicode(key)
+
+def formatRelations(relations, indent=0):
+    """Return lines describing a QueryBuilder's _relations tree"""
+    lines = []
+    for key, (joinedClass, subrelations) in sorted(relations.items(),
+            key=lambda item: relationKeyName(item[0])):
+        lines.append(u'%s%s -> %s' % (u'    ' * indent, relationKeyName(key),
+                tableName(joinedClass)))
+        lines.extend(formatRelations(subrelations, indent + 1))
+    return lines
+
+def describeClause(g, clause):
+    """Return a readable description of a sort clause"""
+    if clause.column:
+        name = g.translator(clause.column.name)
+    else:
+        name = u'(default)'
+    return u'%s: %s%s' % (type(clause).__name__, name,
+            u', descending' if clause.descending else u'')
+
+def inspectModel(model):
+    """Inspect the query of a model's current filters and sort clauses
+
+    The query is built the same way the model builds it; then it's compiled,
+    explained (on SQLite), and run as the narrow primary key query.
+    Returns a QueryPlanReport.
+    """
+    report = QueryPlanReport()
+    session = model.g.session
+
+    start = default_timer()
+    builder = model.sortedBuilder()
+    query = builder.query.with_entities(model.mappedClass.id)
+    clauses = [describeClause(model.g, clause)
+            for clause in reversed(model.allSortClauses)]
+    report.addStep(u'Sort clauses, highest priority first',
+            default_timer() - start, u'\n'.join(clauses))
+
+    joins = formatRelations(builder._relations)
+    report.addStep(u'Joins (%s)' % len(joins), None,
+            u'\n'.join(joins) or u'(none)')
+
+    start = default_timer()
+    sql, params = compileQuery(session, query)
+    report.addStep(u'SQL', default_timer() - start,
+            u'%s\n\nParameters: %s' % (sql, params))
+
+    if isSQLite(session.bind):
+        start = default_timer()
+        plan = queryPlan(session, query)
+        scans = fullScans(plan)
+        report.addStep(u'Query plan (%s full scans of joined tables)' % (
+                len(scans)), default_timer() - start, u'\n'.join(plan))
+    else:
+        report.addStep(u'Query plan', None,
+                u'Only available for SQLite databases')
+
+    start = default_timer()
+    rows = len(query.all())
+    report.addStep(u'Execution', default_timer() - start, u'%s rows' % rows)
+    return report
+
+def showReportDialog(report, title, parent=None):
+    """Show a query plan report in a (modal) dialog"""
+    # Imported here, so the inspector can be used without a GUI
+    from PySide import QtGui
+    dialog = QtGui.QDialog(parent)
+    dialog.setWindowTitle(title)
+    layout = QtGui.QVBoxLayout(dialog)
+    text = QtGui.QPlainTextEdit(report.format())
+    text.setReadOnly(True)
+    text.setLineWrapMode(QtGui.QPlainTextEdit.NoWrap)
+    font = QtGui.QFont('Monospace')
+    font.setStyleHint(QtGui.QFont.TypeWriter)
+    text.setFont(font)
+    layout.addWidget(text)
+    buttons = QtGui.QDialogButtonBox(QtGui.QDialogButtonBox.Close)
+    buttons.rejected.connect(dialog.reject)
+    layout.addWidget(buttons)
+    dialog.resize(700, 500)
+    dialog.exec_()
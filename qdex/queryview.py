@@ -11,22 +11,46 @@ Qt = QtCore.Qt
 
 from qdex.columngroup import defaultColumnGroups, buildColumnMenu
 from qdex.sortview import SortView
+from qdex.fulltext import FullTextFilter
 
 class QueryView(QtGui.QWidget):
     def __init__(self, *args):
         QtGui.QWidget.__init__(self, *args)
+        self.search_box = QtGui.QLineEdit()
+        self.search_box.returnPressed.connect(self.search)
         self.result_view = ResultView()
         self.sort_view = SortView()
 
         self.layout = QtGui.QVBoxLayout(self)
         self.layout.setContentsMargins(0, 0, 0, 0)
         self.layout.setSpacing(0)
+        self.layout.addWidget(self.search_box)
         self.layout.addWidget(self.result_view)
         self.layout.addWidget(self.sort_view)
 
     def setModel(self, model):
         self.result_view.setModel(model)
         self.sort_view.setModel(model.sortClauses)
+        _ = model.g.translator
+        self.search_box.setPlaceholderText(_(u'Search text…'))
+        self.search_box.setText(u'')
+        for filter in model.filters:
+            if isinstance(filter, FullTextFilter):
+                self.search_box.setText(filter.text)
+
+    def search(self):
+        """Filter the model by the text in the search box"""
+        model = self.result_view.model()
+        if not model:
+            return
+        g = model.g
+        filters = [f for f in model.filters
+                if not isinstance(f, FullTextFilter)]
+        text = self.search_box.text().strip()
+        if text:
+            filters.append(FullTextFilter(g.fullTextIndex, text,
+                    model.tableName, g.languages))
+        model.setFilters(filters)
 
 class ResultView(QtGui.QTreeView):
     """A tree-view for displaying query models.
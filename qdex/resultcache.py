@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Persistent cache of query model results
+"""
+
+import json
+import sqlite3
+from array import array
+
+from qdex import cache_filename, __version__
+from qdex.pokedexhelpers import databaseFingerprint
+
+def signature(value):
+    """Return a stable string representation of a JSON-like value
+
+    Translatable strings (and other unknown objects) are represented by
+    their message (or unicode value).
+    """
+    return json.dumps(value, sort_keys=True,
+            default=lambda obj: unicode(getattr(obj, 'message', obj)))
+
+def cacheable(value):
+    """Return true if a display value can be stored in the cache (as JSON)
+
+    Other values (like ORM objects some simple columns display) are shown,
+    but not cached.
+    """
+    return value is None or isinstance(value, (bool, int, long, float,
+            basestring))
+
+def dumpCells(cells):
+    """Return the JSON of a page of cells, leaving out any that can't be
+    serialized (e.g. non-ASCII byte strings)
+    """
+    try:
+        return json.dumps(cells)
+    except (TypeError, ValueError):
+        goodCells = {}
+        for offset, value in cells.items():
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                continue
+            goodCells[offset] = value
+        return json.dumps(goodCells)
+
+class ResultCache(object):
+    """Stores row-ID orderings and rendered cells of query models on disk
+
+    The cache lives in a SQLite database in qdex's cache directory.
+    It is keyed by a fingerprint of the pokedex database and the qdex version,
+    and thrown away when either changes.
+
+    Orderings are arrays of primary keys, stored under a query signature
+    (see BaseQueryModel.querySignature); the row count is their length.
+    Orderings are saved right away. Rendered cells are kept in per-page dicts
+    that models fill in as they display data, and saved by flush().
+    """
+    def __init__(self, session, filename=None):
+        if filename is None:
+            filename = cache_filename('results.sqlite')
+        self.connection = sqlite3.connect(filename)
+        self._cellPages = {}
+        self._createTables(session)
+
+    def _createTables(self, session):
+        """Create the cache tables, or clear them if they're stale"""
+        conn = self.connection
+        conn.execute('''CREATE TABLE IF NOT EXISTS meta
+                (key TEXT PRIMARY KEY, value TEXT)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS orderings
+                (query TEXT PRIMARY KEY, ids BLOB)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS cells
+                (query TEXT, column TEXT, language TEXT, page INTEGER,
+                data TEXT, PRIMARY KEY (query, column, language, page))''')
+        fingerprint = '%s;qdex %s' % (databaseFingerprint(session),
+                __version__)
+        row = conn.execute("SELECT value FROM meta WHERE key='fingerprint'"
+                ).fetchone()
+        if row is None or row[0] != fingerprint:
+            conn.execute('DELETE FROM orderings')
+            conn.execute('DELETE FROM cells')
+            conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                    ('fingerprint', fingerprint))
+        conn.commit()
+
+    def getOrdering(self, query):
+        """Return the cached primary key array for a query signature, or None
+        """
+        row = self.connection.execute(
+                'SELECT ids FROM orderings WHERE query=?', (query, )
+            ).fetchone()
+        if row is None:
+            return None
+        ordering = array('l')
+        ordering.fromstring(str(row[0]))
+        return ordering
+
+    def setOrdering(self, query, ordering):
+        """Store the primary key array for a query signature"""
+        self.connection.execute('INSERT OR REPLACE INTO orderings VALUES (?, ?)',
+                (query, buffer(array('l', ordering).tostring())))
+        self.connection.commit()
+
+    def cellPage(self, query, column, language, page):
+        """Return a dict of rendered cells for a page of a column
+
+        The dict maps row offsets within the page (as strings) to display
+        data. Callers add newly rendered cells to it; flush() saves them.
+        """
+        key = query, column, language, page
+        try:
+            return self._cellPages[key][0]
+        except KeyError:
+            row = self.connection.execute('''SELECT data FROM cells
+                    WHERE query=? AND column=? AND language=? AND page=?''',
+                    key).fetchone()
+            if row is None:
+                cells = {}
+            else:
+                cells = json.loads(row[0])
+            self._cellPages[key] = cells, len(cells)
+            return cells
+
+    def dump(self):
+        """Return all cached results as a compact, picklable tuple
+
+        This is used to ship results computed in another process (with an
+        in-memory cache) to the main one; see merge().
+        """
+        self.flush()
+        conn = self.connection
+        orderings = [(query, str(ids)) for query, ids in
+                conn.execute('SELECT query, ids FROM orderings')]
+        cells = conn.execute('SELECT * FROM cells').fetchall()
+        return orderings, cells
+
+    def merge(self, dump):
+        """Add results from another cache's dump() to this one
+
+        Results already in this cache are kept.
+        """
+        orderings, cells = dump
+        conn = self.connection
+        conn.executemany('INSERT OR IGNORE INTO orderings VALUES (?, ?)',
+                [(query, buffer(ids)) for query, ids in orderings])
+        for row in cells:
+            key = tuple(row[:4])
+            try:
+                cachedCells, savedLength = self._cellPages[key]
+            except KeyError:
+                conn.execute('INSERT OR IGNORE INTO cells VALUES (?, ?, ?, ?, ?)',
+                        row)
+            else:
+                # Already loaded; new cells will be saved by flush()
+                for offset, value in json.loads(row[4]).items():
+                    cachedCells.setdefault(offset, value)
+        conn.commit()
+
+    def flush(self):
+        """Save rendered cells that were added since they were loaded"""
+        conn = self.connection
+        for key, (cells, savedLength) in self._cellPages.items():
+            if len(cells) != savedLength:
+                conn.execute('INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?)',
+                        key + (dumpCells(cells), ))
+                self._cellPages[key] = cells, len(cells)
+        conn.commit()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Read-only sessions for background workers
+
+The GUI's session (Global.session) may only be used from the GUI thread.
+Background work (prefetching, sorting, exporting) gets its own sessions
+from a SessionPool instead. Each has its own identity map and connection,
+and refuses to flush, so workers can't write to the database.
+
+Objects loaded in a worker session must not be used in the GUI. Hand them
+over by primary key, or with handOff(), which merges them into the GUI
+session without querying.
+"""
+
+import Queue
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from pokedex.db.multilang import MultilangSession
+
+class ReadOnlySessionError(Exception):
+    """Raised when a worker session would write to the database"""
+    pass
+
+def _refuseFlush(session, flushContext, instances):
+    """before_flush listener for worker sessions"""
+    raise ReadOnlySessionError('Worker sessions are read-only')
+
+class SessionPool(object):
+    """A pool of read-only sessions bound to the GUI session's engine
+
+    At most `size` idle sessions are kept around; more are created if
+    needed, and closed when released.
+    """
+    def __init__(self, guiSession, size=4):
+        self.guiSession = guiSession
+        self.size = size
+        self._idle = Queue.Queue()
+
+    def _createSession(self):
+        """Create a new worker session
+
+        pokedex's connect() gives a scoped session; workers get plain
+        sessions from the sessionmaker behind it (or a MultilangSession),
+        with the GUI's engine and language.
+        """
+        guiSession = self.guiSession
+        factory = getattr(guiSession, 'session_factory', MultilangSession)
+        session = factory(bind=guiSession.bind, autoflush=False,
+                default_language_id=guiSession.default_language_id)
+        event.listen(session, 'before_flush', _refuseFlush)
+        return session
+
+    def acquire(self):
+        """Get a worker session; release() it when done
+
+        Use the session only from the thread that acquired it.
+        """
+        try:
+            session = self._idle.get_nowait()
+        except Queue.Empty:
+            session = self._createSession()
+        # Follow the GUI's current game language
+        session.default_language_id = self.guiSession.default_language_id
+        return session
+
+    def release(self, session):
+        """Return a worker session to the pool
+
+        Its objects are expunged and its transaction is ended.
+        """
+        session.expunge_all()
+        session.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(session)
+        else:
+            session.close()
+
+    @contextmanager
+    def session(self):
+        """Context manager giving a worker session"""
+        session = self.acquire()
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def handOff(self, items):
+        """Return GUI-session copies of objects loaded in a worker session
+
+        The objects are merged with load=False, so no SQL is issued; their
+        loaded attributes are copied over. Call this from the GUI thread,
+        before the worker session is released.
+        """
+        return [self.guiSession.merge(item, load=False) for item in items]
+
+    def load(self, mappedClass, ids):
+        """Load objects into the GUI session by primary key, keeping order
+
+        This is the other way to hand over worker results: pass just the
+        ids. Call this from the GUI thread.
+        """
+        query = self.guiSession.query(mappedClass)
+        itemsById = {}
+        # Stay below SQLite's limit on the number of bound parameters
+        for chunkStart in range(0, len(ids), 500):
+            chunk = list(ids[chunkStart:chunkStart + 500])
+            for item in query.filter(mappedClass.id.in_(chunk)):
+                itemsById[item.id] = item
+        return [itemsById[id] for id in ids if id in itemsById]
+
+    def close(self):
+        """Close all idle sessions"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Queue.Empty:
+                return
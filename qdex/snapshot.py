@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Memory-mapped columnar snapshot of the pokedex database
+
+qdex only reads the veekun data, so the tables it browses can be exported to
+a directory of NumPy arrays (one per column), which are memory-mapped when
+read. Query models use the snapshot to compute their row order without
+asking the database; the rows themselves are then loaded by primary key.
+
+Integer and boolean columns are stored as int64 arrays, with a separate
+null mask. String columns are stored as int32 codes into a sorted string
+pool (so comparing codes compares strings); -1 is null.
+
+NumPy is optional: without it, no snapshot is used.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sqlalchemy.orm import class_mapper
+from sqlalchemy.orm.properties import ColumnProperty, RelationshipProperty
+from sqlalchemy.types import Integer, Boolean, Float, Numeric
+from pokedex.db import connect, tables
+
+from qdex import cache_filename
+from qdex.pokedexhelpers import databaseFingerprint
+
+def columnName(mappedClass, attr):
+    """Get the name of the table column behind a mapped class's attribute
+
+    Raises NotImplementedError if the attribute isn't a plain column.
+    """
+    mapper = class_mapper(mappedClass)
+    if mapper.has_property(attr):
+        prop = mapper.get_property(attr)
+        if isinstance(prop, ColumnProperty):
+            return prop.columns[0].name
+    raise NotImplementedError('%s.%s is not a column' % (
+            mappedClass.__name__, attr))
+
+def foreignKeyColumnName(mappedClass, attr):
+    """Get the name of the foreign key column behind a many-to-one relation
+
+    Raises NotImplementedError if the attribute isn't such a relationship.
+    """
+    mapper = class_mapper(mappedClass)
+    if mapper.has_property(attr):
+        prop = mapper.get_property(attr)
+        if isinstance(prop, RelationshipProperty) and not prop.uselist:
+            localColumns = list(prop.local_columns)
+            if len(localColumns) == 1:
+                return localColumns[0].name
+    raise NotImplementedError('%s.%s is not a simple relationship' % (
+            mappedClass.__name__, attr))
+
+def tableName(mappedClass):
+    """Get the name of a mapped class's table"""
+    return mappedClass.__table__.name
+
+def snapshotMappedClasses():
+    """Return the mapped classes whose tables go into the snapshot
+
+    These are the classes listed in columns.yaml, the tables they refer to by
+    foreign keys, and the translation classes of all of these.
+    """
+    # Imported here; column groups pull in Qt
+    from qdex.columngroup import defaultColumnGroups
+    classesByTable = dict((cls.__table__, cls)
+            for cls in tables.mapped_classes)
+    result = set()
+    for name in list(defaultColumnGroups) + ['Pokemon', 'PokemonSpecies']:
+        mappedClass = getattr(tables, name, None)
+        if mappedClass is None:
+            continue
+        result.add(mappedClass)
+        for column in mappedClass.__table__.c:
+            for foreignKey in column.foreign_keys:
+                try:
+                    result.add(classesByTable[foreignKey.column.table])
+                except KeyError:
+                    pass
+    for mappedClass in list(result):
+        result.update(getattr(mappedClass, 'translation_classes', ()))
+    return result
+
+def writeSnapshot(session, directory=None, mappedClasses=None):
+    """Export tables to a snapshot directory"""
+    if directory is None:
+        directory = cache_filename('snapshot', 'meta.json')
+        directory = os.path.dirname(directory)
+    if mappedClasses is None:
+        mappedClasses = snapshotMappedClasses()
+    meta = dict(fingerprint=databaseFingerprint(session), tables={})
+    for mappedClass in mappedClasses:
+        table = mappedClass.__table__
+        primaryKey = [column.name for column in table.primary_key.columns]
+        query = table.select().order_by(*table.primary_key.columns)
+        rows = session.execute(query).fetchall()
+        tableDir = os.path.join(directory, table.name)
+        if not os.path.isdir(tableDir):
+            os.makedirs(tableDir)
+        columns = {}
+        for i, column in enumerate(table.c):
+            values = [row[i] for row in rows]
+            kind = writeColumn(tableDir, column, values)
+            if kind:
+                columns[column.name] = kind
+        meta['tables'][table.name] = dict(rows=len(rows), columns=columns,
+                primaryKey=primaryKey)
+    with open(os.path.join(directory, 'meta.json'), 'w') as metafile:
+        json.dump(meta, metafile, indent=4)
+
+def writeColumn(tableDir, column, values):
+    """Write one column's arrays, return the column's kind (or None)"""
+    base = os.path.join(tableDir, column.name)
+    if isinstance(column.type, (Integer, Boolean, Float, Numeric)):
+        nulls = numpy.array([value is None for value in values], dtype=bool)
+        if isinstance(column.type, (Float, Numeric)):
+            kind, dtype = 'float', numpy.float64
+        else:
+            kind, dtype = 'int', numpy.int64
+        array = numpy.array([value or 0 for value in values], dtype=dtype)
+        numpy.save(base + '.npy', array)
+        numpy.save(base + '.null.npy', nulls)
+        return kind
+    elif all(value is None or isinstance(value, basestring)
+            for value in values):
+        pool = sorted(set(value for value in values if value is not None))
+        codesByString = dict((string, i) for i, string in enumerate(pool))
+        codes = numpy.array([codesByString.get(value, -1) for value in values],
+                dtype=numpy.int32)
+        numpy.save(base + '.npy', codes)
+        encoded = [string.encode('utf-8') for string in pool]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum([len(string) for string in encoded])
+        numpy.save(base + '.offsets.npy', offsets)
+        with open(base + '.pool', 'wb') as poolfile:
+            poolfile.write(''.join(encoded))
+        return 'string'
+    else:
+        # Dates and other types aren't used for sorting; skip them
+        return None
+
+def sortOrder(keys, count):
+    """Return the permutation that sorts `count` rows by the given rank arrays
+
+    The first key is the most significant. The sort is stable.
+    """
+    if not keys:
+        return numpy.arange(count)
+    return numpy.lexsort(keys[::-1])
+
+class Snapshot(object):
+    """Read access to a snapshot directory
+
+    Arrays are memory-mapped, and only loaded when first used.
+    Entity rows are looked up by their (integer) `id` primary key.
+    """
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self._arrays = {}
+
+    @classmethod
+    def open(cls, session, directory=None):
+        """Open the snapshot, if it exists and matches the pokedex database
+
+        Returns None if NumPy isn't available, or there's no usable snapshot.
+        """
+        if numpy is None:
+            return None
+        if directory is None:
+            directory = os.path.dirname(cache_filename('snapshot', 'meta.json'))
+        try:
+            with open(os.path.join(directory, 'meta.json')) as metafile:
+                meta = json.load(metafile)
+        except (IOError, ValueError):
+            return None
+        if meta.get('fingerprint') != databaseFingerprint(session):
+            return None
+        return cls(directory, meta)
+
+    def hasColumn(self, table, column):
+        """Return true if the snapshot has the given column"""
+        try:
+            return column in self.meta['tables'][table]['columns']
+        except KeyError:
+            return False
+
+    def kind(self, table, column):
+        """Return the kind of a column: 'int', 'float' or 'string'"""
+        try:
+            return self.meta['tables'][table]['columns'][column]
+        except KeyError:
+            raise NotImplementedError('%s.%s not in snapshot' % (table, column))
+
+    def array(self, table, column, suffix=''):
+        """Return a memory-mapped array"""
+        key = table, column, suffix
+        try:
+            return self._arrays[key]
+        except KeyError:
+            self.kind(table, column)
+            filename = os.path.join(self.directory, table,
+                    column + suffix + '.npy')
+            array = self._arrays[key] = numpy.load(filename, mmap_mode='r')
+            return array
+
+    def nulls(self, table, column):
+        """Return a boolean array: True where the column is null"""
+        if self.kind(table, column) == 'string':
+            return self.array(table, column) < 0
+        else:
+            return self.array(table, column, '.null')
+
+    def pool(self, table, column):
+        """Return the decoded string pool of a column, as a list"""
+        key = table, column, '.pool'
+        try:
+            return self._arrays[key]
+        except KeyError:
+            offsets = self.array(table, column, '.offsets')
+            with open(os.path.join(self.directory, table, column + '.pool'),
+                    'rb') as poolfile:
+                data = poolfile.read()
+            pool = self._arrays[key] = [
+                    data[offsets[i]:offsets[i + 1]].decode('utf-8')
+                    for i in range(len(offsets) - 1)]
+            return pool
+
+    def string(self, table, column, code):
+        """Decode a string from a column's pool"""
+        if code < 0:
+            return None
+        return self.pool(table, column)[code]
+
+    def ids(self, table):
+        """Return the ids of all rows of an entity table
+
+        This is the (read-only) memory-mapped array itself; don't modify it.
+        """
+        return self.array(table, 'id')
+
+    def positions(self, table, ids):
+        """Return the row positions for the given ids, and a found mask"""
+        allIds = self.array(table, 'id')
+        positions = numpy.searchsorted(allIds, ids)
+        positions = numpy.minimum(positions, len(allIds) - 1)
+        found = allIds[positions] == ids
+        return positions, found
+
+    def lookup(self, table, column, ids):
+        """Return the values of a column for the given entity ids
+
+        Returns a (values, nulls) pair of arrays. Unknown ids give nulls.
+        Only the requested entries are read from the memory-mapped column,
+        into new arrays that the caller may modify.
+        """
+        positions, found = self.positions(table, ids)
+        values = self.array(table, column)[positions]
+        nulls = self.nulls(table, column)[positions] | ~found
+        return values, nulls
+
+    def reverseLookup(self, table, column, values):
+        """Return the ids of rows with the given values of a unique column
+
+        Returns an array of ids; values that no row has give -1.
+        """
+        present = ~self.nulls(table, column)
+        columnValues = self.array(table, column)[present]
+        ids = self.ids(table)[present]
+        order = numpy.argsort(columnValues, kind='mergesort')
+        columnValues, ids = columnValues[order], ids[order]
+        if not len(ids):
+            return numpy.zeros(len(values), dtype=numpy.int64) - 1
+        positions = numpy.minimum(numpy.searchsorted(columnValues, values),
+                len(ids) - 1)
+        found = columnValues[positions] == values
+        return numpy.where(found, ids[positions], -1)
+
+    def ranks(self, values, nulls):
+        """Turn values into int ranks, preserving order; nulls become -1"""
+        ranks = numpy.empty(len(values), dtype=numpy.int64)
+        ranks[nulls] = -1
+        unique, inverse = numpy.unique(values[~nulls], return_inverse=True)
+        ranks[~nulls] = inverse
+        return ranks
+
+    def stringRanks(self, strings):
+        """Turn a sequence of strings (or None) into int ranks"""
+        nulls = numpy.array([string is None for string in strings], dtype=bool)
+        values = numpy.array([string or u'' for string in strings],
+                dtype=numpy.unicode_)
+        return self.ranks(values, nulls)
+
+    def columnRanks(self, table, column, ids):
+        """Return sort ranks of a column's values for the given entity ids"""
+        values, nulls = self.lookup(table, column, ids)
+        return self.ranks(values, nulls)
+
+    def translationCodes(self, translationTable, foreignColumn, attr,
+            languageId, ids):
+        """Return string codes of a translated column in one language
+
+        `foreignColumn` is the translation table's column referring to the
+        entity. Returns a (codes, nulls) pair for the given entity ids.
+        """
+        mask = self.array(translationTable, 'local_language_id') == languageId
+        foreignIds = self.array(translationTable, foreignColumn)[mask]
+        codes = self.array(translationTable, attr)[mask]
+        order = numpy.argsort(foreignIds, kind='mergesort')
+        foreignIds = foreignIds[order]
+        codes = codes[order]
+        result = numpy.empty(len(ids), dtype=numpy.int32)
+        result.fill(-1)
+        if len(foreignIds):
+            positions = numpy.searchsorted(foreignIds, ids)
+            positions = numpy.minimum(positions, len(foreignIds) - 1)
+            found = foreignIds[positions] == ids
+            result[found] = codes[positions[found]]
+        return result, result < 0
+
+def main(argv=None):
+    """Command-line entry point: (re)build the snapshot"""
+    parser = argparse.ArgumentParser(
+            description='Export a columnar snapshot of the pokedex database')
+    parser.add_argument('-e', '--engine', metavar='URI',
+            help='SQLAlchemy URI of the pokedex database '
+                '(default: the pokedex library default)')
+    parser.add_argument('directory', nargs='?',
+            help="Where to put the snapshot (default: qdex's cache directory)")
+    args = parser.parse_args(argv)
+    if numpy is None:
+        sys.exit('NumPy is needed to build a snapshot')
+    writeSnapshot(connect(args.engine), args.directory)
+
+if __name__ == '__main__':
+    main()
@@ -13,12 +13,26 @@ from pokedex.db import tables
 
 from qdex.loadableclass import LoadableMetaclass
 from qdex.pokedexhelpers import default_language_param
+from qdex.snapshot import columnName, foreignKeyColumnName, tableName
+from qdex.precomputed import numpy
+
+def valueRanks(values):
+    """Turn a sequence of values (or None) into int ranks; None becomes -1
+    """
+    distinct = sorted(set(value for value in values if value is not None))
+    rankMap = dict((value, rank) for rank, value in enumerate(distinct))
+    return numpy.array([-1 if value is None else rankMap[value]
+            for value in values], dtype=numpy.int64)
 
 class SortClause(object):
     """A sort clause to be attached to a view
     """
     __metaclass__ = LoadableMetaclass
     collapsing = 0
+    # True if the order changes with the UI or game language
+    languageDependent = False
+    # False if sortKeys() doesn't need the columnar snapshot
+    needsSnapshot = True
 
     def __init__(self, column, descending=False, collapsing=None):
         self.column = column
@@ -56,6 +70,44 @@ class SortClause(object):
         """
         return self.column.orderColumns(builder)
 
+    def sortKeys(self, snapshot, model, mappedClass, ids):
+        """Return sort keys for the rows with the given ids, to sort in memory
+
+        `snapshot` is the columnar snapshot; it's None if the clause doesn't
+        need it and there is none.
+
+        Returns a list of rank arrays (nulls ranked -1), most significant
+        first. The ranks are for ascending order regardless of `descending`;
+        the model negates them for descending clauses, which puts nulls last
+        as in sort().
+        Raises NotImplementedError if the clause can't be sorted in memory.
+        """
+        raise NotImplementedError
+
+    def sortExpressions(self, builder):
+        """Return the SQL expressions sort() orders by, ascending
+
+        Joins what's needed into the builder's query.
+        """
+        return self.orderColumns(builder)
+
+    def queryKeys(self, model, ids):
+        """Return sort keys for the given row ids, fetched from the database
+
+        Used instead of the snapshot when there's none: one narrow query
+        gets the id and sort expressions of all rows, which are ranked in
+        memory. Returns keys as sortKeys does.
+        """
+        builder = model.baseBuilder()
+        expressions = self.sortExpressions(builder)
+        query = builder.query.with_entities(builder.mappedClass.id,
+                *expressions)
+        rows = dict((row[0], row[1:]) for row in query)
+        missing = (None, ) * len(expressions)
+        values = [rows.get(id, missing) for id in ids.tolist()]
+        return [valueRanks([row[i] for row in values])
+                for i in range(len(expressions))]
+
     def overrides(self, other, builder):
         """Return True if this clause overrides the other one.
         """
@@ -72,8 +124,16 @@ class SortClause(object):
 
 class SimpleSortClause(SortClause):
     """Simply sorts by the associated column's orderColumns
+
+    Without a snapshot, the sort keys are fetched with queryKeys.
     """
-    pass
+    needsSnapshot = False
+
+    def sortKeys(self, snapshot, model, mappedClass, ids):
+        if snapshot is None:
+            return self.queryKeys(model, ids)
+        column = columnName(mappedClass, self.column.attr)
+        return [snapshot.columnRanks(tableName(mappedClass), column, ids)]
 
 class DefaultPokemonSortClause(SimpleSortClause):
     """Default sort clause for PokemonForm: pokemon.order and form.id
@@ -90,8 +150,35 @@ class DefaultPokemonSortClause(SimpleSortClause):
                 tables.Pokemon)
         return [pokemon.order]
 
+    def sortKeys(self, snapshot, model, mappedClass, ids):
+        if snapshot is None:
+            return self.queryKeys(model, ids)
+        pokemonIds, nulls = snapshot.lookup(tableName(mappedClass),
+                'pokemon_id', ids)
+        return [snapshot.columnRanks(
+                tableName(tables.Pokemon), 'order', pokemonIds)]
+
+class ArraySortClause(SortClause):
+    """Sort clause for columns backed by precomputed arrays
+
+    In memory, sorts by the column's sortKeys(mappedClass, ids); in SQL,
+    by its orderColumns.
+    """
+    needsSnapshot = False
+
+    def sortKeys(self, snapshot, model, mappedClass, ids):
+        return self.column.sortKeys(mappedClass, ids)
+
+    def overrides(self, other, builder):
+        # orderColumns may be built afresh each time (e.g. subqueries), so
+        # compare the columns' arrayKey instead
+        if isinstance(other, ArraySortClause):
+            return self.column.arrayKey == other.column.arrayKey
+        return False
+
 class PokemonNameSortClause(SortClause):
     collapsing = 2
+    languageDependent = True
 
     def sort(self, builder):
         """Sort the query in the given QueryBuilder
@@ -109,7 +196,11 @@ class PokemonNameSortClause(SortClause):
 class GameStringSortClause(SortClause):
     """Translated-message sort clause for strings in the "game language"
     """
-    def sort(self, builder):
+    languageDependent = True
+    # Without a snapshot, the sort keys are fetched with queryKeys
+    needsSnapshot = False
+
+    def sortExpressions(self, builder):
         translationClass = self.column.translationClass
         onFactory = lambda translationClass: and_(
                 translationClass.foreign_id == builder.mappedClass.id,
@@ -117,15 +208,31 @@ class GameStringSortClause(SortClause):
             )
         translationClass = builder.joinOn('message', onFactory,
                 translationClass)
-        dbcolumn = getattr(translationClass, self.column.attr)
+        return [getattr(translationClass, self.column.attr)]
+
+    def sort(self, builder):
+        (dbcolumn, ) = self.sortExpressions(builder)
         if self.descending:
             builder.query = builder.query.order_by(dbcolumn.desc().nullslast())
         else:
             builder.query = builder.query.order_by(dbcolumn.asc().nullsfirst())
 
+    def sortKeys(self, snapshot, model, mappedClass, ids):
+        if snapshot is None:
+            return self.queryKeys(model, ids)
+        translationClass = self.column.translationClass
+        codes, nulls = snapshot.translationCodes(
+                tableName(translationClass),
+                columnName(translationClass, 'foreign_id'),
+                columnName(translationClass, self.column.attr),
+                model.g.session.default_language_id, ids)
+        return [codes]
+
 class LocalStringSortClause(SortClause):
     """Translated-message sort clause for strings in the "UI language(s)"
     """
+    languageDependent = True
+
     def sort(self, builder):
         column = self.column
         translationClass = column.translationClass
@@ -152,7 +259,46 @@ class LocalStringSortClause(SortClause):
         query = query.order_by(order)
         builder.query = query
 
+    def sortKeys(self, snapshot, model, mappedClass, ids):
+        column = self.column
+        translationClass = column.translationClass
+        translationTable = tableName(translationClass)
+        attrColumn = columnName(translationClass, column.attr)
+        codes = None
+        for language in column.languages:
+            languageCodes, nulls = snapshot.translationCodes(translationTable,
+                    columnName(translationClass, 'foreign_id'), attrColumn,
+                    language.id, ids)
+            if codes is None:
+                codes = languageCodes
+            else:
+                missing = codes < 0
+                codes[missing] = languageCodes[missing]
+        if column.attr == 'name' and (codes is None or (codes < 0).any()):
+            # Fall back to identifiers, which come from a different pool
+            identifiers, nulls = snapshot.lookup(tableName(mappedClass),
+                    'identifier', ids)
+            table = tableName(mappedClass)
+            strings = []
+            for i, identifier in enumerate(identifiers):
+                if codes is not None and codes[i] >= 0:
+                    strings.append(snapshot.string(translationTable,
+                            attrColumn, codes[i]))
+                elif not nulls[i]:
+                    strings.append(snapshot.string(table, 'identifier',
+                            identifier))
+                else:
+                    strings.append(None)
+            return [snapshot.stringRanks(strings)]
+        if codes is None:
+            raise NotImplementedError('No languages')
+        return [codes]
+
 class BaseForeignSortClause(SortClause):
+    @property
+    def languageDependent(self):
+        return self.foreignClause.languageDependent
+
     def other_direction(self):
         other = super(BaseForeignSortClause, self).other_direction()
         other.foreignClause = other.foreignClause.other_direction()
@@ -175,6 +321,30 @@ class ForeignKeySortClause(BaseForeignSortClause):
             )
         self.foreignClause.sort(subbuilder)
 
+    def sortKeys(self, snapshot, model, mappedClass, ids):
+        foreignIds, nulls = snapshot.lookup(tableName(mappedClass),
+                foreignKeyColumnName(mappedClass, self.column.attr), ids)
+        # Null foreign keys don't match any row, so they sort as nulls
+        foreignIds[nulls] = -1
+        return self.foreignClause.sortKeys(snapshot, model,
+                self.column.foreignColumn.mappedClass, foreignIds)
+
+class SubclassSortClause(ForeignKeySortClause):
+    """Proxy sort clause, for use with a SubclassColumn
+
+    The subclass table refers to the main one, so in-memory sorting looks
+    the subclass rows up by that foreign key.
+    """
+    def sortKeys(self, snapshot, model, mappedClass, ids):
+        foreignClass = self.column.foreignColumn.mappedClass
+        table = tableName(foreignClass)
+        column = self.column.remoteColumnName
+        if not snapshot.hasColumn(table, column):
+            raise NotImplementedError
+        foreignIds = snapshot.reverseLookup(table, column, ids)
+        return self.foreignClause.sortKeys(snapshot, model, foreignClass,
+                foreignIds)
+
 class AssociationListSortClause(BaseForeignSortClause):
     """Proxy sort clause, for use with a ForeignKeyColumn
 
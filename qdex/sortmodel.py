@@ -6,7 +6,7 @@
 A sort clause model
 """
 
-from PySide import QtCore, QtGui
+from PySide import QtCore
 Qt = QtCore.Qt
 
 from qdex.querybuilder import QueryBuilder
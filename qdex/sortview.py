@@ -12,6 +12,7 @@ Qt = QtCore.Qt
 from pkg_resources import resource_filename
 
 from qdex.columngroup import defaultColumnGroups, buildColumnMenu
+from qdex.queryplan import inspectModel, showReportDialog
 
 class SortView(QtGui.QToolBar):
     def __init__(self, *args):
@@ -45,12 +46,26 @@ class SortView(QtGui.QToolBar):
             action.setIcon(QtGui.QIcon(resource_filename('qdex', 'icons/cross.png')))
             action.triggered.connect(lambda: self.model.clear())
 
+            menu.addSeparator()
+            action = menu.addAction(_(u'Show query plan…'))
+            action.triggered.connect(self.showQueryPlan)
+
             menu.exec_(QtGui.QCursor.pos())
 
         if len(self.model):
             for i in range(0, len(self.model)):
                 self.rowsInserted(None, i, i)
 
+    def showQueryPlan(self):
+        """Inspect the query of the current sort clauses, show the report"""
+        _ = self.model.g.translator
+        QtGui.QApplication.setOverrideCursor(QtGui.QCursor(Qt.WaitCursor))
+        try:
+            report = inspectModel(self.model.queryModel)
+        finally:
+            QtGui.QApplication.restoreOverrideCursor()
+        showReportDialog(report, _(u'Query plan'), self)
+
     def rowsInserted(self, parent, start, end):
         assert start == end, (
                 'assuming the sort model only inserts rows one at a time')
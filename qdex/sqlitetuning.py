@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+SQLite tuning: connection PRAGMAs and indexes for qdex's query patterns
+
+The sort clauses of qdex's columns outer-join translation tables (by their
+foreign key and local_language_id) and association tables (by their
+foreign key and, typically, slot). The pokedex schema doesn't necessarily
+index these the way qdex uses them.
+
+tuneDatabase() gets EXPLAIN QUERY PLAN for the queries of every sortable
+column of the standard lists, creates covering indexes for the tables that
+are scanned as the inner side of a join, and reports how many full scans
+that removed. The indexes go into the pokedex database itself (SQLite
+indexes can't live in another file); they're all named qdex_*, so they can
+be told apart. Indexes don't change the data, so tuning keeps the database
+fingerprint (see pokedexhelpers.keepFingerprint): the snapshot, result
+cache, full-text and learnset indexes stay valid.
+
+applyPragmas() sets up cache-friendly PRAGMAs for every new connection.
+"""
+
+import sys
+import argparse
+import weakref
+
+from sqlalchemy import event
+from pokedex.db import connect, tables
+
+from qdex.pokedexhelpers import (default_language_param,
+        databaseFingerprint, keepFingerprint)
+
+pragmas = [
+        # Memory-map up to 256 MiB of the database file
+        ('mmap_size', 256 * 1024 * 1024),
+        # Negative sizes are in KiB: use up to 64 MiB of page cache
+        ('cache_size', -64 * 1024),
+        # Keep temporary b-trees (e.g. for ORDER BY) in memory
+        ('temp_store', 'MEMORY'),
+    ]
+
+def isSQLite(engine):
+    """Return true if the engine is connected to SQLite"""
+    return engine.url.drivername.startswith('sqlite')
+
+def _setPragmas(dbapiConnection, connectionRecord):
+    """Pool connect listener: set the PRAGMAs on a new DBAPI connection"""
+    cursor = dbapiConnection.cursor()
+    for name, value in pragmas:
+        cursor.execute('PRAGMA %s = %s' % (name, value))
+    cursor.close()
+
+_tunedEngines = weakref.WeakSet()
+
+def applyPragmas(engine):
+    """Set the qdex PRAGMAs on the engine's connections (SQLite only)"""
+    if isSQLite(engine) and engine not in _tunedEngines:
+        event.listen(engine, 'connect', _setPragmas)
+        _tunedEngines.add(engine)
+
+def compileQuery(session, query):
+    """Return the SQL of an ORM query, and a list of its positional params
+    """
+    compiled = query.statement.compile(bind=session.bind)
+    params = dict(compiled.params)
+    params.update(query._params)
+    params[default_language_param.key] = session.default_language_id
+    positional = [params[name] for name in compiled.positiontup or ()]
+    return unicode(compiled), positional
+
+def queryPlan(session, query):
+    """Return the EXPLAIN QUERY PLAN details of an ORM query, as strings"""
+    sql, params = compileQuery(session, query)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        # The detail is the last column, in all SQLite versions
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def scannedTable(detail):
+    """Return the table a query plan step fully scans, or None
+
+    Scans using an index don't count. Automatic indexes do: SQLite builds
+    them by scanning the table, for every query.
+    SQLAlchemy's anonymous aliases (table_1) are mapped to table names.
+    """
+    words = detail.split()
+    if len(words) < 2:
+        return None
+    if words[0] == 'SCAN':
+        if 'INDEX' in words:
+            return None
+    elif words[0] != 'SEARCH' or 'AUTOMATIC' not in words:
+        return None
+    if words[1] == 'TABLE':
+        name = words[2]
+    else:
+        name = words[1]
+    if name not in tables.metadata.tables:
+        base, sep, number = name.rpartition('_')
+        if number.isdigit() and base in tables.metadata.tables:
+            return base
+    return name
+
+def fullScans(plan):
+    """Return the tables fully scanned by a query plan, except the first
+
+    The first scan is of the table the query selects from; that one can't be
+    avoided for an unfiltered list.
+    """
+    scans = [table for table in map(scannedTable, plan) if table]
+    return scans[1:]
+
+def sortQueries(g):
+    """Yield (description, query) for each sortable column of each list"""
+    # Imported here; these pull in the models
+    from qdex.metamodel import modelRepresentations
+    from qdex.querymodel import TableModel
+    from qdex.columngroup import availableColumns
+    for name, representation in modelRepresentations():
+        model = TableModel.load(representation, g=g)
+        for column in availableColumns(model):
+            try:
+                clause = column.getSortClause()
+            except NotImplementedError:
+                continue
+            builder = model.baseBuilder()
+            for otherClause in (clause, model.defaultSortClause):
+                otherClause.sort(builder)
+            yield ('%s/%s' % (g.translator(name), g.translator(column.name)),
+                    builder.query)
+
+def indexCandidates(tableName):
+    """Return column lists to index for joins into the given table
+
+    Translation tables get (foreign key, local_language_id, string columns),
+    so the translated strings are read from the index. Other tables get an
+    index per foreign key column, followed by the rest of the primary key
+    (e.g. slot).
+    """
+    try:
+        table = tables.metadata.tables[tableName]
+    except KeyError:
+        return []
+    primaryKey = [column.name for column in table.primary_key.columns]
+    foreignKeys = [column.name for column in table.c if column.foreign_keys]
+    if 'local_language_id' in table.c:
+        foreign = [name for name in primaryKey if name != 'local_language_id']
+        strings = [column.name for column in table.c
+                if column.name not in primaryKey and
+                    not column.foreign_keys]
+        return [foreign + ['local_language_id'] + strings]
+    return [[name] + [other for other in primaryKey if other != name]
+            for name in foreignKeys]
+
+def createIndex(session, tableName, columns):
+    """Create an index (if it doesn't exist yet); return its name"""
+    name = 'qdex_%s_%s' % (tableName, '_'.join(columns))
+    session.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+            name, tableName, ', '.join(columns)))
+    return name
+
+def tuneDatabase(g, log=None):
+    """Create indexes for fully scanned joined tables
+
+    Returns a (scans before, scans after, created index names) tuple.
+    The database keeps its fingerprint, so qdex's caches stay valid.
+    """
+    session = g.session
+    fingerprint = databaseFingerprint(session)
+    queries = list(sortQueries(g))
+    scannedBefore = {}
+    for description, query in queries:
+        scans = fullScans(queryPlan(session, query))
+        if scans and log:
+            log('%s: scans %s\n' % (description, ', '.join(scans)))
+        for table in scans:
+            scannedBefore[table] = scannedBefore.get(table, 0) + 1
+    created = []
+    for tableName in sorted(scannedBefore):
+        for columns in indexCandidates(tableName):
+            created.append(createIndex(session, tableName, columns))
+    session.commit()
+    session.execute('ANALYZE')
+    session.commit()
+    keepFingerprint(session, fingerprint)
+    scansAfter = sum(len(fullScans(queryPlan(session, query)))
+            for description, query in queries)
+    return sum(scannedBefore.values()), scansAfter, created
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(
+            description='Index the pokedex database for qdex queries')
+    parser.add_argument('-e', '--engine', metavar='URI',
+            help='SQLAlchemy URI of the pokedex database '
+                '(default: the pokedex library default)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+            help='List the scans found')
+    args = parser.parse_args(argv)
+
+    # Imported here, so the models aren't needed just for the PRAGMAs
+    from qdex.globalstate import Global
+    session = connect(args.engine)
+    if not isSQLite(session.bind):
+        sys.exit('Only SQLite databases can be tuned')
+    g = Global(session=session, resultCache=False, snapshot=False)
+    log = sys.stderr.write if args.verbose else None
+    before, after, created = tuneDatabase(g, log)
+    for name in created:
+        print 'Index:', name
+    print 'Full scans: %s before, %s after; %s removed' % (
+            before, after, before - after)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Base stats of all Pokémon, as a Pokémon × stat matrix
+
+Loaded once (see Global.precomputed), and used for the base stat columns:
+displaying, sorting and stat percentiles all work on whole arrays, so no
+per-row queries or joins are needed.
+
+Needs NumPy.
+"""
+
+from pokedex.db import tables
+
+from qdex.precomputed import numpy, positionsIn, idArray
+
+class StatMatrix(object):
+    """Base stats of all Pokémon
+
+    `values` has a row for each Pokémon (in `pokemonIds` order, ascending)
+    and a column for each stat that isn't battle-only (in `statIdentifiers`
+    order).
+    """
+    def __init__(self, session):
+        stats = (session.query(tables.Stat)
+                .filter_by(is_battle_only=False)
+                .order_by(tables.Stat.id)
+                .all())
+        self.statIdentifiers = [stat.identifier for stat in stats]
+        statIds = numpy.array([stat.id for stat in stats])
+
+        self.pokemonIds = idArray(session.query(tables.Pokemon.id)
+                .order_by(tables.Pokemon.id))
+
+        self.values = numpy.zeros((len(self.pokemonIds), len(stats)),
+                dtype=numpy.int32)
+        query = session.query(tables.PokemonStat.pokemon_id,
+                tables.PokemonStat.stat_id, tables.PokemonStat.base_stat)
+        rows = numpy.array(query.all()).reshape(-1, 3)
+        rows = rows[numpy.in1d(rows[:, 1], statIds)]
+        self.values[positionsIn(self.pokemonIds, rows[:, 0]),
+                positionsIn(statIds, rows[:, 1])] = rows[:, 2]
+
+    def statValues(self, stat, pokemonIds):
+        """Return base stat values of the given Pokémon
+
+        `stat` is a stat identifier, 'total' for the base stat total, or a
+        list of these; for a list, the result has a column for each.
+        """
+        rows = self.values[positionsIn(self.pokemonIds, pokemonIds)]
+        if isinstance(stat, list):
+            return numpy.column_stack([self._statColumn(rows, identifier)
+                    for identifier in stat])
+        else:
+            return self._statColumn(rows, stat)
+
+    def _statColumn(self, rows, identifier):
+        """Return one stat's column (or the total) of the given rows"""
+        if identifier == 'total':
+            return rows.sum(axis=1)
+        else:
+            return rows[:, self.statIdentifiers.index(identifier)]
+
+    def percentiles(self, stat, pokemonIds, populationIds):
+        """Return percentiles of a stat of Pokémon, among a population
+
+        The percentile of a Pokémon is the percentage of the population
+        whose stat is lower or equal.
+        """
+        population = numpy.sort(self.statValues(stat, populationIds))
+        values = self.statValues(stat, pokemonIds)
+        atOrBelow = numpy.searchsorted(population, values, side='right')
+        return 100.0 * atOrBelow / max(len(population), 1)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Type efficacy engine
+
+The type chart is loaded once into a dense attacking type × defending type
+matrix of damage multipliers. Matchups and scores for all Pokémon (or all
+types) are then computed with a few array operations.
+
+Charts are per generation: only types that existed in the generation are
+used, and where the database has past efficacies, they're applied.
+
+Needs NumPy.
+"""
+
+from pokedex.db import tables
+
+from qdex.precomputed import numpy, positionsIn, idArray
+
+# Immunities count as this multiplier in scores, so they don't give -inf
+immunityFactor = 0.25
+
+def logFactors(factors):
+    """Return log2 of damage multipliers, with immunities limited"""
+    return numpy.log2(numpy.maximum(factors, immunityFactor))
+
+class TypeChart(object):
+    """Type efficacy chart for a generation (by default, the latest)
+
+    `factors[attacking, defending]` is the damage multiplier; rows and
+    columns are in `typeIds` order. Pokémon types are in `pokemonTypes`, one
+    row per Pokémon (in `pokemonIds` order) with type positions for each
+    slot, or -1 for none.
+    """
+    def __init__(self, session, generationId=None):
+        query = session.query(tables.Type).order_by(tables.Type.id)
+        if generationId is not None:
+            query = query.filter(tables.Type.generation_id <= generationId)
+        # Types that don't take part in battle (???, Shadow) don't have
+        # efficacies; leave them out
+        efficacyTypeIds = set(typeId for (typeId, ) in
+                session.query(tables.TypeEfficacy.target_type_id).distinct())
+        types = [type for type in query if type.id in efficacyTypeIds]
+        self.typeIds = numpy.array([type.id for type in types],
+                dtype=numpy.int64)
+        self.typeIdentifiers = [type.identifier for type in types]
+
+        count = len(types)
+        self.factors = numpy.ones((count, count))
+        # Types from later generations aren't in the chart; skip them
+        for damageTypeId, targetTypeId, factor in self._efficacies(session,
+                generationId):
+            damagePosition = self.typePosition(damageTypeId)
+            targetPosition = self.typePosition(targetTypeId)
+            if damagePosition >= 0 and targetPosition >= 0:
+                self.factors[damagePosition, targetPosition] = factor / 100.0
+
+        self.pokemonIds = idArray(session.query(tables.Pokemon.id)
+                .order_by(tables.Pokemon.id))
+        self.pokemonTypes = numpy.empty((len(self.pokemonIds), 2),
+                dtype=numpy.int64)
+        self.pokemonTypes.fill(-1)
+        query = session.query(tables.PokemonType.pokemon_id,
+                tables.PokemonType.type_id, tables.PokemonType.slot)
+        for pokemonId, typeId, slot in query:
+            if slot in (1, 2):
+                position = positionsIn(self.pokemonIds, [pokemonId])[0]
+                self.pokemonTypes[position, slot - 1] = self.typePosition(
+                        typeId)
+
+    def _efficacies(self, session, generationId):
+        """Yield (damage type ID, target type ID, factor) for a generation
+        """
+        efficacies = {}
+        for efficacy in session.query(tables.TypeEfficacy):
+            key = efficacy.damage_type_id, efficacy.target_type_id
+            efficacies[key] = efficacy.damage_factor
+        pastTable = getattr(tables, 'TypeEfficacyPast', None)
+        if generationId is not None and pastTable is not None:
+            # Past rows hold the last generation a factor was valid in;
+            # the earliest one that's not before our generation applies
+            query = session.query(pastTable)
+            query = query.filter(pastTable.generation_id >= generationId)
+            query = query.order_by(pastTable.generation_id.desc())
+            for efficacy in query:
+                key = efficacy.damage_type_id, efficacy.target_type_id
+                efficacies[key] = efficacy.damage_factor
+        for (damageTypeId, targetTypeId), factor in efficacies.items():
+            yield damageTypeId, targetTypeId, factor
+
+    def typePosition(self, typeId):
+        """Return the row/column of a type ID in the chart, -1 if missing"""
+        return int(self.typePositions([typeId])[0])
+
+    def typeIndex(self, identifier):
+        """Return the row/column of a type (by identifier) in the chart"""
+        return self.typeIdentifiers.index(identifier)
+
+    def typePositions(self, typeIds):
+        """Return chart positions for an array of type IDs, -1 if missing"""
+        typeIds = numpy.asarray(typeIds, dtype=numpy.int64)
+        if not len(self.typeIds):
+            return numpy.zeros(len(typeIds), dtype=numpy.int64) - 1
+        positions = numpy.minimum(positionsIn(self.typeIds, typeIds),
+                len(self.typeIds) - 1)
+        return numpy.where(self.typeIds[positions] == typeIds, positions, -1)
+
+    def defensiveFactors(self, pokemonIds):
+        """Return damage multipliers against the given Pokémon
+
+        The result has a row for each Pokémon and a column for each
+        attacking type; dual types are multiplied together.
+        """
+        slots = self.pokemonTypes[positionsIn(self.pokemonIds, pokemonIds)]
+        result = numpy.ones((len(slots), len(self.typeIds)))
+        for slot in range(slots.shape[1]):
+            present = slots[:, slot] >= 0
+            result[present] *= self.factors[:, slots[present, slot]].T
+        return result
+
+    def pokemonScores(self, direction, pokemonIds):
+        """Return type scores for the given Pokémon
+
+        The defensive score is the mean of -log2 of the multipliers of all
+        attacking types against the Pokémon. The offensive score is the mean,
+        over all defending types, of log2 of the best multiplier of the
+        Pokémon's own types (i.e. its STAB coverage).
+        """
+        if direction == 'defense':
+            return -logFactors(self.defensiveFactors(pokemonIds)).mean(
+                    axis=1)
+        slots = self.pokemonTypes[positionsIn(self.pokemonIds, pokemonIds)]
+        best = numpy.zeros((len(slots), len(self.typeIds)))
+        best.fill(-numpy.inf)
+        for slot in range(slots.shape[1]):
+            present = slots[:, slot] >= 0
+            best[present] = numpy.maximum(best[present],
+                    logFactors(self.factors[slots[present, slot]]))
+        best[numpy.isinf(best)] = 0
+        return best.mean(axis=1)
+
+    def typeScores(self, direction, typeIds):
+        """Return type scores for the given (single) types
+
+        Scores are as in pokemonScores(); types not in the chart get NaN.
+        """
+        positions = self.typePositions(typeIds)
+        if direction == 'defense':
+            allScores = -logFactors(self.factors).mean(axis=0)
+        else:
+            allScores = logFactors(self.factors).mean(axis=1)
+        return numpy.where(positions >= 0, allScores[positions], numpy.nan)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+
+"""Part of qdex: a Pokédex using PySide and veekun's pokedex library.
+
+Background preloading of the standard lists
+
+After the main window is shown, the lists from metamodel.yaml are prepared
+in a pool of worker processes, each with its own database connection.
+A worker computes a list's ordering and renders its first page into an
+in-memory result cache, and sends the cache's compact dump back.
+The GUI process merges the dumps into its persistent result cache, so
+models created later (when a list is selected) find their results there.
+"""
+
+import multiprocessing
+
+from PySide import QtCore
+Qt = QtCore.Qt
+
+from pokedex.db import connect
+
+from qdex.globalstate import Global
+from qdex.metamodel import modelRepresentations
+from qdex.querymodel import TableModel
+
+# The worker process's session and languages, set by _initWorker
+_workerSession = None
+_workerLangs = None
+
+def _initWorker(engineUrl, langs, defaultLanguageId):
+    """Set up a worker process: connect to the DB"""
+    global _workerSession, _workerLangs
+    _workerSession = connect(engineUrl)
+    _workerSession.default_language_id = defaultLanguageId
+    _workerLangs = langs
+
+def prepareList(representation):
+    """Prepare a list in a worker process; return a result cache dump"""
+    # Each list gets a fresh in-memory cache, so it's only shipped once
+    g = Global(session=_workerSession, langs=_workerLangs,
+            resultCacheFile=':memory:')
+    model = TableModel.load(representation, g=g)
+    for row in range(min(model.rowCount(), model._pagesize)):
+        for column in range(model.columnCount()):
+            model.data(model.index(row, column), Qt.DisplayRole)
+    _workerSession.expunge_all()
+    return g.resultCache.dump()
+
+class Warmup(QtCore.QObject):
+    """Prepares the standard lists in worker processes
+
+    Finished results are picked up by a timer in the GUI thread, since the
+    result cache may only be used from there.
+    """
+    def __init__(self, g, processes=None, interval=100):
+        super(Warmup, self).__init__()
+        self.g = g
+        self.processes = processes or multiprocessing.cpu_count()
+        self.interval = interval
+        self.pool = None
+        self.pending = []
+
+    @classmethod
+    def worthwhile(cls, g):
+        """Return true if preloading can help on this machine"""
+        return g.resultCache is not None and multiprocessing.cpu_count() > 1
+
+    def start(self, representations=None):
+        """Start preparing the given model representations
+
+        By default, all the lists from metamodel.yaml are prepared.
+        """
+        if representations is None:
+            representations = [representation for name, representation
+                    in modelRepresentations()]
+        session = self.g.session
+        self.pool = multiprocessing.Pool(self.processes,
+                initializer=_initWorker,
+                initargs=(str(session.bind.url), self.g.langs,
+                    session.default_language_id))
+        self.pending = [self.pool.apply_async(prepareList, (representation, ))
+                for representation in representations]
+        self.pool.close()
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.collect)
+        self.timer.start(self.interval)
+
+    def collect(self):
+        """Merge finished results into the result cache"""
+        stillPending = []
+        for result in self.pending:
+            if result.ready():
+                if result.successful():
+                    self.g.resultCache.merge(result.get())
+            else:
+                stillPending.append(result)
+        self.pending = stillPending
+        if not self.pending:
+            self.timer.stop()
+            self.pool.join()
+            self.pool = None
@@ -19,6 +19,12 @@ setup(
     entry_points = {
             'console_scripts': [
                     'qdex = qdex:main',
+                    'qdex-export = qdex.export:main',
+                    'qdex-query = qdex.cli:main',
+                    'qdex-benchmark = qdex.benchmark:main',
+                    'qdex-framebench = qdex.framebench:main',
+                    'qdex-snapshot = qdex.snapshot:main',
+                    'qdex-tune = qdex.sqlitetuning:main',
                 ],
             'babel.extractors': [
                     'forrin-yaml = qdex.yaml:extractMessages',